@@ -0,0 +1,272 @@
+"""
+Pre-baked asset pack of the image library.
+
+Building the ImgLibrary from the sources decodes every PNG of 'img/map', 'img/bio' and 'img/editor',
+slices the cells and builds a pg.mask per cell. The bake step does this once, and writes the result
+into a single versioned file (AssetSettings.PACK_FILE):
+
+    header:  magic, version, sha256 of all the source files, size of the index
+    index:   json - the image and mask rectangles, the json props of every palette (incl. the animation
+             frame tables), and the folder listings
+    atlas:   raw pixels of all the images, packed in one RGBX atlas
+    masks:   all the pre-built masks, packed in one 8-bit atlas (set bits are 1, one byte per bit)
+
+On start the pack is memory-mapped, and the library is loaded with two frombuffer() calls:
+every image is a subsurface of the pixel atlas, and every mask is cut from the mask atlas.
+When any source PNG / json changed (its hash does not match), the pack is baked again.
+
+Usage (from the 'underwater_simulator' folder, as the image paths are relative):
+    python assets.py            # bakes the pack
+    python assets.py --check    # tells if the pack is up to date
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+
+import pygame as pg
+
+from settings import AssetSettings, MapSettings, ScreenSettings, FileLocations as files
+from dbase import FileSource, ImgLibrary
+
+
+MAGIC = b"SUBPAK"
+VERSION = 1
+HEADER = struct.Struct("<6sH32sI")  # magic, version, sources hash, index size
+
+SOURCE_FOLDERS = [files.CELL_IMAGES, files.BIO_IMAGES, files.EDITOR_IMAGES]
+SOURCE_TYPES = ('.png', '.json')
+
+# Colors of the 8-bit mask atlas: index 0 - unset bits, index 1 - set bits.
+MASK_PALETTE = [(0, 0, 0), (255, 255, 255)]
+
+
+def sources_hash() -> bytes:
+    """ sha256 of every source image and json file, and of the library settings they are loaded with. """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([MapSettings.CELL_SIZE, files.CELLULAR_TYPES, files.BIOLIFE_TYPES]).encode())
+
+    for folder in SOURCE_FOLDERS:
+        for filename in sorted(os.listdir(folder)):
+            if not filename.endswith(SOURCE_TYPES):
+                continue
+            digest.update(os.path.join(folder, filename).encode())
+            with open(os.path.join(folder, filename), 'rb') as file:
+                digest.update(file.read())
+
+    return digest.digest()
+
+
+def pack_rows(sizes: dict, width: int):
+    """ Places the rectangles in rows (shelves), the tallest first.
+        Returns ({key: [x, y, w, h]}, (atlas_width, atlas_height)).
+    """
+    width = max([width] + [w for w, h in sizes.values()])  # Note: wider images get their own row.
+    rects = {}
+    x = y = row_height = 0
+    for key, (w, h) in sorted(sizes.items(), key=lambda item: (-item[1][1], item[0])):
+        if x + w > width:
+            x, y = 0, y + row_height
+            row_height = 0
+        rects[key] = [x, y, w, h]
+        x += w
+        row_height = max(row_height, h)
+
+    return rects, (width, max(1, y + row_height))
+
+
+class AssetBaker(FileSource):
+    """ Reads the files from the disk, like FileSource, and keeps everything the library read for the pack. """
+
+    def __init__(self):
+        self.json = {}
+        self.dirs = {}
+        self.images = {}
+        self.masks = {}
+
+    def read_json(self, filename):
+        data = super().read_json(filename)
+        self.json[filename] = data
+        return json.loads(json.dumps(data))  # Note: a copy. The library may change its props.
+
+    def list_dir(self, path):
+        filenames = super().list_dir(path)
+        self.dirs[path] = filenames
+        return filenames
+
+    def load_image(self, filename):
+        image = super().load_image(filename)
+        self.images[filename] = image.copy()  # Note: copied before the caller sets its colorkey.
+        return image
+
+    def get_mask(self, key, build_mask):
+        mask = build_mask()
+        self.masks[key] = mask
+        return mask
+
+    def write(self, filename, source_hash: bytes):
+        image_rects, atlas_size = pack_rows({key: image.get_size() for key, image in self.images.items()},
+                                            AssetSettings.ATLAS_WIDTH)
+        mask_rects, mask_atlas_size = pack_rows({key: mask.get_size() for key, mask in self.masks.items()},
+                                                AssetSettings.ATLAS_WIDTH)
+
+        atlas = pg.Surface(atlas_size)
+        for key, image in self.images.items():
+            atlas.blit(image, image_rects[key][:2])
+
+        mask_atlas = pg.Surface(mask_atlas_size, depth=8)
+        mask_atlas.set_palette(MASK_PALETTE)
+        mask_atlas.fill(MASK_PALETTE[0])
+        for key, mask in self.masks.items():
+            mask.to_surface(mask_atlas, setcolor=MASK_PALETTE[1], unsetcolor=None, dest=mask_rects[key][:2])
+
+        atlas_bytes = pg.image.tobytes(atlas, "RGBX")
+        mask_bytes = pg.image.tobytes(mask_atlas, "P")
+
+        index = {
+            "atlas": {"size": list(atlas_size), "length": len(atlas_bytes)},
+            "mask-atlas": {"size": list(mask_atlas_size), "length": len(mask_bytes)},
+            "images": image_rects,
+            "masks": mask_rects,
+            "json": self.json,
+            "dirs": self.dirs,
+        }
+        index_bytes = json.dumps(index).encode()
+
+        # Note: written to a temporary file first, so a running engine never maps a half-written pack.
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        temp_filename = f"{filename}.tmp"
+        with open(temp_filename, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, source_hash, len(index_bytes)))
+            file.write(index_bytes)
+            file.write(atlas_bytes)
+            file.write(mask_bytes)
+        os.replace(temp_filename, filename)
+
+        return f"Asset pack saved in '{filename}': {len(self.images)} images, {len(self.masks)} masks, " \
+               f"{os.path.getsize(filename) / 1024:.0f} KB."
+
+
+class AssetPack(FileSource):
+    """ Serves the library files from a baked pack. Create it with AssetPack.open(). """
+
+    def __init__(self, index: dict, atlas: pg.Surface, mask_atlas: pg.mask.Mask):
+        self.index = index
+        self.atlas = atlas
+        self.mask_atlas = mask_atlas
+
+    @classmethod
+    def open(cls, filename=AssetSettings.PACK_FILE):
+        """ Returns (AssetPack, None), or (None, reason) when the pack is missing or outdated. """
+        if not os.path.isfile(filename):
+            return None, f"No asset pack in '{filename}'."
+
+        with open(filename, 'rb') as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as pack_map:
+                if len(pack_map) < HEADER.size:
+                    return None, "The asset pack is damaged."
+                magic, version, source_hash, index_size = HEADER.unpack_from(pack_map, 0)
+                if magic != MAGIC or version != VERSION:
+                    return None, "The asset pack is from another version."
+                if source_hash != sources_hash():
+                    return None, "The asset pack is outdated: source images changed."
+
+                offset = HEADER.size
+                index = json.loads(pack_map[offset:offset + index_size])
+                offset += index_size
+
+                atlas_info = index["atlas"]
+                mask_info = index["mask-atlas"]
+                if len(pack_map) < offset + atlas_info["length"] + mask_info["length"]:
+                    return None, "The asset pack is damaged."
+
+                # The surfaces are created on the mapped memory (no copy). convert() makes the one copy,
+                # in the display format, so the file can be closed after.
+                view = memoryview(pack_map)
+                try:
+                    raw_atlas = pg.image.frombuffer(view[offset:offset + atlas_info["length"]],
+                                                    atlas_info["size"], "RGBX")
+                    atlas = raw_atlas.convert()
+                    offset += atlas_info["length"]
+
+                    raw_masks = pg.image.frombuffer(view[offset:offset + mask_info["length"]],
+                                                    mask_info["size"], "P")
+                    raw_masks.set_palette(MASK_PALETTE)
+                    raw_masks.set_colorkey(MASK_PALETTE[0])  # the unset bits
+                    mask_atlas = pg.mask.from_surface(raw_masks)
+                    del raw_atlas, raw_masks
+                finally:
+                    view.release()
+
+        return cls(index, atlas, mask_atlas), None
+
+    def read_json(self, filename):
+        return self.index["json"][filename]
+
+    def list_dir(self, path):
+        return self.index["dirs"][path]
+
+    def is_file(self, filename):
+        return filename in self.index["images"]
+
+    def load_image(self, filename):
+        return self.atlas.subsurface(self.index["images"][filename])
+
+    def get_mask(self, key, build_mask):
+        rect = self.index["masks"].get(key)
+        if rect is None:
+            return build_mask()
+        x, y, w, h = rect
+        mask = pg.Mask((w, h))
+        mask.draw(self.mask_atlas, (-x, -y))
+        return mask
+
+
+def bake(filename=AssetSettings.PACK_FILE) -> ImgLibrary:
+    """ Builds the library from the source files, and writes it into the pack. Returns the library. """
+    source_hash = sources_hash()
+    baker = AssetBaker()
+    library = ImgLibrary(source=baker)
+
+    try:
+        print(baker.write(filename, source_hash))
+    except OSError as e:
+        print(f"Saving the asset pack FAILED: {e}")
+    return library
+
+
+def load_image_library(filename=AssetSettings.PACK_FILE, auto_bake=AssetSettings.AUTO_BAKE) -> ImgLibrary:
+    """ The image library from the pack. Baked first when missing or outdated (if auto_bake). """
+    pack, reason = AssetPack.open(filename)
+    if pack is not None:
+        return ImgLibrary(source=pack)
+
+    print(reason)
+    if auto_bake:
+        return bake(filename)
+    return ImgLibrary()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bake the image library into a single memory-mapped pack.")
+    parser.add_argument("--output", default=AssetSettings.PACK_FILE, help="pack file")
+    parser.add_argument("--check", action="store_true", help="only tell if the pack is up to date")
+    args = parser.parse_args()
+
+    # The images are converted for the display, so a (dummy) display is needed:
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    pg.init()
+    pg.display.set_mode(ScreenSettings.MONITOR_DEFAULT)
+
+    if args.check:
+        pack, reason = AssetPack.open(args.output)
+        print(f"The asset pack '{args.output}' is up to date." if pack is not None else reason)
+    else:
+        start = time.perf_counter()
+        bake(args.output)
+        print(f"Baked in {time.perf_counter() - start:.2f} sec.")
+
+    pg.quit()
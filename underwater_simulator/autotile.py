@@ -0,0 +1,148 @@
+"""
+Autotiling of the rock edges, by the 8 neighbours of every cell.
+
+The edge, cliff and corner tiles of 'map-rock' were picked one by one in the MapEditor. Here the tile of a rock cell
+is found by its neighbourhood: the water (not rock) cells of its 8 neighbours are bits of a mask (see NEIGHBOURS),
+and a table of 256 entries gives the (unit_id, cell_id) of every mask. The masks of a whole region are calculated
+at once: the 8 shifted copies of the rock array, weighted by their bit (a 3 x 3 convolution).
+
+The table is built from RULES: the tiles of a palette, by their unit description (in the palette json file), with
+the neighbours that must be water and the ones that must be rock. The most specific matching rule wins, so the
+inner corners (cells of the 'Groove' units) win over the flat sides, where the diagonal neighbour matters.
+
+Only the cells holding one of the rule tiles are re-tiled. The other units of the palette (nodes, crosses...)
+are kept as placed, and count as rock for their neighbours.
+    AutoTiler.tile:    tiles of a whole rock array (the world generator, see worldgen.py)
+    AutoTiler.retile:  re-tiles a region of the map grid and its border (the MapEditor, after an edit)
+"""
+import json
+import os
+
+import numpy as np
+
+from settings import FileLocations as files
+
+
+# Neighbour bits: (row offset, col offset) -> bit
+NEIGHBOURS = {"N": (-1, 0, 1), "NE": (-1, 1, 2), "E": (0, 1, 4), "SE": (1, 1, 8),
+              "S": (1, 0, 16), "SW": (1, -1, 32), "W": (0, -1, 64), "NW": (-1, -1, 128)}
+
+# {palette: [(unit description, cell_id, water neighbours, rock neighbours), ...]}
+RULES = {
+    "map-rock": [
+        ("Middle Rock", 0, "", "N E S W"),
+        ("Top Flat Surface", 0, "N", "E S W"),
+        ("Right Flat Surface", 0, "E", "N S W"),
+        ("Bottom Flat Surface", 0, "S", "N E W"),
+        ("Left Flat Surface", 0, "W", "N E S"),
+        ("Top-Left Clif", 0, "N W", "E S"),
+        ("Top-Right Clif", 0, "N E", "S W"),
+        ("Bottom-Right Cliff", 0, "E S", "N W"),
+        ("Bottom-Left Clif", 0, "S W", "N E"),
+        ("Left-Right Flat Surface", 0, "E W", "N S"),
+        ("Top-Bottom Flat Surface", 0, "N S", "E W"),
+        ("Left End Tile", 0, "N S W", "E"),
+        ("Top End Tile", 0, "N E W", "S"),
+        ("Right End Tile", 0, "N E S", "W"),
+        ("Bottom End Tile", 0, "E S W", "N"),
+        ("Single Rock Tile", 0, "N E S W", ""),
+        # Inner corners. The water cell of a 'Groove' is on the side of its name.
+        ("Top-Left Groove", 3, "NW", "N E S W"),
+        ("Top-Left Groove", 1, "W", "N E S SW"),
+        ("Top-Left Groove", 2, "N", "E S W NE"),
+        ("Top-Right Groove", 2, "NE", "N E S W"),
+        ("Top-Right Groove", 0, "E", "N S W SE"),
+        ("Top-Right Groove", 3, "N", "E S W NW"),
+        ("Bottom-Right Groove", 0, "SE", "N E S W"),
+        ("Bottom-Right Groove", 1, "S", "N E W SW"),
+        ("Bottom-Right Groove", 2, "E", "N S W NE"),
+        ("Bottom-Left Groove", 1, "SW", "N E S W"),
+        ("Bottom-Left Groove", 0, "S", "N E W SE"),
+        ("Bottom-Left Groove", 3, "W", "N E S NW"),
+    ],
+}
+
+
+def read_units(key_feature) -> dict:
+    """ {description: unit_id} of a cellular palette. The unit ids start from 1 (0 is the clear cell). """
+    with open(os.path.join(files.CELL_IMAGES, f"{key_feature}.json"), 'r') as file:
+        return {unit_data["description"]: unit_id for unit_id, unit_data in enumerate(json.load(file), start=1)}
+
+
+def neighbour_masks(rock: np.ndarray) -> np.ndarray:
+    """ The mask of the water neighbours of every cell (see NEIGHBOURS). Out of the array is rock. """
+    water = np.pad(~rock, 1, constant_values=False).view(np.uint8)
+    rows, cols = rock.shape
+    masks = np.zeros(rock.shape, dtype=np.uint8)
+    for delta_row, delta_col, bit in NEIGHBOURS.values():
+        masks |= water[1 + delta_row:1 + delta_row + rows, 1 + delta_col:1 + delta_col + cols] * np.uint8(bit)
+    return masks
+
+
+class AutoTiler:
+
+    def __init__(self, palette="map-rock"):
+        self.palette = palette
+        units = read_units(palette)
+
+        rules = []
+        for description, cell_id, water, rock in RULES[palette]:
+            if description not in units:
+                raise ValueError(f"'{palette}' unit '{description}' not found")
+            water_bits = sum(NEIGHBOURS[side][2] for side in water.split())
+            rock_bits = sum(NEIGHBOURS[side][2] for side in rock.split())
+            rules.append((bin(water_bits | rock_bits).count("1"), water_bits, rock_bits, units[description], cell_id))
+
+        # 1. Lookup table: neighbour mask -> (unit_id, cell_id) of the most specific matching rule.
+        self.units = np.zeros(256, dtype=np.uint16)
+        self.cells = np.zeros(256, dtype=np.uint16)
+        for mask in range(256):
+            matching = [rule for rule in rules if mask & rule[1] == rule[1] and not mask & rule[2]]
+            if matching:
+                _, _, _, self.units[mask], self.cells[mask] = max(matching, key=lambda rule: rule[0])
+
+        # 2. The cells re-tiled by retile(): [unit_id, cell_id] -> True
+        self.tiles = np.zeros((max(units.values()) + 1, max(rule[4] for rule in rules) + 1), dtype=bool)
+        for rule in rules:
+            self.tiles[rule[3], rule[4]] = True
+
+    def tile(self, rock: np.ndarray) -> tuple:
+        """ The (unit, cell) arrays of the rock cells of the array. 0 for the other cells. """
+        masks = neighbour_masks(rock)
+        return np.where(rock, self.units[masks], 0), np.where(rock, self.cells[masks], 0)
+
+    def retile(self, grid, col_start=0, row_start=0, col_end=None, row_end=None) -> tuple:
+        """ Re-tiles the cells of the grid in the range (end indexes included) and their 8 neighbours.
+            Returns the re-tiled range (col_start, row_start, col_end, row_end), clipped to the map.
+            Note: Works on the array regions, so the paged grids are re-tiled the same way (see paging.py).
+        """
+        col_end = grid.cells_x - 1 if col_end is None else col_end
+        row_end = grid.cells_y - 1 if row_end is None else row_end
+        palette_index = grid.palette_index[self.palette]
+
+        # 1. The range and its border, and one more cell around them (their neighbours):
+        rows = slice(max(0, row_start - 1), min(grid.cells_y, row_end + 2))
+        cols = slice(max(0, col_start - 1), min(grid.cells_x, col_end + 2))
+        read_rows = slice(max(0, rows.start - 1), min(grid.cells_y, rows.stop + 1))
+        read_cols = slice(max(0, cols.start - 1), min(grid.cells_x, cols.stop + 1))
+
+        rock = grid.palette[read_rows, read_cols] == palette_index
+        inner = (slice(rows.start - read_rows.start, rows.stop - read_rows.start),
+                 slice(cols.start - read_cols.start, cols.stop - read_cols.start))
+        masks = neighbour_masks(rock)[inner]
+        rock = rock[inner]
+
+        # 2. New tiles, only on the rule tiles:
+        unit, cell = grid.unit[rows, cols], grid.cell[rows, cols]
+        tiled = rock & (unit < self.tiles.shape[0]) & (cell < self.tiles.shape[1])
+        tiled[tiled] = self.tiles[unit[tiled], cell[tiled]]
+        unit = np.where(tiled, self.units[masks], unit)
+        cell = np.where(tiled, self.cells[masks], cell)
+
+        grid.unit[rows, cols] = unit
+        grid.cell[rows, cols] = cell
+        if grid.cell_types is not None:
+            grid.gid[rows, cols] = np.where(rock, grid.cell_types.gid_table[palette_index, unit, cell],
+                                            grid.gid[rows, cols])
+
+        return cols.start, rows.start, cols.stop - 1, rows.stop - 1
@@ -0,0 +1,476 @@
+"""
+Benchmarks of the simulator hot paths, on the real code and the real map / biolife data.
+
+Every benchmark runs against one headless Engine (see Engine(headless=True)) and reports
+ops/sec, ms/op and the peak RSS of the process after it ran.
+Note: peak RSS is the high-water mark of the whole process (resource.getrusage), so it only grows
+from one benchmark to the next. Run a single benchmark (--only) for its own memory peak.
+
+The results are written to JSON. A stored baseline (--save-baseline) is compared with every next run,
+so regressions show as numbers (ms/op change in %). The baseline of the reference build is tracked in
+BenchmarkSettings.BASELINE_FILE, the results of the runs are not.
+
+Usage (from the 'underwater_simulator' folder, as the image paths are relative):
+    python benchmark.py --save-baseline      # on the reference build
+    python benchmark.py                      # after the change: writes results, prints the comparison
+    python benchmark.py --only map.draw physics.apply
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+
+from main import Engine
+from dbase import ImgLibrary
+from assets import bake, load_image_library
+from map import MapEditor
+from grid import MapGrid
+from mapfile import save_grid, load_grid, MapFileReader
+from paging import PagedMapGrid
+from biosphere import LifeUnit
+from worldgen import generate_world
+from autotile import AutoTiler
+from settings import BenchmarkSettings, WorldGenSettings
+
+
+def peak_rss_mb():
+    # Note: ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@contextlib.contextmanager
+def quiet():
+    """ Hides the print() output of the measured code (loaders and constructors print a lot). """
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+# --- BENCHMARKS ---
+# Every benchmark gets the engine and the scale factor, and returns (operations, run_function).
+# Only run_function is measured, so the preparation of the data is not part of the result.
+
+def bench_map_load(engine, scale):
+    ops = max(1, int(5 * scale))
+
+    def run():
+        for _ in range(ops):
+            engine.map.load_from_file(MapEditor.FILE_TO_SAVE)
+
+    return ops, run
+
+
+def bench_map_load_json(engine, scale):
+    """ The same map, from the json file (the format before the binary map). """
+    ops = max(1, int(5 * scale))
+
+    def run():
+        for _ in range(ops):
+            engine.map.load_from_file(MapEditor.JSON_FILE)
+
+    return ops, run
+
+
+def bench_map_save(engine, scale):
+    ops = max(1, int(5 * scale))
+    filename = os.path.join(tempfile.gettempdir(), "benchmark-map.map")
+
+    def run():
+        for _ in range(ops):
+            engine.map.save_to_file(filename)
+
+    return ops, run
+
+
+def large_map(engine) -> MapGrid:
+    """ A map 10x larger: the current map, repeated on 10x the cells. """
+    grid = engine.map.grid
+    large_grid = MapGrid(grid.cells_x * 2, grid.cells_y * 5, engine.map.cell_types)
+    for array, large_array in ((grid.palette, large_grid.palette), (grid.unit, large_grid.unit),
+                               (grid.cell, large_grid.cell)):
+        large_array[:] = np.tile(array, (5, 2))
+    large_grid.update_gid()
+    return large_grid
+
+
+def bench_map_large(engine, scale):
+    """ Save and load of a map 10x larger (the current map, repeated on 10x the cells). """
+    ops = max(1, int(5 * scale))
+    filename = os.path.join(tempfile.gettempdir(), "benchmark-map-large.map")
+    large_grid = large_map(engine)
+
+    def run():
+        for _ in range(ops):
+            save_grid(large_grid, filename)
+            load_grid(filename, engine.map.cell_types)
+
+    return ops, run
+
+
+def bench_image_library(engine, scale):
+    ops = max(1, int(3 * scale))
+
+    def run():
+        with quiet():
+            for _ in range(ops):
+                ImgLibrary()
+
+    return ops, run
+
+
+def bench_image_library_pack(engine, scale):
+    """ Same library, loaded from the asset pack (baked first, so only the memory-mapped load is measured). """
+    ops = max(1, int(3 * scale))
+    with quiet():
+        bake()
+
+    def run():
+        with quiet():
+            for _ in range(ops):
+                load_image_library(auto_bake=False)
+
+    return ops, run
+
+
+def bench_map_draw(engine, scale):
+    """ Scripted scroll sweep: left to right, on several rows of the map. """
+    map_width = int(engine.map.width - engine.width)
+    map_height = int(engine.map.height - engine.height)
+    step = BenchmarkSettings.SCROLL_STEP
+
+    positions = []
+    for row in range(BenchmarkSettings.SWEEP_ROWS):
+        scroll_y = map_height * row // max(1, BenchmarkSettings.SWEEP_ROWS - 1)
+        positions.extend((scroll_x, scroll_y) for scroll_x in range(0, map_width, step))
+
+    positions = positions[:max(1, int(len(positions) * scale))]
+
+    def run():
+        for engine.scroll_x, engine.scroll_y in positions:
+            engine.map.draw()
+
+    return len(positions), run
+
+
+def bench_map_draw_steady(engine, scale):
+    """ Map.draw on a view with rocks, already drawn once (its map chunks are baked). """
+    ops = max(1, int(2000 * scale))
+    grid = engine.map.grid
+    rows, cols = grid.palette.nonzero()
+    engine.scroll_x = max(0, min(int(cols.mean()) * engine.map.cell_size - engine.width // 2,
+                                 engine.map.width - engine.width))
+    engine.scroll_y = max(0, min(int(rows.mean()) * engine.map.cell_size - engine.height // 2,
+                                 engine.map.height - engine.height))
+    engine.map.draw()
+
+    def run():
+        for _ in range(ops):
+            engine.map.draw()
+
+    return ops, run
+
+
+def bench_map_paged(engine, scale):
+    """ Map.update and Map.draw on the 10x map, paged from the file (see paging.py): the sub crosses the map
+        diagonally, and the view follows it. The pages are loaded ahead of the sub, under the memory cap.
+    """
+    filename = os.path.join(tempfile.gettempdir(), "benchmark-map-large.map")
+    save_grid(large_map(engine), filename)
+
+    game_map, sub = engine.map, engine.sub
+    grid = game_map.grid
+    paged_grid = PagedMapGrid(MapFileReader(filename), game_map.cell_types)
+    game_map.set_grid(paged_grid)
+
+    speed = BenchmarkSettings.SCROLL_STEP
+    ops = max(1, int(min(game_map.width, game_map.height) // speed * scale))
+    positions = [(engine.width // 2 + i * speed * game_map.width / game_map.height, engine.height // 2 + i * speed)
+                 for i in range(ops + 1)]
+
+    def run():
+        for prev_pos, (sub.pos_x, sub.pos_y) in zip(positions, positions[1:]):
+            sub.prev_pos = prev_pos
+            engine.scroll_x = max(0, min(sub.pos_x - engine.width // 2, game_map.width - engine.width))
+            engine.scroll_y = max(0, min(sub.pos_y - engine.height // 2, game_map.height - engine.height))
+            game_map.update()
+            game_map.draw()
+        game_map.set_grid(grid)
+
+    return ops, run
+
+
+def bench_worldgen(engine, scale):
+    """ A whole world of WorldGenSettings size (3000 x 3500 cells), generated from the seed (see worldgen.py). """
+    ops = max(1, int(scale))
+
+    def run():
+        for _ in range(ops):
+            generate_world(WorldGenSettings.CELLS_X, WorldGenSettings.CELLS_Y, seed=BenchmarkSettings.SEED)
+
+    return ops, run
+
+
+def bench_autotile(engine, scale):
+    """ AutoTiler.retile of a whole generated world of WorldGenSettings size (see autotile.py). """
+    ops = max(1, int(3 * scale))
+    grid, _ = generate_world(WorldGenSettings.CELLS_X, WorldGenSettings.CELLS_Y, seed=BenchmarkSettings.SEED)
+    grid.cell_types = engine.map.cell_types
+    autotiler = AutoTiler()
+
+    def run():
+        for _ in range(ops):
+            autotiler.retile(grid)
+
+    return ops, run
+
+
+def bench_cell_property(engine, scale):
+    """ Map.get_cell_property lookups (image, mask, props, description), on a window around the map rocks. """
+    grid = engine.map.grid
+    rows, cols = grid.palette.nonzero()
+    center_col, center_row = int(cols.mean()), int(rows.mean())
+    coords = [(col, row) for row in range(center_row - 20, center_row + 20) for col in range(center_col - 20, center_col + 20)]
+    names = ["image", "mask", "props", "description"]
+    repeats = max(1, int(25 * scale))
+    get_cell_property = engine.map.get_cell_property
+
+    def run():
+        for _ in range(repeats):
+            for name in names:
+                for map_coords in coords:
+                    get_cell_property(map_coords, name)
+
+    return repeats * len(names) * len(coords), run
+
+
+def wall_path(engine):
+    """ Positions in the free water, next to a non-passable cell, so the sub scratches the walls.
+        Note: Only positions below the floating check (see Physics.is_underwater), so they are all underwater.
+    """
+    game_map = engine.map
+    cell_size = game_map.cell_size
+    min_pos_y = engine.air.floating_check_start_from
+    path = []
+
+    for row in range(1, game_map.cells_y - 1):
+        for col in range(1, game_map.cells_x - 1):
+            props = game_map.get_cell_property((col, row), "props")
+            if props is None or props["passable"]:
+                continue
+            for delta_col, delta_row in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+                if game_map.grid.palette[row + delta_row, col + delta_col] == 0:
+                    # center of the free cell, pushed a quarter cell toward the wall:
+                    pos_x = (col + delta_col) * cell_size + cell_size // 2 - delta_col * cell_size // 4
+                    pos_y = (row + delta_row) * cell_size + cell_size // 2 - delta_row * cell_size // 4
+                    if pos_y >= min_pos_y:
+                        path.append((pos_x, pos_y))
+    return path
+
+
+def bench_physics_apply(engine, scale):
+    ops = max(1, int(BenchmarkSettings.PHYSICS_CALLS * scale))
+    sub = engine.sub
+    path = wall_path(engine)
+    if not path:
+        raise RuntimeError(f"No wall found on the map. Is '{MapEditor.FILE_TO_SAVE}' loaded?")
+
+    stats = sub.physics.stats
+
+    def run():
+        visited, mask_tests = stats["cells-visited"], stats["mask-tests"]
+        for i in range(ops):
+            pos_x, pos_y = path[i % len(path)]
+            sub.pos_x, sub.pos_y = pos_x, pos_y
+            sub.physics.apply(next_pos=(pos_x + 2, pos_y + 1), next_heading=(i * 7) % 360)
+        print(f"    per apply: {(stats['cells-visited'] - visited) / ops:.1f} cells visited, "
+              f"{(stats['mask-tests'] - mask_tests) / ops:.1f} mask tests")
+
+    return ops, run
+
+
+def bench_cspace_build(engine, scale):
+    """ ConfigurationSpace.build of the map, with no disk cache: the footprints and all the layers (see cspace.py). """
+    ops = max(1, int(scale))
+
+    def run():
+        for _ in range(ops):
+            engine.map.cspace.build(engine.sub, cache=False)
+
+    return ops, run
+
+
+def bench_cspace_collides(engine, scale):
+    """ ConfigurationSpace.collides on the poses next to the walls, on all the headings. """
+    ops = max(1, int(BenchmarkSettings.PHYSICS_CALLS * 10 * scale))
+    cspace = engine.map.cspace
+    cspace.build(engine.sub)
+    path = wall_path(engine)
+    if not path:
+        raise RuntimeError(f"No wall found on the map. Is '{MapEditor.FILE_TO_SAVE}' loaded?")
+
+    def run():
+        for i in range(ops):
+            pos_x, pos_y = path[i % len(path)]
+            cspace.collides(pos_x, pos_y, (i * 7) % 360)
+
+    return ops, run
+
+
+def bench_biolife_draw(engine, scale):
+    """ BioLife.draw with thousands of units, spread in a grid around the view. """
+    units_count = max(1, int(BenchmarkSettings.LIFE_UNITS * scale))
+    image_units = [unit for library in engine.image_library.biolife_images.values() for unit in library]
+    cell_size = engine.map.cell_size
+    units_per_row = engine.map.cells_x // 4
+
+    life_list = []
+    with quiet():
+        for i in range(units_count):
+            left = (i % units_per_row) * 4 * cell_size
+            top = (i // units_per_row) * 4 * cell_size
+            life_list.append(LifeUnit(i, image_units[i % len(image_units)], left, top))
+
+    ops = max(1, int(100 * scale))
+
+    def run():
+        original_list = engine.biolife.life_list
+        engine.biolife.life_list = life_list
+        engine.biolife.index.rebuild(life_list)
+        engine.scroll_x, engine.scroll_y = 0, 0
+        for _ in range(ops):
+            engine.biolife.draw()
+        engine.biolife.life_list = original_list
+        engine.biolife.index.rebuild(original_list)
+
+    return ops, run
+
+
+def bench_gauger_draw(engine, scale):
+    ops = max(1, int(1000 * scale))
+    engine.gauger.update()
+
+    def run():
+        for _ in range(ops):
+            engine.gauger.draw()
+
+    return ops, run
+
+
+BENCHMARKS = {
+    "map.load_from_file": bench_map_load,
+    "map.load_json": bench_map_load_json,
+    "map.save_to_file": bench_map_save,
+    "map.save_load_10x": bench_map_large,
+    "image_library": bench_image_library,
+    "image_library.pack": bench_image_library_pack,
+    "map.draw": bench_map_draw,
+    "map.draw.steady": bench_map_draw_steady,
+    "map.draw.paged": bench_map_paged,
+    "worldgen": bench_worldgen,
+    "autotile": bench_autotile,
+    "map.get_cell_property": bench_cell_property,
+    "physics.apply": bench_physics_apply,
+    "cspace.build": bench_cspace_build,
+    "cspace.collides": bench_cspace_collides,
+    "biolife.draw": bench_biolife_draw,
+    "gauger.draw": bench_gauger_draw,
+}
+
+
+class BenchmarkSuite:
+
+    def __init__(self, names=None, scale=1.0):
+        self.names = names if names else list(BENCHMARKS.keys())
+        self.scale = scale
+        self.results = {}
+
+        with quiet():
+            self.engine = Engine(headless=True, seed=BenchmarkSettings.SEED)
+
+    def run(self):
+        for name in self.names:
+            ops, run_function = BENCHMARKS[name](self.engine, self.scale)
+
+            start_time = time.perf_counter()
+            run_function()
+            total_time = time.perf_counter() - start_time
+
+            self.results[name] = {
+                "ops": ops,
+                "total-sec": total_time,
+                "ops-per-sec": ops / total_time if total_time > 0 else 0,
+                "ms-per-op": total_time * 1000 / ops,
+                "peak-rss-mb": peak_rss_mb(),
+            }
+            print(self.format_result(name, self.results[name]))
+
+        return self.results
+
+    @staticmethod
+    def format_result(name, result):
+        return (f"{name:<20} {result['ops']:>7} ops | {result['ops-per-sec']:>10.1f} ops/sec | "
+                f"{result['ms-per-op']:>9.3f} ms/op | peak RSS: {result['peak-rss-mb']:.1f} MB")
+
+    def save(self, filename):
+        try:
+            with open(filename, 'w') as file:
+                json.dump(self.results, file, indent=2)
+            return f"Benchmark results saved in '{filename}'."
+        except Exception as e:
+            return f"Saving benchmark results FAILED: {e}"
+
+    def compare(self, baseline_file):
+        """ Returns the report lines, comparing the ms/op of every benchmark with the baseline. """
+        try:
+            with open(baseline_file, 'r') as file:
+                baseline = json.load(file)
+        except FileNotFoundError:
+            return [f"No baseline in '{baseline_file}'. Store one with --save-baseline."]
+
+        threshold = BenchmarkSettings.REGRESSION_THRESHOLD
+        lines = [f"{'benchmark':<20} {'baseline':>12} {'current':>12} {'change':>9}"]
+        for name, result in self.results.items():
+            if name not in baseline:
+                lines.append(f"{name:<20} {'-':>12} {result['ms-per-op']:>9.3f} ms {'new':>9}")
+                continue
+
+            base_ms = baseline[name]["ms-per-op"]
+            change = (result["ms-per-op"] - base_ms) / base_ms * 100 if base_ms > 0 else 0
+            if change > threshold:
+                verdict = "SLOWER"
+            elif change < -threshold:
+                verdict = "faster"
+            else:
+                verdict = ""
+            lines.append(f"{name:<20} {base_ms:>9.3f} ms {result['ms-per-op']:>9.3f} ms {change:>+8.1f}% {verdict}")
+
+        return lines
+
+    def close(self):
+        self.engine.is_running = False
+        self.engine.quit()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the simulator hot paths.")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS.keys()), help="benchmarks to run")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier of the operations per benchmark")
+    parser.add_argument("--output", default=BenchmarkSettings.RESULTS_FILE, help="results JSON file")
+    parser.add_argument("--baseline", default=BenchmarkSettings.BASELINE_FILE, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args()
+
+    suite = BenchmarkSuite(args.only, args.scale)
+    suite.run()
+    suite.close()
+
+    print(suite.save(args.output))
+    if args.save_baseline:
+        print(suite.save(args.baseline))
+    else:
+        print("\n".join(suite.compare(args.baseline)))
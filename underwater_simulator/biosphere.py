@@ -9,6 +9,7 @@ from settings import MapSettings, FileLocations as files, ColorPalette as clr
 from tools import Tools as tools
 
 from dbase import BioImageUnit
+from lifeindex import LifeIndex
 
 """
     Everything that is independent from map cells and is free to move,
@@ -88,7 +89,7 @@ class Water:
         self.props = props
         # {"color":(0, 0, 0), "resistance": 3, "temp":8}
 
-        self.last_random_update = pg.time.get_ticks()
+        self.last_random_update = self.engine.sim_time
         self.update_interval = 1000
 
         # IMAGE:
@@ -143,7 +144,7 @@ class Water:
     #     return self.props["temp"], self.pos_y
 
     def random_update_props(self):
-        now_is = pg.time.get_ticks()
+        now_is = self.engine.sim_time
         if now_is - self.last_random_update > self.update_interval:
             temp = self.props["temp"]
             min_t = self.props["min-temp"]
@@ -220,7 +221,8 @@ class LifeUnit:
         self.frame_id = 0
 
         # The animation is in self.animation.speed
-        self.last_frame_change = pg.time.get_ticks()
+        # Note: measured in simulation time (see Engine.sim_time), which starts from 0.
+        self.last_frame_change = 0
 
         print(f"Created new Life Unit: location=({self.top}, {self.left}), size=({self.width, self.height})")
 
@@ -259,8 +261,12 @@ class BioLife:
         self.engine = engine
 
         self.life_list:List[LifeUnit] = []  # <-- a list of life units. See the class above.
+        self.changes = 0  # incremented on every load, add and delete of the life units (see MiniMap)
         self.animation_speed = 100
 
+        # The life units by their place on the map, for the rect queries (see lifeindex.py)
+        self.index = LifeIndex()
+
     # -> Used to check for collision, and extract unit properties
     def get_unit_info(self, unit_id):
         """ Return reference to LifeUnit from id.
@@ -280,25 +286,35 @@ class BioLife:
                 loaded_file_data = json.load(file)
                 # Note: loaded_file_data is a list of dictionaries
 
-                if self.life_list:
-                    self.life_list.clear()
+            return self.load_from_data(loaded_file_data)
+
+        except FileNotFoundError:
+            return "Biolife File does not exists. No biolife loaded."
+        except Exception as e:
+            return f"Loading BioLife data file FAILED: {e}"
+
+    def load_from_data(self, loaded_file_data):
+        """ Creates the life units from already loaded biolife data (list of unit addresses, see LifeUnit.address). """
+        try:
+            if self.life_list:
+                self.life_list.clear()
 
-                for i, data_line in enumerate(loaded_file_data):
-                    ref_id = data_line['ref-id']
-                    library = data_line['library']
-                    left = data_line['left']
-                    top = data_line['top']
+            for i, data_line in enumerate(loaded_file_data):
+                ref_id = data_line['ref-id']
+                library = data_line['library']
+                left = data_line['left']
+                top = data_line['top']
 
-                    image_unit = self.engine.image_library.biolife_images[library][ref_id]
-                    life_unit = LifeUnit(i, image_unit, left, top)
-                    self.life_list.append(life_unit)
+                image_unit = self.engine.image_library.biolife_images[library][ref_id]
+                life_unit = LifeUnit(i, image_unit, left, top)
+                self.life_list.append(life_unit)
 
+            self.index.rebuild(self.life_list)
+            self.changes += 1
             return f"BioLife loaded successfully, with {len(loaded_file_data)} life-forms."
 
-        except FileNotFoundError:
-            return "Biolife File does not exists. No biolife loaded."
         except Exception as e:
-            return f"Loading BioLife data file FAILED: {e}"
+            return f"Loading BioLife data FAILED: {e}"
 
     def save_to_file(self, filename):
         if self.life_list:
@@ -317,22 +333,17 @@ class BioLife:
 
     def map_correct(self):
         # saving the corrected map structure. Used only to repair the map:
-        # for row in range(self.engine.map.cells_y):
-        #     for col in range(self.engine.map.cells_x):
-        #         self.engine.map.map_structure[row][col].append([])
-        for row in range(self.engine.map.cells_y):
-            for col in range(self.engine.map.cells_x):
-                self.engine.map.map_structure[row][col][3] = []
+        self.engine.map.grid.clear_population()
 
         # for i, life_unit in enumerate(self.life_list):
         #     map_coverage = life_unit.map_coverage
         #     for row in range(map_coverage[1], map_coverage[3] + 1):
         #         for col in range(map_coverage[0], map_coverage[2] + 1):
-        #             if i not in self.engine.map.map_structure[row][col][3]:
-        #                 self.engine.map.map_structure[row][col][3].append(i)
+        #             self.engine.map.grid.add_life(col, row, i)
 
+        grid = self.engine.map.grid
         print(f"Map corrected:")
-        print(f"first={self.engine.map.map_structure[0][0]} | last={self.engine.map.map_structure[-1][-1]}")
+        print(f"first={grid.get_entry(0, 0)} | last={grid.get_entry(grid.cells_x - 1, grid.cells_y - 1)}")
 
     def add_life_unit(self, ref_id, library_name, mouse):
         # 1. Get the placement coordinates:
@@ -358,12 +369,13 @@ class BioLife:
         life_unit = LifeUnit(life_unit_id, image_unit, left_position, top_position)
         if life_unit is not None:
             self.life_list.append(life_unit)
+            self.index.insert(life_unit)
+            self.changes += 1
             result = ["Added new life unit on the map",f"Total life_list size = {len(self.life_list)}"]
         else:
             return [f"Adding life unit with ref-id={ref_id} FAILED."]
 
-        # 6. On every covered map-cell from map.map_structure (syntax: [(None, 0, 0, []), ...]
-        #    append to the 4th element (list) the index of the newly created life unit.
+        # 6. On every covered map-cell, add the index of the newly created life unit to the map grid population.
         #    Used for the vision, to faster determine if in some cell, there is life unit located.
 
 
@@ -373,8 +385,12 @@ class BioLife:
 
         for row in range(map_coverage[1], map_coverage[3]):
             for col in range(map_coverage[0], map_coverage[2]):
-                if life_unit_id not in self.engine.map.map_structure[row][col][3]:
-                    self.engine.map.map_structure[row][col][3].append(life_unit_id)
+                self.engine.map.grid.add_life(col, row, life_unit_id)
+
+        # Note: The journal gets the populated cells as they were written (see journal.apply_record)
+        self.engine.journal.record({"op": "add-life", "address": life_unit.address,
+                                    "rows": [map_coverage[1], map_coverage[3]],
+                                    "cols": [map_coverage[0], map_coverage[2]]})
 
         # # -get number of cells and rows covered:
         # covered_cells = life_unit.width // map_cell_size
@@ -383,7 +399,7 @@ class BioLife:
         # # - for all covered map-cell indexes add the id of the new life unit:
         # for row in range(topleft_row_index, covered_rows+1):
         #     for col in range(topleft_cell_index, covered_cells+1):
-        #         self.engine.map.map_structure[row][col][3].append(life_unit_id)
+        #         self.engine.map.grid.add_life(col, row, life_unit_id)
 
         return result
 
@@ -396,10 +412,10 @@ class BioLife:
         mouse_x = mouse[0] + self.engine.scroll_x
         mouse_y = mouse[1] + self.engine.scroll_y
         # Returns a unit id based of the coordinates of the map, FIRST FOUND
-        for i, unit in enumerate(self.life_list):
+        for unit in self.index.query_point((mouse_x, mouse_y)):
             if unit.left < mouse_x < unit.left+unit.width:
                 if unit.top < mouse_y < unit.top+unit.height:
-                    return i
+                    return unit.id
         return None
 
     def delete_life_unit(self, mouse):
@@ -409,12 +425,23 @@ class BioLife:
         if element_id is not None and element_id < len(self.life_list):
 
             map_coverage = self.life_list[element_id].map_coverage
-            for row in range(map_coverage[1], map_coverage[3]+1):
-                for col in range(map_coverage[0], map_coverage[2]+1):
-                    if element_id in self.engine.map.map_structure[row][col][3]:
-                        self.engine.map.map_structure[row][col][3].remove(element_id)
+            # Note: The same cells as populated by add_life_unit()
+            for row in range(map_coverage[1], map_coverage[3]):
+                for col in range(map_coverage[0], map_coverage[2]):
+                    self.engine.map.grid.remove_life(col, row, element_id)
 
+            self.index.remove(self.life_list[element_id])
             del self.life_list[element_id]
+
+            # The next units are one place back in the life list: their ids and the cell population follow them.
+            for life_unit in self.life_list[element_id:]:
+                life_unit.id -= 1
+            self.engine.map.grid.shift_life_ids(element_id)
+
+            self.changes += 1
+            self.engine.journal.record({"op": "delete-life", "id": element_id,
+                                        "rows": [map_coverage[1], map_coverage[3]],
+                                        "cols": [map_coverage[0], map_coverage[2]]})
             result = [f"A life unit, listed under index={element_id} deleted.", f"total _life_list size = {len(self.life_list)}"]
             return result
         return None
@@ -425,22 +452,24 @@ class BioLife:
         """
         id_list = []
         coord_x, coord_y = map_coordinates
-        for i, unit in enumerate(self.life_list):
+        for unit in self.index.query_point(map_coordinates):
             if unit.left < coord_x < unit.left+unit.width:
                 if unit.top < coord_y < unit.top+unit.height:
-                    id_list.append(i)
+                    id_list.append(unit.id)
 
         return id_list
 
     def update(self):
         # animates all biolife images, changing its frame-id
-        now = pg.time.get_ticks()
+        now = self.engine.sim_time
         for unit in self.life_list:
             unit.update(now)
 
     def draw(self):
         # Drawing only the life units, with top and left inside the current screen...
-        for unit in self.life_list:
+        # Note: The units on the screen are found from the index (see lifeindex.py)
+        screen_rect = (self.engine.scroll_x, self.engine.scroll_y, self.engine.width, self.engine.height)
+        for unit in self.index.query(screen_rect):
             # if (self.engine.scroll_x-unit["width"]) <= unit["left"] < self.engine.scroll_x+self.engine.width:
             #     # TODO: same for top...
             #     # NOTE: use the lifeUnit draw method for visualization. Here only select the visible units.
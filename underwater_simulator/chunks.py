@@ -0,0 +1,117 @@
+"""
+Pre-composited map chunks.
+
+Map.draw blitted every visible cell (~900 at 1280 x 720), one by one. Here the map is split into chunks of
+MapSettings.CHUNK_CELLS x CHUNK_CELLS cells. A chunk is baked into one surface (all its cells blitted once)
+the first time it comes into view, and the map is drawn with one blit per visible chunk (~12 at 1280 x 720).
+
+The baked chunks are kept in an LRU (MapSettings.CHUNK_CACHE_SIZE chunks). A chunk is baked again only when
+its cells change: the MapEditor invalidates the chunks it writes on (see MapEditor.write_on_map).
+
+Most of the map is clear water. All the chunks with clear cells only share one surface (not in the LRU).
+Note: The cells are transparent where they are WHITE (colorkey). A chunk keeps the same colorkey, so the water
+under the map is still seen through.
+"""
+import math
+from collections import OrderedDict
+
+import pygame as pg
+
+from settings import MapSettings, ColorPalette as clr
+
+
+class MapChunks:
+
+    def __init__(self, game_map, chunk_cells=MapSettings.CHUNK_CELLS, capacity=MapSettings.CHUNK_CACHE_SIZE):
+        self.map = game_map
+
+        self.chunk_cells = chunk_cells
+        self.chunk_size = chunk_cells * game_map.cell_size  # px
+        self.capacity = capacity
+
+        self.chunks = OrderedDict()  # {(chunk_col, chunk_row): pg.Surface}. The last used is at the end.
+        self.clear_chunk = None  # shared surface of the chunks with clear cells only
+
+        # Statistics: chunks baked since the start (incl. the re-baked after an edit)
+        self.baked = 0
+
+    def get_chunk(self, chunk_col, chunk_row) -> pg.Surface:
+        key = (chunk_col, chunk_row)
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            self.chunks.move_to_end(key)
+            return chunk
+
+        chunk = self.bake(chunk_col, chunk_row)
+        self.chunks[key] = chunk
+        if len(self.chunks) > self.capacity:
+            self.chunks.popitem(last=False)
+        return chunk
+
+    def bake(self, chunk_col, chunk_row) -> pg.Surface:
+        """ Blits all the cells of the chunk on a new surface. """
+        grid = self.map.grid
+        col_start = chunk_col * self.chunk_cells
+        row_start = chunk_row * self.chunk_cells
+        gid_rows = grid.gid[row_start:row_start + self.chunk_cells, col_start:col_start + self.chunk_cells]
+
+        if not gid_rows.any():
+            if self.clear_chunk is None:
+                self.clear_chunk = self.create_surface(self.chunk_size, self.chunk_size)
+                clear_image = self.map.cell_tables["image"][0]
+                for row in range(self.chunk_cells):
+                    for col in range(self.chunk_cells):
+                        self.clear_chunk.blit(clear_image, (col * self.map.cell_size, row * self.map.cell_size))
+                self.baked += 1
+            return self.clear_chunk
+
+        cell_images = self.map.cell_tables["image"]
+        cell_size = self.map.cell_size
+        rows, cols = gid_rows.shape
+        chunk = self.create_surface(cols * cell_size, rows * cell_size)
+        for row, gid_row in enumerate(gid_rows.tolist()):
+            for col, gid in enumerate(gid_row):
+                cell_img = cell_images[gid]
+                if cell_img is not None:
+                    chunk.blit(cell_img, (col * cell_size, row * cell_size))
+
+        self.baked += 1
+        return chunk
+
+    @staticmethod
+    def create_surface(width, height) -> pg.Surface:
+        surface = pg.Surface((width, height)).convert()
+        surface.fill(clr.WHITE)
+        surface.set_colorkey(clr.WHITE, pg.RLEACCEL)
+        return surface
+
+    def invalidate(self, col_start, row_start, col_end, row_end):
+        """ Drops the chunks with any of the cells in the range (end indexes included). """
+        for chunk_row in range(row_start // self.chunk_cells, row_end // self.chunk_cells + 1):
+            for chunk_col in range(col_start // self.chunk_cells, col_end // self.chunk_cells + 1):
+                self.chunks.pop((chunk_col, chunk_row), None)
+
+    def clear(self):
+        """ Drops all the chunks. Called when a new map is loaded. """
+        self.chunks.clear()
+
+    def draw(self, display, scroll_x, scroll_y):
+        """ Blits the chunks in the display clip area. """
+        clip = display.get_clip()
+        grid = self.map.grid
+        size = self.chunk_size
+
+        start_chunk_row = max(0, int((scroll_y + clip.top) // size))
+        start_chunk_col = max(0, int((scroll_x + clip.left) // size))
+        end_chunk_row = min(int((scroll_y + clip.bottom) // size), (grid.cells_y - 1) // self.chunk_cells)
+        end_chunk_col = min(int((scroll_x + clip.right) // size), (grid.cells_x - 1) // self.chunk_cells)
+
+        for chunk_row in range(start_chunk_row, end_chunk_row + 1):
+            for chunk_col in range(start_chunk_col, end_chunk_col + 1):
+                chunk = self.get_chunk(chunk_col, chunk_row)
+                # Note: The shared clear chunk is full size. Only its part inside the map is drawn on the map edges.
+                area = (0, 0, min(size, grid.cells_x * self.map.cell_size - chunk_col * size),
+                        min(size, grid.cells_y * self.map.cell_size - chunk_row * size))
+                # Note: floor - the same whole pixel a single cell gets (blit truncates, and the chunk starts off-screen)
+                display.blit(chunk, (math.floor(chunk_col * size - scroll_x), math.floor(chunk_row * size - scroll_y)),
+                             area)
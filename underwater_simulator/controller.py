@@ -7,12 +7,25 @@ from tools import Tools
 from settings import JoystickSettings as js, ColorPalette as clr
 
 
-import cv2, glob
-import mediapipe as mp
-import numpy as np
+import glob
 
 import threading
 
+# The vision stack (OpenCV, MediaPipe, numpy) takes seconds to import on the Edge2.
+# It is imported on the first HandWatch only (see load_vision_stack()), not when this module loads.
+cv2 = None
+mp = None
+np = None
+
+
+def load_vision_stack():
+    global cv2, mp, np
+    if cv2 is None:
+        import cv2 as cv2_module
+        import mediapipe as mp_module
+        import numpy as np_module
+        cv2, mp, np = cv2_module, mp_module, np_module
+
 
 class HandWatch:
     DEVICE_ID = 51
@@ -21,15 +34,14 @@ class HandWatch:
     FRAME_WIDTH = 640
     FRAME_HEIGHT = 360
 
-    HAND_DETECTOR = mp.solutions.hands
-    DRAW_UTILS = mp.solutions.drawing_utils
-
     def __init__(self, engine):
         self.engine = engine
         self.capture = None
 
-        # self.draw_utils = mp.solutions.drawing_utils
+        self.hand_detector = None
+        self.draw_utils = None
         self.hands = None
+        self.capture_thread = None
 
         self.pg_srf = None
 
@@ -48,12 +60,16 @@ class HandWatch:
 
     def _initiate(self):
         try:
+            load_vision_stack()
+            self.hand_detector = mp.solutions.hands
+            self.draw_utils = mp.solutions.drawing_utils
+
             cap = cv2.VideoCapture(self.DEVICE_ID)
             cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.FRAME_WIDTH)
             cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.FRAME_HEIGHT)
             # cap.set(cv2.CAP_PROP_FPS, 30)
 
-            hands = self.HAND_DETECTOR.Hands(static_image_mode=False, min_detection_confidence=0.7, max_num_hands=1)
+            hands = self.hand_detector.Hands(static_image_mode=False, min_detection_confidence=0.7, max_num_hands=1)
 
             if cap is not None and hands is not None:
                 self.capture = cap
@@ -86,7 +102,7 @@ class HandWatch:
                     result = self.hands.process(frame_rgb)
                     if result.multi_hand_landmarks is not None:
                         for hand in result.multi_hand_landmarks:
-                            self.DRAW_UTILS.draw_landmarks(clear_screen, hand, self.HAND_DETECTOR.HAND_CONNECTIONS)
+                            self.draw_utils.draw_landmarks(clear_screen, hand, self.hand_detector.HAND_CONNECTIONS)
 
                     # frame_surface = pg.surfarray.make_surface(frame_rgb).convert()
                     frame_surface = pg.surfarray.make_surface(clear_screen).convert()
@@ -114,11 +130,13 @@ class HandWatch:
             display.blit(self.pg_srf, srf_rect)
 
     def terminate(self):
-        if self.capture_thread.is_alive():
+        # Note: If the initialisation failed, there is no thread and no capture.
+        if self.capture_thread is not None and self.capture_thread.is_alive():
             self.capture_thread.join()
 
-        self.capture.release()
-        cv2.destroyAllWindows()
+        if self.capture is not None:
+            self.capture.release()
+            cv2.destroyAllWindows()
         print("OpenCV and MediaPipe terminated successfully.")
 
 
@@ -128,6 +146,7 @@ class JoyStick:
     def __init__(self):
 
         self.joystick = None
+        self.success = False
 
         if pg.joystick.get_count() > 0:
             self.joystick = pg.joystick.Joystick(0)
@@ -289,6 +308,50 @@ class JoyStick:
             return output_value
 
 
+class ScriptedController:
+    """ Drives the sub from a control script, instead of the joystick. Used by the headless farm (see 'farm.py').
+        Duck-types JoyStick: the engine and the sub use it the same way.
+        script: list of [tick, thrust_force, spray_force, ballast_fill], sorted by tick.
+            Every step is applied from its tick, until the next step.
+    """
+    def __init__(self, engine, script: list):
+        self.engine = engine
+        self.script = sorted(script, key=lambda step: step[0])
+        self._step_index = -1
+
+        self.success = True  # Like a connected joystick
+        self.valid_events = []  # No pygame events are decoded.
+
+        self._thrust_force = 0
+        self._spray_force = 0
+        self._ballast_fill = 50
+
+        self.autoscroll_on = True
+        self.scroll_direction = (0, 0)
+
+    def event_decode(self, event):
+        ...
+
+    def get_joystick_data(self):
+        # -move to the last step, started until the current tick:
+        tick = self.engine.sim_tick
+        while self._step_index + 1 < len(self.script) and self.script[self._step_index + 1][0] <= tick:
+            self._step_index += 1
+            _, self._thrust_force, self._spray_force, self._ballast_fill = self.script[self._step_index]
+
+        engine_mode = "engine-on" if self._thrust_force != 0 else "engine-off"
+
+        if self._spray_force > 0:
+            spray_mode = "top-spray"
+        elif self._spray_force < 0:
+            spray_mode = "btm-spray"
+        else:
+            spray_mode = "no-spray"
+
+        return engine_mode, spray_mode, self._thrust_force, self._spray_force, self._ballast_fill
+
+
+
 # class Mouse:
 #     def __init__(self, endine):
 #         # self.pos = (0, 0)
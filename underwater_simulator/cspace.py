@@ -0,0 +1,284 @@
+"""
+Configuration space of the sub: the poses (x, y, heading) where its contour may hit the non-passable map cells.
+
+Physics.apply tests one pose with a mask overlap per cell. The autopilot experiments test thousands of candidate
+poses per tick, so here the test is done once for all of them: the non-passable cell masks of the map (the
+obstacles) are dilated by the sub contour rotated to every heading (a Minkowski sum). A layer per heading keeps
+one bit per pose, and collides(x, y, heading) is a single bit lookup.
+
+    - The layers are coarse: a bit per CSpaceSettings.PIXELS x PIXELS pixels of the sub center. A bit is set when
+      the contour hits an obstacle from any center in its square, so a clear bit is a pose with no hit.
+    - The headings are quantised to CSpaceSettings.HEADING_STEP degrees. The footprint of a layer is the union of
+      all the quantised rotated masks of Physics (SubSettings.MASK_HEADING_STEP) in its step. Physics tests the
+      exact heading, whose contour may stick out of them by a pixel.
+    - An obstacle is a cell with 'passable' 0. The life units are not in the layers. Off the map, there are no
+      obstacles, but a center off the map collides (as Physics.check_off_map).
+
+The layers are dilated in parallel (a thread per core), bit-packed, and cached on disk, keyed by the hash of the
+obstacles and of the footprints. Only the last used CSpaceSettings.CACHE_FILES files are kept. After an edit, only
+the poses around the written cells are calculated again (see Map.cells_changed). A paged map (see paging.py) has no
+configuration space.
+
+Usage:
+    engine.map.cspace.build(engine.sub)
+    engine.map.cspace.collides(x, y, heading)       # True, False, or None before the build
+"""
+import hashlib
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pygame as pg
+
+from settings import CSpaceSettings
+from physics import RotatedMaskCache
+from dbase import Cell
+
+
+def prune_cache(folder, keep=CSpaceSettings.CACHE_FILES):
+    """ Deletes the cached layers, except the 'keep' last used ones. Every edited map state has its own file. """
+    files = [os.path.join(folder, name) for name in os.listdir(folder) if name.endswith(".npy")]
+    files.sort(key=os.path.getmtime, reverse=True)
+    for filename in files[keep:]:
+        os.remove(filename)
+
+
+def mask_array(mask: pg.mask.Mask) -> np.ndarray:
+    """ The bits of the mask, as a bool array [row, col]. """
+    # Note: surfarray is indexed [x, y]
+    return pg.surfarray.array_red(mask.to_surface()).T > 0
+
+
+def footprint(mask: pg.mask.Mask, pixels: int, margin: int) -> np.ndarray:
+    """ The coarse cells (bool array of 2 * margin + 1 cells, the center cell in the middle), which the mask may
+        cover, when its center is anywhere in the center cell. The mask is placed as in Physics.apply:
+        top-left = center - size // 2.
+    """
+    bits = mask_array(mask)
+    height, width = bits.shape
+
+    # 1. All the centers in the cell: the bits, dilated to the right and down.
+    # Note: By pixels, not pixels - 1. A fractional position is truncated in the mask overlap, up to a pixel further.
+    lines = np.zeros((height + pixels, width), dtype=bool)
+    for offset in range(pixels + 1):
+        lines[offset:offset + height] |= bits
+    covered = np.zeros((height + pixels, width + pixels), dtype=bool)
+    for offset in range(pixels + 1):
+        covered[:, offset:offset + width] |= lines
+
+    # 2. Aligned to the coarse cells: the top-left pixel is at -size // 2 from the center cell.
+    pad_top, pad_left = (-(height // 2)) % pixels, (-(width // 2)) % pixels
+    rows = -(-(pad_top + covered.shape[0]) // pixels)
+    cols = -(-(pad_left + covered.shape[1]) // pixels)
+    aligned = np.zeros((rows * pixels, cols * pixels), dtype=bool)
+    aligned[pad_top:pad_top + covered.shape[0], pad_left:pad_left + covered.shape[1]] = covered
+    cells = aligned.reshape(rows, pixels, cols, pixels).any(axis=(1, 3))
+
+    result = np.zeros((2 * margin + 1, 2 * margin + 1), dtype=bool)
+    top = margin - (pad_top + height // 2) // pixels
+    left = margin - (pad_left + width // 2) // pixels
+    result[top:top + rows, left:left + cols] = cells
+    return result
+
+
+def row_runs(kernel: np.ndarray, margin: int) -> list:
+    """ The runs of set cells on every row of the footprint: [(delta_row, first delta_col, last delta_col)] """
+    runs = []
+    for row, line in enumerate(kernel):
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], line.view(np.uint8), [0]))))
+        for first, stop in zip(edges[::2].tolist(), edges[1::2].tolist()):
+            runs.append((row - margin, first - margin, stop - 1 - margin))
+    return runs
+
+
+def dilate(window: np.ndarray, runs: list, margin: int) -> np.ndarray:
+    """ The poses of the window, whose footprint (as runs) covers an obstacle.
+        The window has the obstacles of the poses and margin cells around them.
+    """
+    rows, cols = window.shape[0] - 2 * margin, window.shape[1] - 2 * margin
+
+    # Note: tables[k][row, col] is the OR of the 2^k cells from col, so a run is the OR of two entries.
+    longest = max((last - first + 1 for _, first, last in runs), default=1)
+    tables = [window]
+    while 2 ** len(tables) <= longest:
+        span = 2 ** (len(tables) - 1)
+        tables.append(tables[-1][:, :-span] | tables[-1][:, span:])
+
+    result = np.zeros((rows, cols), dtype=bool)
+    for delta_row, first, last in runs:
+        level = (last - first + 1).bit_length() - 1
+        table = tables[level]
+        top = margin + delta_row
+        result |= table[top:top + rows, margin + first:margin + first + cols]
+        start = margin + last - 2 ** level + 1
+        result |= table[top:top + rows, start:start + cols]
+    return result
+
+
+class ConfigurationSpace:
+
+    def __init__(self, game_map):
+        self.map = game_map
+        self.pixels = CSpaceSettings.PIXELS
+        self.cell_pixels = game_map.cell_size // self.pixels  # coarse cells per map cell side
+        self.step = CSpaceSettings.HEADING_STEP
+        self.headings = max(1, round(360 / self.step))
+
+        self.block_table = None  # [gid] -> (cell_pixels, cell_pixels) bool: the obstacle blocks of the cell
+
+        self.margin = 0  # coarse cells around the pose, covered by the footprints
+        self.runs = []  # [heading index] -> footprint row runs (see row_runs)
+        self.obstacles = None  # (rows + 2 * margin, cols + 2 * margin) bool. The coarse obstacles, with the margin.
+        self.layers = None  # (headings, rows, ceil(cols / 8)) uint8: the bit-packed layers. None until built.
+
+        # Statistics of the last build
+        self.build_time = 0
+        self.from_cache = False
+
+    # --- BUILD ---
+
+    def blocks(self) -> np.ndarray:
+        """ The obstacle blocks of every library cell: its coarse cells, covered by its mask, when not passable. """
+        if self.block_table is None:
+            cell_masks = self.map.cell_tables["mask"]
+            cell_props = self.map.cell_tables["props"]
+            size = self.pixels
+            block_mask = pg.mask.Mask((size, size), fill=True)
+            self.block_table = np.zeros((len(cell_masks), self.cell_pixels, self.cell_pixels), dtype=bool)
+            mask_kinds = self.map.cell_tables["mask-kind"]
+            for gid, cell_mask in enumerate(cell_masks):
+                if gid == 0 or mask_kinds[gid] == Cell.MASK_EMPTY or cell_props[gid].get("passable", 0):
+                    continue
+                if mask_kinds[gid] == Cell.MASK_SOLID:
+                    self.block_table[gid] = True
+                    continue
+                for row in range(self.cell_pixels):
+                    for col in range(self.cell_pixels):
+                        self.block_table[gid, row, col] = cell_mask.overlap_area(block_mask,
+                                                                                 (col * size, row * size)) > 0
+        return self.block_table
+
+    def obstacle_cells(self, rows: slice, cols: slice) -> np.ndarray:
+        """ The coarse obstacles of the map cells in the range. """
+        blocks = self.blocks()[self.map.grid.gid[rows, cols]]
+        cells_y, cells_x, size = blocks.shape[0], blocks.shape[1], self.cell_pixels
+        return blocks.transpose(0, 2, 1, 3).reshape(cells_y * size, cells_x * size)
+
+    def footprints(self, unit) -> list:
+        """ The footprint of every layer: the union of the rotated contour masks of the physics, in its step. """
+        physics_masks = unit.physics.rotated_masks
+        masks = RotatedMaskCache(unit.contour_image_original, step=physics_masks.step,
+                                 capacity=physics_masks.headings)
+        width, height = unit.contour_image_original.get_size()
+        self.margin = math.ceil(math.hypot(width, height) / 2 / self.pixels) + 2
+
+        physics_footprints = [footprint(masks.get(index * masks.step)[0], self.pixels, self.margin)
+                              for index in range(masks.headings)]
+        kernels = []
+        for index in range(self.headings):
+            kernel = np.zeros((2 * self.margin + 1, 2 * self.margin + 1), dtype=bool)
+            first = round((index - 0.5) * self.step / masks.step)
+            last = round((index + 0.5) * self.step / masks.step)
+            for physics_index in range(first, last + 1):
+                kernel |= physics_footprints[physics_index % masks.headings]
+            kernels.append(kernel)
+        return kernels
+
+    def cache_file(self, kernels: list) -> str:
+        digest = hashlib.sha256()
+        digest.update(np.array(self.obstacles.shape + (self.pixels, self.headings)).tobytes())
+        digest.update(np.packbits(self.obstacles).tobytes())
+        for kernel in kernels:
+            digest.update(np.packbits(kernel).tobytes())
+        return os.path.join(CSpaceSettings.CACHE_DIR, f"{digest.hexdigest()[:24]}.npy")
+
+    def build(self, unit, cache=True) -> bool:
+        """ Calculates the layers for the unit (the sub), or loads them from the disk cache (when cache).
+            False for a paged map (no configuration space).
+        """
+        self.clear()
+        grid = self.map.grid
+        if grid.paged:
+            return False
+        start = time.perf_counter()
+
+        kernels = self.footprints(unit)
+        self.runs = [row_runs(kernel, self.margin) for kernel in kernels]
+        self.obstacles = np.pad(self.obstacle_cells(slice(0, grid.cells_y), slice(0, grid.cells_x)), self.margin)
+
+        filename = self.cache_file(kernels)
+        self.from_cache = cache and os.path.isfile(filename)
+        if self.from_cache:
+            self.layers = np.load(filename)
+            os.utime(filename)  # used now: kept by prune_cache()
+        else:
+            self.layers = self.dilate_layers()
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            temp_filename = f"{filename}.tmp"
+            with open(temp_filename, 'wb') as file:
+                np.save(file, self.layers)
+            os.replace(temp_filename, filename)
+            prune_cache(os.path.dirname(filename))
+
+        self.build_time = time.perf_counter() - start
+        return True
+
+    def dilate_layers(self) -> np.ndarray:
+        """ All the layers, bit-packed. """
+        def dilate_layer(runs):
+            return np.packbits(dilate(self.obstacles, runs, self.margin), axis=1)
+
+        # Note: NumPy releases the GIL on the whole-array operations, so the threads run on all the cores.
+        workers = min(CSpaceSettings.WORKERS or os.cpu_count(), self.headings)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return np.stack(list(executor.map(dilate_layer, self.runs)))
+
+    def clear(self):
+        """ Drops the layers. Called when a new map is loaded. """
+        self.obstacles = None
+        self.layers = None
+
+    def update(self, col_start, row_start, col_end, row_end):
+        """ Calculates again the poses around the cells in the range (end indexes included), after they were written.
+            Note: The disk cache is not written. The next build is keyed by the edited map.
+        """
+        if self.layers is None:
+            return
+        grid = self.map.grid
+        col_start, row_start = max(0, col_start), max(0, row_start)
+        col_end, row_end = min(col_end, grid.cells_x - 1), min(row_end, grid.cells_y - 1)
+        if col_end < col_start or row_end < row_start:
+            return
+
+        # 1. The obstacles of the written cells:
+        size, margin = self.cell_pixels, self.margin
+        self.obstacles[margin + row_start * size:margin + (row_end + 1) * size,
+                       margin + col_start * size:margin + (col_end + 1) * size] = \
+            self.obstacle_cells(slice(row_start, row_end + 1), slice(col_start, col_end + 1))
+
+        # 2. The poses, whose footprint reaches them (the columns aligned to whole bytes of the layers):
+        rows, cols = self.obstacles.shape[0] - 2 * margin, self.obstacles.shape[1] - 2 * margin
+        top, bottom = max(0, row_start * size - margin), min(rows, (row_end + 1) * size + margin)
+        left = max(0, col_start * size - margin) // 8 * 8
+        right = min(cols, -(-((col_end + 1) * size + margin) // 8) * 8)
+        window = self.obstacles[top:bottom + 2 * margin, left:right + 2 * margin]
+        for index, runs in enumerate(self.runs):
+            self.layers[index, top:bottom, left // 8:-(-right // 8)] = np.packbits(dilate(window, runs, margin), axis=1)
+
+    # --- QUERY ---
+
+    def collides(self, pos_x, pos_y, heading):
+        """ True when the contour may hit an obstacle on the pose (map pixels, degrees), False when it does not.
+            None before the build.
+        """
+        if self.layers is None:
+            return None
+        if not (0 <= pos_x <= self.map.width and 0 <= pos_y <= self.map.height):
+            return True
+        # Note: The map edge (pos == map width / height) is on the map, as in Physics.check_off_map
+        col = min(int(pos_x // self.pixels), self.obstacles.shape[1] - 2 * self.margin - 1)
+        row = min(int(pos_y // self.pixels), self.layers.shape[1] - 1)
+        index = round(heading / self.step) % self.headings
+        return bool(self.layers[index, row, col >> 3] >> (7 - (col & 7)) & 1)
@@ -9,9 +9,37 @@ from settings import MapSettings, FileLocations as files, ColorPalette as clr
 from typing import List
 
 
+class FileSource:
+    """ Reads the library files from the disk: the images, their json props and the folder listings.
+        The ImgLibrary loads everything through a source, so the same code can load from the pre-baked
+        asset pack instead (see assets.py).
+    """
+
+    def read_json(self, filename):
+        with open(filename, 'r') as file:
+            return json.loads(file.read())
+
+    def list_dir(self, path):
+        return os.listdir(path)
+
+    def is_file(self, filename):
+        return os.path.isfile(filename)
+
+    def load_image(self, filename):
+        """ The image converted to the display format, without colorkey. """
+        return pg.image.load(filename).convert()
+
+    def get_mask(self, key, build_mask):
+        """ key: unique name of the mask in the library ('<filename>#<cell_index>').
+            build_mask: function creating the mask, when it is not stored already.
+        """
+        return build_mask()
+
+
 class Animation:
-    def __init__(self, sheet_src:str, frame_width:int, frame_height: int, frames_count:int, animation_speed:int=0, background_color:tuple=(255, 255, 255)):
-        self._sprite_sheet = pg.image.load(sheet_src).convert()
+    def __init__(self, sheet_src:str, frame_width:int, frame_height: int, frames_count:int, animation_speed:int=0, background_color:tuple=(255, 255, 255), source:FileSource=None):
+        source = source if source is not None else FileSource()
+        self._sprite_sheet = source.load_image(sheet_src)
         self._sprite_sheet.set_colorkey(background_color)
 
         self.background_color = background_color
@@ -47,7 +75,10 @@ class Cell:
     """ Keeps all properties of a cell,
         loaded from the image library json file...
     """
-    def __init__(self, cell_size:int, base_unit_image:pg.image, cell_image:pg.image, unit_description:str, cell_props:dict, mask_color=None, clear_cell=False):
+    # Kinds of the cell masks. An empty mask is never hit. A solid mask is the whole cell rect.
+    MASK_EMPTY, MASK_SOLID, MASK_PARTIAL = range(3)
+
+    def __init__(self, cell_size:int, base_unit_image:pg.image, cell_image:pg.image, unit_description:str, cell_props:dict, mask_color=None, clear_cell=False, mask:pg.mask.Mask=None):
 
         self.description = unit_description
         # the cell size. Every cell is a rectangle with (cell_size, cell_size) size.
@@ -62,18 +93,38 @@ class Cell:
         # used for collision detection
         if clear_cell:
             self.mask = None
+        elif mask is not None:
+            # Note: already created (loaded from the asset pack)
+            self.mask = mask
         else:
-            if mask_color is not None:
-                mask_img = cell_image.copy()
-                mask_img.set_colorkey(mask_color)
-                self.mask = pg.mask.from_surface(mask_img)
-            else:
-                self.mask = pg.mask.from_surface(cell_image)
+            self.mask = self.create_mask(cell_image, mask_color)
         # TODO: Check if the mask needs to set the setcolor and unsetcolor colors
+        self.mask_kind = self.classify_mask(self.mask)
 
         # Used to affect the submarine and other moving objects
         self.props = cell_props
 
+        # Dense global id of the cell, assigned by the ImgLibrary on load (see ImgLibrary.index_cells)
+        self.gid = None
+
+    @classmethod
+    def classify_mask(cls, mask):
+        if mask is None:
+            return cls.MASK_EMPTY
+        bits = mask.count()
+        if bits == 0:
+            return cls.MASK_EMPTY
+        width, height = mask.get_size()
+        return cls.MASK_SOLID if bits == width * height else cls.MASK_PARTIAL
+
+    @staticmethod
+    def create_mask(cell_image, mask_color=None):
+        if mask_color is not None:
+            mask_img = cell_image.copy()
+            mask_img.set_colorkey(mask_color)
+            return pg.mask.from_surface(mask_img)
+        return pg.mask.from_surface(cell_image)
+
 
 
 
@@ -85,7 +136,9 @@ class CellularImageUnit:
     CELL_SIZE: int = MapSettings.CELL_SIZE
 
 
-    def __init__(self, element_id:int, palette, filename: str, unit_data: dict):
+    def __init__(self, element_id:int, palette, filename: str, unit_data: dict, source:FileSource=None):
+
+        self.source = source if source is not None else FileSource()
 
         self.id = None
         self.palette = None
@@ -113,7 +166,7 @@ class CellularImageUnit:
             # TODO: Add functionality to autoresize all units based on the cell_size.
             print("There is no functionality to resize units yet!")
             return False
-        if not os.path.isfile(filename):
+        if not self.source.is_file(filename):
             print(f"Filename '{filename}' does NOT EXISTS or is NOT A FILE.")
             return False
         if not filename.endswith('.png'):
@@ -131,7 +184,7 @@ class CellularImageUnit:
         self.unit_data = unit_data
 
         # -->3. Load the image from file.
-        self.image = pg.image.load(filename).convert()
+        self.image = self.source.load_image(filename)
         self.image.set_colorkey(clr.WHITE)
 
         # Since unit_data["props"] is 1D array, we need to track the right index,
@@ -167,7 +220,9 @@ class CellularImageUnit:
 
                 # -create the cell element and append it to the cls.structure list:
                 if palette is not None:
-                    single_cell = Cell(self.CELL_SIZE, self.image, cell_image, self.description, props, mask_color=mask_color)
+                    mask = self.source.get_mask(f"{filename}#{cell_index}",
+                                                lambda: Cell.create_mask(cell_image, mask_color))
+                    single_cell = Cell(self.CELL_SIZE, self.image, cell_image, self.description, props, mask=mask)
                 else:
                     single_cell = Cell(self.CELL_SIZE, self.image, cell_image, self.description, props, clear_cell=True)
 
@@ -194,7 +249,9 @@ class CellularImageUnit:
 
 
 class BioImageUnit:
-    def __init__(self, ref_id, library_name, image_filename:str, image_data:dict):
+    def __init__(self, ref_id, library_name, image_filename:str, image_data:dict, source:FileSource=None):
+
+        self.source = source if source is not None else FileSource()
 
         self.id = ref_id
         self.library = library_name
@@ -227,21 +284,21 @@ class BioImageUnit:
                 self.height = image_data["frame-height"]
 
                 anim_speed = image_data["animation-speed"]
-                self.animation = Animation(image_filename, self.width, self.height, frame_count, anim_speed)
+                self.animation = Animation(image_filename, self.width, self.height, frame_count, anim_speed, source=self.source)
 
                 # -load the base image and the mask for collision detection:
                 self.image = self.animation.get_frame(0)
-                self.mask = pg.mask.from_surface(self.image)
+                self.mask = self.source.get_mask(f"{image_filename}#0", lambda: pg.mask.from_surface(self.image))
 
             else:
                 # self.animation = None
-                self.image = pg.image.load(image_filename).convert()
+                self.image = self.source.load_image(image_filename)
                 # self.width, self.height = self.image.get_size()
                 self.width = image_data["frame-width"]
                 self.height = image_data["frame-height"]
 
                 self.image.set_colorkey(clr.WHITE)
-                self.mask = pg.mask.from_surface(self.image)
+                self.mask = self.source.get_mask(f"{image_filename}#0", lambda: pg.mask.from_surface(self.image))
 
             self.default_props = image_data["props"]
             self.description = image_data["description"]
@@ -256,9 +313,11 @@ class BioImageUnit:
 
 class ImgLibrary:
     """Loading and indexing all the used images...
+        source: where the files are read from. Default: the disk. See assets.py for the pre-baked pack.
     """
-    def __init__(self):
+    def __init__(self, source:FileSource=None):
         self.cell_size = MapSettings.CELL_SIZE
+        self.source = source if source is not None else FileSource()
 
         # --> Have the clear cell by hand, to be used in the map:
         self.clear_cell = self.create_clear_cell()
@@ -271,6 +330,18 @@ class ImgLibrary:
             print(result)
             # NOTE: when new key_library is created, its key_feature should be added to files.CELLULAR_TYPES.
 
+        # -- GLOBAL CELL TABLE --
+        # Every Cell gets a dense global id (Cell.gid). Its properties are kept in parallel lists, indexed by the gid,
+        # so the map finds any cell property with a single index (see Map.get_cell_property).
+        self.cells = []
+        self.cell_images = []
+        self.cell_base_images = []
+        self.cell_masks = []
+        self.cell_mask_kinds = []
+        self.cell_props = []
+        self.cell_descriptions = []
+        self.index_cells()
+
 
         # 4. Load biolife images. Same format as cellular_images:
         # TODO: ---> REMOVE THIS
@@ -291,15 +362,38 @@ class ImgLibrary:
         # Interface images for the editor buttons and other. Accessed via image_key ("tool-clicked")
         self.editor_images = self.load_editor_interface_images()
 
+    def index_cells(self):
+        """ Assigns the global ids: 0 is the clear cell, then all the cells of every palette, in the library order.
+            Note: Every palette starts with its own clear cell unit. Its cell gets the gid 0 too.
+        """
+        self.add_cell(self.clear_cell.structure[0])
+        for key_feature, units in self.cellular_images.items():
+            for unit in units:
+                for cell in unit.structure:
+                    if unit.palette is None:
+                        cell.gid = 0
+                    else:
+                        self.add_cell(cell)
+
+    def add_cell(self, cell: Cell):
+        cell.gid = len(self.cells)
+        self.cells.append(cell)
+        self.cell_images.append(cell.image)
+        self.cell_base_images.append(cell.base_image)
+        self.cell_masks.append(cell.mask)
+        self.cell_mask_kinds.append(cell.mask_kind)
+        self.cell_props.append(cell.props)
+        self.cell_descriptions.append(cell.description)
+
     def load_editor_interface_images(self):
         img_db = {}
         img_path = files.EDITOR_IMAGES
 
         # images are saved in img_db dict, as 'keys' (extracted from their names) and pg.image objects
         img_names_list = []
-        for filename in os.listdir(img_path):
+        for filename in self.source.list_dir(img_path):
             if filename.endswith('.png'):
-                image = pg.image.load(img_path + filename).convert()
+                image = self.source.load_image(img_path + filename)
                 image.set_colorkey(clr.WHITE)
                 file_id = os.path.splitext(filename)[0]
                 img_db[file_id] = image
@@ -312,8 +406,7 @@ class ImgLibrary:
 
         return img_db
 
-    @staticmethod
-    def create_clear_cell():
+    def create_clear_cell(self):
         clear_unit_data = {
             "description": "Empty cell unit...",
             "shape": [1, 1],
@@ -322,7 +415,8 @@ class ImgLibrary:
             ],
             "animated": 0
         }
-        clear_cell = CellularImageUnit(element_id=0, palette=None, filename=files.CLEAR_CELL, unit_data=clear_unit_data)
+        clear_cell = CellularImageUnit(element_id=0, palette=None, filename=files.CLEAR_CELL, unit_data=clear_unit_data,
+                                       source=self.source)
         if clear_cell.success:
             return clear_cell
         else:
@@ -336,12 +430,8 @@ class ImgLibrary:
         # -->1. Loading the settings file for 'key_feature':
         try:
             img_data_file = os.path.join(img_path, f"{key_feature}.json")
-            with open(img_data_file, 'r') as file:
-                json_string = file.read()
-
-                # Loads the json file
-                data_list = json.loads(json_string)
-                print(f"CellularImages props for {key_feature} loaded successfully")
+            data_list = self.source.read_json(img_data_file)
+            print(f"CellularImages props for {key_feature} loaded successfully")
 
         except FileExistsError:
             err = f"Cellular: Elements props {key_feature}.json file not found"
@@ -349,7 +439,7 @@ class ImgLibrary:
 
         # -->2. Get the files we're interested in (based on 'key_feature'):
         filename_list = []
-        for filename in os.listdir(img_path):
+        for filename in self.source.list_dir(img_path):
             if key_feature in filename and filename.endswith('.png'):
                 filename_list.append(filename)
 
@@ -370,7 +460,7 @@ class ImgLibrary:
         # -->5. Next, create the rest of CellularUnits, using the sorted filenames list
         for i, filename in enumerate(filenames_sorted):
             full_filename = os.path.join(img_path, filename)
-            cellular_unit = CellularImageUnit(i+1, key_feature, full_filename, data_list[i])
+            cellular_unit = CellularImageUnit(i+1, key_feature, full_filename, data_list[i], source=self.source)
             if cellular_unit.success:
                 self.cellular_images[key_feature].append(cellular_unit)
             else:
@@ -386,12 +476,8 @@ class ImgLibrary:
         # -->1. Loading the settings file for 'key_feature':
         try:
             img_data_file = os.path.join(img_path, f"{key_feature}.json")
-            with open(img_data_file, 'r') as file:
-                json_string = file.read()
-
-                # Loads the json file
-                data_list = json.loads(json_string)
-                print(f"BioLife mage properties for {key_feature} loaded successfully.")
+            data_list = self.source.read_json(img_data_file)
+            print(f"BioLife mage properties for {key_feature} loaded successfully.")
 
         except FileExistsError:
             err = f"BioLife: elements props {key_feature}.json file not found"
@@ -399,7 +485,7 @@ class ImgLibrary:
 
         # -->2. Get the files we're interested in (based on 'key_feature'):
         filename_list = []
-        for filename in os.listdir(img_path):
+        for filename in self.source.list_dir(img_path):
             if key_feature in filename and filename.endswith('.png'):
                 filename_list.append(filename)
 
@@ -418,7 +504,8 @@ class ImgLibrary:
             bioimage_unit = BioImageUnit(ref_id=ref_id,
                                          library_name=key_feature,
                                          image_filename=full_filename,
-                                         image_data=image_data)
+                                         image_data=image_data,
+                                         source=self.source)
             if bioimage_unit.success:
                 self.biolife_images[key_feature].append(bioimage_unit)
             else:
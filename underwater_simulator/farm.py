@@ -0,0 +1,186 @@
+"""
+Process-pool farm of headless simulations, for AI training and parameter sweeps.
+
+The world (ImgLibrary images and masks, the map grid with its rasters and collision bitmap, and the biolife
+data) is loaded ONCE, in the main process, before the pool is created. The workers are forked, so they share
+it copy-on-write: no worker re-loads the map or decodes the PNG files again.
+Note: This needs the 'fork' start method (linux). pygame surfaces can't be pickled to 'spawn' workers.
+Note: The shared world is read-only. The editors must not be used in the farm engines.
+
+A scenario is a dict:
+    {
+        "name": "wall-run-1",          # optional
+        "seed": 1,                     # random seed of the environment (optional)
+        "start": [x, y, heading],      # start pose of the sub (optional, default: Sub20.init_position)
+        "ticks": 6000,                 # simulated ticks
+        "script": [[tick, thrust, spray, ballast], ...]   # control script (see controller.ScriptedController)
+    }
+and every worker returns a compact result dict (see run_scenario()).
+
+Usage (from the 'underwater_simulator' folder, as the image paths are relative):
+    python farm.py scenarios.json --workers 8 --output save/farm-results.json
+    python farm.py --random 32 --ticks 3000
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+
+import pygame as pg
+
+from settings import FarmSettings, ScreenSettings
+from assets import load_image_library
+from map import Map, MapEditor, BiolifeEditor
+from grid import CellTypes
+from journal import EditJournal
+from controller import ScriptedController
+
+
+class World:
+    """ Read-only data, shared by all the engines of the farm. """
+
+    def __init__(self, map_file=MapEditor.FILE_TO_SAVE, biolife_file=BiolifeEditor.FILE_TO_SAVE):
+        # The image library converts the images for the display, so a (dummy) display is needed first:
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        os.environ['SDL_AUDIODRIVER'] = 'dummy'
+        os.environ['SDL_NO_SIGNAL_HANDLERS'] = '1'  # SIGINT / SIGTERM must stop the workers, not only post pg.QUIT
+        pg.init()
+        pg.display.set_mode(ScreenSettings.MONITOR_DEFAULT)
+
+        self.image_library = load_image_library()
+
+        # The saved world: the map and biolife files, with the edits of the journal on them (see journal.py)
+        journal = EditJournal(map_file, MapEditor.JSON_FILE, biolife_file)
+        self.map_grid, self.biolife_data, edits = journal.load(CellTypes(self.image_library))
+        if edits:
+            print(f"{edits} edits applied from the journal.")
+
+        # The rasters and the collision bitmap of the grid are built once too, and shared by the engines.
+        # Note: This map needs the image library of the world only. It is never drawn or updated.
+        self.map = Map(self)
+        self.map.set_grid(self.map_grid)
+
+
+# Set in the main process before the pool is forked. The workers inherit it.
+_world = None
+
+
+def run_scenario(scenario: dict) -> dict:
+    """ Runs one scenario in a new headless engine, and returns its result record. """
+    from main import Engine  # Note: imported here, so the main process does not need the whole engine.
+
+    # Note: quiet, the engine prints every life unit it creates.
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine = Engine(headless=True, seed=scenario.get("seed", FarmSettings.DEFAULT_SEED), world=_world)
+    engine.joystick = ScriptedController(engine, scenario.get("script", []))
+
+    sub = engine.sub
+    if "start" in scenario:
+        sub.pos_x, sub.pos_y, sub.heading = scenario["start"]
+        sub.prev_pos = (sub.pos_x, sub.pos_y)
+    start_pos = (sub.pos_x, sub.pos_y)
+
+    ticks = scenario["ticks"]
+    distance = 0
+    hit_ticks = 0
+    min_integrity = sub.health.integrity
+
+    start_time = time.perf_counter()
+    for _ in range(ticks):
+        engine.update()
+
+        distance += math.hypot(sub.pos_x - sub.prev_pos[0], sub.pos_y - sub.prev_pos[1])
+        if sub.physics.resistance_nonpassable > 0:
+            hit_ticks += 1
+        min_integrity = min(min_integrity, sub.health.integrity)
+    total_time = time.perf_counter() - start_time
+
+    result = {
+        "name": scenario.get("name", ""),
+        "ticks": ticks,
+        "start": [start_pos[0], start_pos[1]],
+        "end": [sub.pos_x, sub.pos_y, sub.heading],
+        "distance": distance,
+        "hit-ticks": hit_ticks,
+        "min-integrity": min_integrity,
+        "integrity": sub.health.integrity,
+        "energy": sub.health.total_energy,
+        "state-hash": sub.state_hash().hex(),
+        "ticks-per-sec": ticks / total_time if total_time > 0 else 0,
+        "pid": os.getpid(),
+    }
+
+    # Note: no engine.quit() here. pg.quit() would close the display, still used by the next scenarios of the worker.
+    engine.is_running = False
+    return result
+
+
+class Farm:
+
+    def __init__(self, world: World, workers: int = None):
+        global _world
+        _world = world
+
+        self.workers = workers if workers else os.cpu_count()
+
+    def run(self, scenarios: list) -> list:
+        """ Returns the results in the same order as the scenarios. """
+        context = multiprocessing.get_context("fork")
+        pool = context.Pool(processes=self.workers)
+        try:
+            results = pool.map(run_scenario, scenarios, chunksize=1)
+        finally:
+            # Note: close() and join(), not terminate(). The workers are stopped by a SIGTERM on terminate(),
+            # and SDL may have its own SIGTERM handler in them.
+            pool.close()
+            pool.join()
+        return results
+
+
+def random_scenarios(count: int, ticks: int, seed: int = FarmSettings.DEFAULT_SEED) -> list:
+    """ Random control scripts: a new thrust / spray / ballast every FarmSettings.RANDOM_STEP_TICKS. """
+    rng = random.Random(seed)
+    scenarios = []
+    for i in range(count):
+        script = []
+        for tick in range(0, ticks, FarmSettings.RANDOM_STEP_TICKS):
+            script.append([tick, rng.choice([-1, 0, 1]), rng.choice([-1, 0, 1]), rng.choice([0, 50, 100])])
+        scenarios.append({"name": f"random-{i}", "seed": seed + i, "ticks": ticks, "script": script})
+    return scenarios
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run many headless simulations on all the CPU cores.")
+    parser.add_argument("scenarios", nargs="?", help="JSON file with a list of scenarios")
+    parser.add_argument("--random", type=int, default=0, help="run N random scenarios instead")
+    parser.add_argument("--ticks", type=int, default=FarmSettings.DEFAULT_TICKS, help="ticks of the random scenarios")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--output", default=FarmSettings.RESULTS_FILE, help="results JSON file")
+    args = parser.parse_args()
+
+    if args.scenarios:
+        with open(args.scenarios, 'r') as file:
+            scenarios = json.load(file)
+    elif args.random:
+        scenarios = random_scenarios(args.random, args.ticks)
+    else:
+        parser.error("Give a scenarios file, or --random N.")
+
+    start = time.perf_counter()
+    farm = Farm(World(), args.workers)
+    print(f"World loaded in {time.perf_counter() - start:.2f} sec.")
+
+    results = farm.run(scenarios)
+    total_time = time.perf_counter() - start
+    total_ticks = sum(result["ticks"] for result in results)
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    print(f"{len(results)} scenarios, {total_ticks} ticks in {total_time:.2f} sec on {farm.workers} workers "
+          f"({total_ticks / total_time:.1f} ticks/sec). Results saved in '{args.output}'.")
@@ -0,0 +1,173 @@
+"""
+Compact map grid, backed by typed NumPy arrays.
+
+The map was a nested list of [key_feature, unit_id, cell_id, [life ids]] per cell (~105k small python objects
+for 300 x 350 cells). Here every field is one array of shape (cells_y, cells_x):
+
+    palette:  uint8  - index of the key_feature in MapGrid.palettes (0 = None, the clear cell)
+    unit:     uint16 - index of the CellularImageUnit in the palette (ImgLibrary.cellular_images[key_feature])
+    cell:     uint16 - index of the Cell in the unit structure
+    gid:      uint16 - global cell-type id (see CellTypes). The Cell object is ImgLibrary.cells[gid]
+
+The life units populate only a few cells, so they are kept apart, in a sparse index {(col, row): [life ids]}.
+
+The arrays are indexed [row, col]. Whole regions are slices of them, e.g. grid.gid[row_start:row_end, col_start:col_end]
+"""
+import numpy as np
+
+from settings import FileLocations as files
+
+
+class CellTypes:
+    """ Converts the library addresses of the map cells into their global ids (gid).
+        The gids are assigned by the image library (see ImgLibrary.index_cells). gid 0 is the clear cell.
+    """
+
+    def __init__(self, image_library, palettes=None):
+        self.palettes = [None] + list(palettes if palettes is not None else files.CELLULAR_TYPES)
+
+        self.cells = image_library.cells  # [Cell, ...], indexed by gid
+
+        units = [image_library.cellular_images.get(key, []) for key in self.palettes[1:]]
+        max_units = max([len(palette_units) for palette_units in units] + [1])
+        max_cells = max([len(unit.structure) for palette_units in units for unit in palette_units] + [1])
+
+        # Lookup table (palette, unit, cell) -> gid. Used to convert whole arrays at once (see MapGrid.from_structure)
+        self.gid_table = np.zeros((len(self.palettes), max_units, max_cells), dtype=np.uint16)
+
+        for palette_index, palette_units in enumerate(units, start=1):
+            for unit_id, unit in enumerate(palette_units):
+                for cell_id, cell in enumerate(unit.structure):
+                    self.gid_table[palette_index, unit_id, cell_id] = cell.gid
+
+    def get_gid(self, palette_index, unit_id, cell_id) -> int:
+        return int(self.gid_table[palette_index, unit_id, cell_id])
+
+
+class MapGrid:
+    paged = False  # The whole map is in memory. See paging.PagedMapGrid for the large maps.
+
+    def __init__(self, cells_x, cells_y, cell_types: CellTypes = None, palettes=None):
+        self.cells_x = cells_x
+        self.cells_y = cells_y
+        self.cell_types = cell_types
+
+        if cell_types is not None:
+            self.palettes = cell_types.palettes
+        else:
+            self.palettes = [None] + list(palettes if palettes is not None else files.CELLULAR_TYPES)
+        self.palette_index = {key: i for i, key in enumerate(self.palettes)}
+
+        shape = (cells_y, cells_x)
+        self.palette = np.zeros(shape, dtype=np.uint8)
+        self.unit = np.zeros(shape, dtype=np.uint16)
+        self.cell = np.zeros(shape, dtype=np.uint16)
+        self.gid = np.zeros(shape, dtype=np.uint16)
+
+        self.population = {}  # {(col, row): [life_unit_id, ...]}. Only the populated cells.
+
+    # --- CELLS ---
+
+    def get_address(self, col, row) -> tuple:
+        """ The library address of the cell: (key_feature, unit_id, cell_id). key_feature is None for a clear cell. """
+        return self.palettes[self.palette.item(row, col)], self.unit.item(row, col), self.cell.item(row, col)
+
+    def set_address(self, col, row, address):
+        """ address: (key_feature, unit_id, cell_id), like in CellularImageUnit.structure_map """
+        palette_index = self.palette_index[address[0]]
+        unit_id, cell_id = address[1], address[2]
+
+        self.palette[row, col] = palette_index
+        self.unit[row, col] = unit_id
+        self.cell[row, col] = cell_id
+        if self.cell_types is not None:
+            self.gid[row, col] = self.cell_types.get_gid(palette_index, unit_id, cell_id)
+
+    def get_entry(self, col, row) -> list:
+        """ The cell in the old map_structure format: [key_feature, unit_id, cell_id, [life ids]] """
+        return list(self.get_address(col, row)) + [list(self.get_population(col, row))]
+
+    def set_entry(self, col, row, entry):
+        """ Writes a cell in the old map_structure format. The population is replaced too, when given. """
+        self.set_address(col, row, entry)
+        if len(entry) > 3:
+            self.population.pop((col, row), None)
+            for life_unit_id in entry[3]:
+                self.add_life(col, row, life_unit_id)
+
+    # --- POPULATION ---
+
+    def get_population(self, col, row):
+        """ The ids of the life units, populating the cell. Read-only (use add_life() and remove_life()). """
+        return self.population.get((col, row), ())
+
+    def add_life(self, col, row, life_unit_id):
+        ids = self.population.setdefault((col, row), [])
+        if life_unit_id not in ids:
+            ids.append(life_unit_id)
+
+    def remove_life(self, col, row, life_unit_id):
+        ids = self.population.get((col, row))
+        if ids is not None and life_unit_id in ids:
+            ids.remove(life_unit_id)
+            if not ids:
+                del self.population[(col, row)]
+
+    def shift_life_ids(self, deleted_id):
+        """ After the life unit deleted_id was removed from the life list, the ids of the next units are one less. """
+        for ids in self.population.values():
+            for i, life_unit_id in enumerate(ids):
+                if life_unit_id > deleted_id:
+                    ids[i] = life_unit_id - 1
+
+    def clear_population(self):
+        self.population.clear()
+
+    # --- CONVERSION ---
+
+    @classmethod
+    def from_structure(cls, structure, cell_types: CellTypes = None, palettes=None):
+        """ Creates the grid from the old map_structure format (the map json files). """
+        cells_y = len(structure)
+        cells_x = len(structure[0]) if cells_y else 0
+        grid = cls(cells_x, cells_y, cell_types, palettes)
+
+        entries = [entry for line in structure for entry in line]
+        palette_index = grid.palette_index
+        grid.palette[:] = np.array([palette_index[entry[0]] for entry in entries],
+                                   dtype=np.uint8).reshape(cells_y, cells_x)
+        grid.unit[:] = np.array([entry[1] for entry in entries], dtype=np.uint16).reshape(cells_y, cells_x)
+        grid.cell[:] = np.array([entry[2] for entry in entries], dtype=np.uint16).reshape(cells_y, cells_x)
+        grid.update_gid()
+
+        for i, entry in enumerate(entries):
+            if len(entry) > 3 and entry[3]:
+                grid.population[(i % cells_x, i // cells_x)] = list(entry[3])
+
+        return grid
+
+    def to_structure(self) -> list:
+        """ The grid in the old map_structure format, for the map json files. """
+        palettes = self.palettes
+        structure = []
+        for row, (palette_line, unit_line, cell_line) in enumerate(zip(self.palette.tolist(), self.unit.tolist(),
+                                                                        self.cell.tolist())):
+            structure.append([[palettes[palette_index], unit_id, cell_id, list(self.get_population(col, row))]
+                              for col, (palette_index, unit_id, cell_id)
+                              in enumerate(zip(palette_line, unit_line, cell_line))])
+        return structure
+
+    def update_gid(self):
+        """ Recalculates the whole gid array from the palette, unit and cell arrays (vectorised).
+            Note: Most of the map is clear water (gid 0), so only the other cells are looked up.
+        """
+        self.gid[:] = 0
+        if self.cell_types is not None:
+            rows, cols = np.nonzero(self.palette)
+            self.gid[rows, cols] = self.cell_types.gid_table[self.palette[rows, cols], self.unit[rows, cols],
+                                                             self.cell[rows, cols]]
+
+    @property
+    def nbytes(self) -> int:
+        """ Memory used by the cell arrays (the population index is not included). """
+        return self.palette.nbytes + self.unit.nbytes + self.cell.nbytes + self.gid.nbytes
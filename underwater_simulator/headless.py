@@ -0,0 +1,93 @@
+"""
+Headless, max-speed runner for the simulation.
+
+The Engine is built without a real display (see Engine(headless=True)) and only Engine.update()
+is stepped, as fast as the CPU allows - no Engine.draw(), no display flip and no clock.tick(FPS).
+Used to soak the physics / health model over a large number of ticks,
+and to track the simulation throughput on the Edge2 and on the x86 build boxes.
+
+Usage (from the 'underwater_simulator' folder, as the image paths are relative):
+    python headless.py --ticks 100000
+"""
+import argparse
+import time
+
+from main import Engine
+from tools import Tools
+
+
+class HeadlessRunner:
+
+    def __init__(self, engine=None):
+        # Note: an already built engine can be passed, if the caller needs to prepare it (position, controls...)
+        self.engine = engine if engine is not None else Engine(headless=True)
+
+        # Duration of every simulated tick, in seconds.
+        self.tick_times = []
+        self.total_time = 0
+
+    def run(self, ticks: int, warmup: int = 0):
+        """ Steps the simulation 'ticks' times and records the duration of every tick.
+            The 'warmup' ticks are simulated first and not recorded.
+        """
+        engine = self.engine
+        clock = time.perf_counter
+
+        for _ in range(warmup):
+            engine.update()
+
+        tick_times = [0.0] * ticks
+        start_time = clock()
+        for i in range(ticks):
+            tick_start = clock()
+            engine.update()
+            tick_times[i] = clock() - tick_start
+
+        self.total_time = clock() - start_time
+        self.tick_times = tick_times
+
+        return self.report()
+
+    def report(self) -> dict:
+        """ Returns ticks/second and the per-tick latency percentiles (in ms). """
+        ticks_count = len(self.tick_times)
+        sorted_times = sorted(self.tick_times)
+
+        return {
+            "ticks": ticks_count,
+            "total-sec": self.total_time,
+            "ticks-per-sec": ticks_count / self.total_time if self.total_time > 0 else 0,
+            "p50-ms": Tools.percentile(sorted_times, 50) * 1000,
+            "p95-ms": Tools.percentile(sorted_times, 95) * 1000,
+            "p99-ms": Tools.percentile(sorted_times, 99) * 1000,
+            "max-ms": sorted_times[-1] * 1000 if sorted_times else 0,
+        }
+
+    @staticmethod
+    def format_report(report: dict) -> str:
+        return (f"{report['ticks']} ticks in {report['total-sec']:.2f} sec | "
+                f"{report['ticks-per-sec']:.1f} ticks/sec | "
+                f"p50: {report['p50-ms']:.3f} ms | p95: {report['p95-ms']:.3f} ms | "
+                f"p99: {report['p99-ms']:.3f} ms | max: {report['max-ms']:.3f} ms")
+
+    def close(self):
+        self.engine.is_running = False
+        self.engine.quit()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Step the simulation headless, at maximum speed.")
+    parser.add_argument("--ticks", type=int, default=10000, help="number of simulated ticks to measure")
+    parser.add_argument("--warmup", type=int, default=100, help="ticks simulated before measuring")
+    parser.add_argument("--profile", action="store_true", help="print the per-stage profiler table")
+    args = parser.parse_args()
+
+    runner = HeadlessRunner()
+    runner.engine.profiler.enabled = args.profile
+
+    result = runner.run(args.ticks, warmup=args.warmup)
+    print(runner.format_report(result))
+    if args.profile:
+        print(runner.engine.profiler.format_table())
+
+    runner.close()
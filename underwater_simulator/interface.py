@@ -29,6 +29,8 @@ class Pointer:
     INFOBOX_FONT_SIZE = 10
     INFOBOX_OFFSET = (20, -10)  # This is the topleft relative to mouse pointer
 
+    AREA_CELLS = 5  # The environment statistics are shown for an area of 5 x 5 cells around the pointer.
+
     def __init__(self, engine):
         self.engine = engine
 
@@ -96,7 +98,8 @@ class Pointer:
         collision_data = {
             "water-data": None,     # only one water type can be located at the pointer position.
             "map": None,  # collision with only one map-cell can appear
-            "biolife-data": []  # If multiply life forms located on the position, pointer returns all their data.
+            "biolife-data": [],  # If multiply life forms located on the position, pointer returns all their data.
+            "area": None,  # mean and max of the cell props around the pointer (see EnvironmentRasters.stats)
 
             # Note: If more unit types are created in future, they should be added here.
         }
@@ -110,12 +113,12 @@ class Pointer:
         index_str = f"row={center_cell_index_y} | cell={center_cell_index_x}"
 
         # 2. Get the cell data:
-        # cell_data_index = self.engine.map.map_structure[center_cell_index_y][center_cell_index_x]
+        # cell_data_index = self.engine.map.grid.get_address(center_cell_index_x, center_cell_index_y)
         row_index = center_cell_index_y
         cell_index = center_cell_index_x
         cell_description = self.engine.map.get_cell_property((cell_index, row_index), "description")
         cell_props = self.engine.map.get_cell_property((cell_index, row_index), "props")
-        cell_biolist = self.engine.map.map_structure[row_index][cell_index]
+        cell_biolist = self.engine.map.grid.get_entry(cell_index, row_index)
         map_cell_data = {
             "description": cell_description,
             "position": index_str,
@@ -132,12 +135,18 @@ class Pointer:
         # found_units_id = self.engine.biolife.unit_id_list_from_coordinates(self.position_on_map)
 
         # list of unit_id, found in this cell
-        found_units_id = self.engine.map.map_structure[row_index][cell_index][3]
+        found_units_id = self.engine.map.grid.get_population(cell_index, row_index)
 
         found_life_info = [self.engine.biolife.get_unit_info(unit_id) for unit_id in found_units_id]
         for unit_info in found_life_info:
             collision_data["biolife-data"].append(unit_info)
 
+        # --> The environment around the pointer:
+        area_size = self.AREA_CELLS * MapSettings.CELL_SIZE
+        area_rect = pg.Rect(0, 0, area_size, area_size)
+        area_rect.center = self.position_on_map
+        collision_data["area"] = self.engine.map.rasters.stats(area_rect)
+
         return collision_data
 
     def update(self):
@@ -187,6 +196,11 @@ class Pointer:
 
         lines.append(f"Structure: {collided_objects_data['map']['struct']}")
 
+        area = collided_objects_data["area"]
+        if area is not None:
+            lines.append(f"Area {self.AREA_CELLS}x{self.AREA_CELLS}: T mean={area['temp'][0]:.1f}, max={area['temp'][1]:.0f}")
+            lines.append(f"{tab}Risk max={area['risk'][1]:.2f} | Passable={area['passable'][0]:.0%}")
+
         for i, obj_data in enumerate(collided_objects_data["biolife-data"]):
             lines.append(f"Unit {i+1}: {obj_data['description']}")
             # print(obj_data["props"])
@@ -229,6 +243,10 @@ class Pointer:
 """
 
 class Gauger:
+    # The power gauge: center and radius of the circle, length of the arrows
+    POWER_CENTER = (60, 195)
+    POWER_RADIUS = 40
+    POWER_ARROW_LENGTH = POWER_RADIUS - 10
 
     def __init__(self, engine):
         self.engine = engine
@@ -519,20 +537,26 @@ class Gauger:
             rc.top = t_end[1] + 5
         self.engine.display.blit(srf, rc)
 
-    def draw_gauge_arrow(self, arrow_length: float, angle:float, center:tuple, color=clr.RED):
-        # Drawing arrow from given center, with little tail on back:
+    @staticmethod
+    def gauge_arrow_points(arrow_length: float, angle: float, center: tuple) -> tuple:
+        """ The (arrow, tail) end points of an arrow from the center. """
         center_x, center_y = center
         tail_angle = math.radians(angle - 180)
         angle = math.radians(angle)
 
         arrow_x = center_x + arrow_length * math.cos(angle)
         arrow_y = center_y - arrow_length * math.sin(angle)
-        pg.draw.line(self.engine.display, color, center, (arrow_x, arrow_y), 1)
 
         tail_len = arrow_length * 0.4
         tail_x = center_x + tail_len * math.cos(tail_angle)
         tail_y = center_y - tail_len * math.sin(tail_angle)
-        pg.draw.line(self.engine.display, color, center, (tail_x, tail_y), 3)
+        return (arrow_x, arrow_y), (tail_x, tail_y)
+
+    def draw_gauge_arrow(self, arrow_length: float, angle:float, center:tuple, color=clr.RED):
+        # Drawing arrow from given center, with little tail on back:
+        arrow_point, tail_point = self.gauge_arrow_points(arrow_length, angle, center)
+        pg.draw.line(self.engine.display, color, center, arrow_point, 1)
+        pg.draw.line(self.engine.display, color, center, tail_point, 3)
 
         pg.draw.circle(self.engine.display, clr.WHITE, center, 2, 1)
 
@@ -674,12 +698,10 @@ class Gauger:
         bg_image.set_colorkey(clr.WHITE)
 
         bg_rect = bg_image.get_rect()
-        x_pos = 60
-        y_pos = 195
+        x_pos, y_pos = self.POWER_CENTER
         center = (x_pos, y_pos)
 
-        radius = 40
-        arrow_length = (radius-10, radius-5)  # (power-in, power-out)
+        radius = self.POWER_RADIUS
 
         bg_rect.center = (x_pos, y_pos)
         self.engine.display.blit(bg_image, bg_rect)
@@ -698,6 +720,15 @@ class Gauger:
         # gauge_max = (1, 1)
         # ranged_val = Tools.range_value(value, gauge_min, gauge_max, 0, 1)
 
+        angle_in, angle_out = self.power_angles()
+
+        # draw arrow for power-in:
+        self.draw_gauge_arrow(self.POWER_ARROW_LENGTH, angle_in, center, color=clr.YELLOW)
+        # draw arrow for power-out:
+        self.draw_gauge_arrow(self.POWER_ARROW_LENGTH, angle_out, center, color=clr.RED)
+
+    def power_angles(self) -> tuple:
+        """ The angles of the power-in and the power-out arrows. """
         power_in = self.engine.sub.health.energy_gain
         power_out = self.engine.sub.health.energy_consumption["total"]  # 0: total, 1:
 
@@ -710,11 +741,7 @@ class Gauger:
             angle_out = 230 - 280*power_out
         else:
             angle_out = 230
-
-        # draw arrow for power-in:
-        self.draw_gauge_arrow(arrow_length[0], angle_in, center, color=clr.YELLOW)
-        # draw arrow for power-out:
-        self.draw_gauge_arrow(arrow_length[0], angle_out, center, color=clr.RED)
+        return angle_in, angle_out
 
     @staticmethod
     def load_battery_sheet(sheet_src="img/interface/battery-gauge.png"):
@@ -903,6 +930,55 @@ class Gauger:
         rc.top = gauge_rect.bottom - 10
         self.engine.display.blit(srf, rc)
 
+    def warning_visible(self, sign_id=0, speed_up=False) -> bool:
+        """ Whether draw_warning_sign() shows the sign now. """
+        blink_interval = 400 if speed_up else 1100
+        return pg.time.get_ticks() - self.last_warning_blink[sign_id] > blink_interval // 2
+
+    def gauges(self) -> list:
+        """ [(name, draw function, signature)] of every gauge. The signature has the values, the gauge shows:
+            while it is the same, the gauge is drawn on the same pixels (see render.py).
+        """
+        sub = self.engine.sub
+        health = sub.health
+        consumption = health.energy_consumption
+
+        charge = health.total_energy
+        if charge < 0.12:
+            battery_warning = self.warning_visible(0, speed_up=True)
+        elif charge < 0.25:
+            battery_warning = self.warning_visible(0)
+        else:
+            battery_warning = None
+        solar, thermal = sub.physics.solar_energy, sub.physics.thermal_energy
+        total_in = min(solar + thermal, 1)
+
+        return [
+            ("depth", self.draw_depth_gauge,
+             (self.depth["current"], f"{self.water_props['pressure']:.1f}", self.depth["top"], self.depth["btm"])),
+            ("engine", self.draw_engine_gauge,
+             (self.engine_data["thrust"], self.engine_data["spray"], self.engine_data["buoyancy"])),
+            ("resistance", self.draw_resistance_gauge,
+             (tuple(self.physics_data["resistance"]), self.physics_data["force"])),
+            ("circ", self.draw_circ_gauges,
+             (self.water_props["pressure"], self.water_props["temp"], health.internal_temp)),
+            ("risk", self.draw_risk_gauge, (sub.physics.surrounding_risk,)),
+            # Note: The arrows are drawn on whole pixels (the points are truncated), so only their pixels are compared.
+            ("power", self.draw_power_gauge,
+             tuple(tuple(int(value) for value in point)
+                   for angle in self.power_angles()
+                   for point in self.gauge_arrow_points(self.POWER_ARROW_LENGTH, angle, self.POWER_CENTER))),
+            ("battery", self.draw_battery_gauge,
+             (0 if charge < 0.02 else math.ceil(charge * 10), f"{charge * 100:.2f}", battery_warning,
+              f"{solar * 100:.1f}", f"{thermal * 100:.1f}",
+              f"{consumption['thrust'] * 100:.1f}", f"{consumption['spray'] * 100:.1f}",
+              f"{(total_in - consumption['total']) * 100:.1f}")),
+            ("heading", self.draw_heading_gauge,
+             (sub.heading, f"{health.structural_buoyancy:.2f}", f"{health.integrity * 100:.1f}",
+              self.warning_visible(1, speed_up=True) if health.damage_rate > 0 else None,
+              int(sub.pos_x // MapSettings.CELL_SIZE), int(sub.pos_y // MapSettings.CELL_SIZE))),
+        ]
+
     def draw(self):
         self.draw_depth_gauge()
         self.draw_engine_gauge()
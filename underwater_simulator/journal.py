@@ -0,0 +1,389 @@
+"""
+Append-only journal of the map and biolife edits.
+
+Saving ('s') rewrote the whole map and biolife files, on the main thread, so the game stopped on every save.
+Here every edit is recorded as it is made (one json line per edit), by a background writer. A save appends a
+"save" marker and syncs the journal to the disk. The saved world is the map and biolife files (the base snapshot),
+plus the journal records on top, up to the last marker:
+
+    {"op": "cells", "col": 10, "row": 20, "cells": [[["map-rock", 18, 0], ...], ...]}    MapEditor.write_on_map
+    {"op": "add-life", "address": {...}, "rows": [r0, r1], "cols": [c0, c1]}            BioLife.add_life_unit
+    {"op": "delete-life", "id": 3, "rows": [r0, r1], "cols": [c0, c1]}                  BioLife.delete_life_unit
+    {"op": "save"}                                                                      EditJournal.save
+
+(rows and cols are the ranges of the map cells, whose population was changed.)
+
+The position after the last marker is kept (saved_position). Loading ('o') cuts the journal back to it, so the
+unsaved edits are dropped, as before. So does the exit. After a crash, the edits after the marker are still in the
+journal: the next load applies them, and they are saved with the next 's' (or dropped with 'o').
+
+The journal is kept in numbered segments: JournalSettings.FILE + '.<n>'. A save compacts the closed segments into
+the base files in a background thread, after JournalSettings.COMPACT_EDITS saved edits, or when there are
+JournalSettings.COMPACT_SEGMENTS segments:
+    1. The writer moves on to a new segment, right after the marker. The new edits go there.
+    2. The base files are loaded, the records of the closed segments are applied, and the new files are
+       written next to the old ones ('.compact'). The json map too: the tracked json map and biolife file
+       always change together.
+    3. A commit manifest lists the file replaces and the segments to delete. Then they are done.
+A crash before step 3 leaves the base files and the segments as they were. A crash during step 3 is finished
+on the next load, from the manifest. The compactor is never waited for on the main thread while the game runs:
+take_commit() tells when it is done. On exit, it is waited for, and the saved segments left over are compacted.
+
+The saved world is loaded by EditJournal.load(): the base files first, then the segments on top (the engine on start
+and 'o', the farm, and 'mapfile.py --export').
+"""
+import json
+import os
+import queue
+import threading
+
+from settings import JournalSettings
+from mapfile import load_grid, load_map_grid, save_grid, write_source
+
+
+def apply_record(record: dict, grid, life_addresses: list):
+    """ Applies one journal record on a map grid and a list of life unit addresses (the biolife file format). """
+    op = record["op"]
+    if op == "cells":
+        for delta_row, line in enumerate(record["cells"]):
+            for delta_col, address in enumerate(line):
+                grid.set_entry(record["col"] + delta_col, record["row"] + delta_row, address)
+
+    elif op == "add-life":
+        life_unit_id = len(life_addresses)
+        life_addresses.append(record["address"])
+        for row in range(*record["rows"]):
+            for col in range(*record["cols"]):
+                grid.add_life(col, row, life_unit_id)
+
+    elif op == "delete-life":
+        for row in range(*record["rows"]):
+            for col in range(*record["cols"]):
+                grid.remove_life(col, row, record["id"])
+        del life_addresses[record["id"]]
+        grid.shift_life_ids(record["id"])
+
+    elif op != "save":
+        raise ValueError(f"unknown journal record '{op}'")
+
+
+def read_segment(filename) -> list:
+    """ The records of a journal segment, as (record, file offset after it). An incomplete last line (a crash while
+        writing) is skipped.
+    """
+    records = []
+    offset = 0
+    with open(filename, 'rb') as file:
+        for line in file:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            offset += len(line)
+            records.append((record, offset))
+    return records
+
+
+def write_json(data, filename):
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, 'w') as file:
+        json.dump(data, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_filename, filename)
+
+
+class EditJournal:
+
+    def __init__(self, map_file, map_json_file, biolife_file, filename=JournalSettings.FILE):
+        self.map_file = map_file
+        # The tracked json map. Imported into the binary map when it changed (see load_map_grid), and exported
+        # with every compaction, so it goes with the biolife file.
+        self.map_json_file = map_json_file
+        self.biolife_file = biolife_file
+
+        self.filename = filename
+        self.manifest_file = f"{filename}.commit"
+
+        segments = self.segments()
+        self.segment = segments[-1] + 1 if segments else 1  # the segment written now. Used by the writer thread.
+
+        # (segment, file offset) after the last "save" marker. Set by the writer thread on save.
+        # Note: (0, 0) when there is no marker: all the records on the disk are unsaved.
+        self.saved_position = (0, 0)
+        self.unsaved = 0  # edits after the saved position
+        self.saved_edits = 0  # saved edits in the segments, not compacted yet
+        for number in segments:
+            for record, offset in read_segment(self.segment_file(number)):
+                if record["op"] == "save":
+                    self.saved_position = (number, offset)
+                    self.saved_edits += self.unsaved
+                    self.unsaved = 0
+                else:
+                    self.unsaved += 1
+
+        # ("record", dict), ("save", Event), ("sync", Event), ("rotate", Event), ("discard", Event).
+        # None stops the writer.
+        self.queue = queue.Queue()
+        self.writer = None  # started on the first edit
+        self.compactor = None
+        self.compactions = 0  # compactions started
+        self.committed = False  # set by the compactor after a commit, cleared by take_commit()
+
+    # --- SEGMENTS ---
+
+    def segment_file(self, number) -> str:
+        return f"{self.filename}.{number}"
+
+    def segments(self) -> list:
+        """ The numbers of the segments on the disk, in order. """
+        folder, name = os.path.split(self.filename)
+        if not os.path.isdir(folder or "."):
+            return []
+        numbers = []
+        for file in os.listdir(folder or "."):
+            prefix, _, suffix = file.rpartition(".")
+            if prefix == name and suffix.isdigit():
+                numbers.append(int(suffix))
+        return sorted(numbers)
+
+    # --- WRITER ---
+
+    def record(self, record: dict):
+        """ Adds an edit. It is written to the journal now, and saved on the next save(). """
+        self.start_writer()
+        self.queue.put(("record", record))
+        self.unsaved += 1
+
+    def discard(self) -> int:
+        """ Drops the unsaved edits: the journal is cut back to the saved position. Returns their number. """
+        count = self.unsaved
+        if count:
+            self.start_writer()
+            self.request("discard")
+            self.unsaved = 0
+        return count
+
+    def start_writer(self):
+        if self.writer is None:
+            self.writer = threading.Thread(target=self._writer_thread, daemon=True)
+            self.writer.start()
+
+    def request(self, kind):
+        """ Sends a request to the writer and waits until it is done (the records before it are written). """
+        if self.writer is None:
+            if kind == "rotate":
+                self.segment += 1
+            return
+        done = threading.Event()
+        self.queue.put((kind, done))
+        done.wait()
+
+    def _writer_thread(self):
+        file = None
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            kind, value = item
+
+            if kind in ("record", "save") and file is None:
+                os.makedirs(os.path.dirname(self.filename) or ".", exist_ok=True)
+                file = open(self.segment_file(self.segment), 'ab')
+
+            if kind == "record":
+                file.write(json.dumps(value).encode() + b"\n")
+            elif kind == "save":
+                file.write(json.dumps({"op": "save"}).encode() + b"\n")
+            elif kind == "discard":
+                # The segments after the saved position are deleted, the saved one is cut at the position.
+                if file is not None:
+                    file.close()
+                    file = None
+                saved_segment, saved_offset = self.saved_position
+                for number in self.segments():
+                    if number > saved_segment:
+                        os.remove(self.segment_file(number))
+                    elif number == saved_segment and os.path.isfile(self.segment_file(number)):
+                        # Note: Unless the compactor deleted it meanwhile. Then it had saved edits only.
+                        try:
+                            os.truncate(self.segment_file(number), saved_offset)
+                        except FileNotFoundError:
+                            pass
+
+            if kind in ("save", "sync", "rotate") and file is not None:
+                # The segment is on the disk. "rotate" closes it, the next records go to a new one.
+                file.flush()
+                os.fsync(file.fileno())
+                if kind == "save":
+                    self.saved_position = (self.segment, file.tell())
+                if kind == "rotate":
+                    file.close()
+                    file = None
+            if kind == "rotate":
+                self.segment += 1
+            if kind != "record":
+                value.set()
+
+            # Note: written to the file when there is nothing else to do (a crash loses only the queued records)
+            if file is not None and self.queue.empty():
+                file.flush()
+
+        if file is not None:
+            file.flush()
+            os.fsync(file.fileno())
+            file.close()
+
+    # --- SAVE AND LOAD ---
+
+    def save(self) -> str:
+        """ Marks the edits as saved, and syncs the journal to the disk. Then starts a compaction, when it is due. """
+        edits = self.unsaved
+        if not edits:
+            return "Saved: no edits."
+        self.start_writer()
+        self.request("save")
+        self.unsaved = 0
+        self.saved_edits += edits
+
+        result = f"Saved {edits} edits in the journal."
+        due = (self.saved_edits >= JournalSettings.COMPACT_EDITS
+               or len(self.segments()) >= JournalSettings.COMPACT_SEGMENTS)
+        # Note: Not while the last compaction runs, or its commit is not taken yet (see Engine.check_journal_commit)
+        if due and not self.compacting() and not self.committed:
+            self.compact()
+            result += " Compacting it into the map and biolife files..."
+        return result
+
+    def compacting(self) -> bool:
+        return self.compactor is not None and self.compactor.is_alive()
+
+    def settle(self):
+        """ Waits for the writer and the compactor, and finishes a commit interrupted by a crash.
+            Called before the base files are loaded.
+            Note: On the main thread, only when not compacting() (the engine waits for it, see Engine.discard_edits)
+        """
+        self.request("sync")
+        if self.compactor is not None:
+            self.compactor.join()
+            self.compactor = None
+        if os.path.isfile(self.manifest_file):
+            with open(self.manifest_file, 'r') as file:
+                self.commit(json.load(file))
+            print(f"Interrupted journal compaction finished, from '{self.manifest_file}'.")
+
+    def replay(self, grid, life_addresses: list) -> int:
+        """ Applies the journal segments on the loaded base files. Returns the number of the applied edits.
+            Note: The unsaved edits left by a crash are applied too (see self.unsaved).
+        """
+        count = 0
+        for number in self.segments():
+            for record, _ in read_segment(self.segment_file(number)):
+                apply_record(record, grid, life_addresses)
+                count += record["op"] != "save"
+        return count
+
+    def load(self, cell_types=None, load_grid=None) -> tuple:
+        """ The saved world: (map grid, life unit addresses, number of the edits applied from the journal).
+            load_grid(map_file, map_json_file): loads the base map instead of load_map_grid (see Map.read_grid).
+            Note: Nothing is built from the grid here, the edits are applied on the grid and the addresses only.
+        """
+        self.settle()
+        if load_grid is None:
+            grid = load_map_grid(self.map_file, cell_types, self.map_json_file)
+        else:
+            grid = load_grid(self.map_file, self.map_json_file)
+        life_addresses = []
+        if os.path.isfile(self.biolife_file):
+            with open(self.biolife_file, 'r') as file:
+                life_addresses = json.load(file)
+        edits = self.replay(grid, life_addresses)
+        return grid, life_addresses, edits
+
+    # --- COMPACTION ---
+
+    def compact(self, wait=False):
+        """ Starts the compaction of the closed segments into the base files, in a background thread.
+            Note: Called right after a save (or a discard), so the closed segments have saved edits only.
+            wait: the compaction is finished on return.
+        """
+        self.request("rotate")
+        segments = [number for number in self.segments() if number < self.segment]
+        if segments:
+            self.compactor = threading.Thread(target=self._compactor_thread, args=(segments,), daemon=True)
+            self.compactor.start()
+            self.compactions += 1
+            self.saved_edits = 0
+            if wait:
+                self.settle()
+
+    def take_commit(self) -> bool:
+        """ True once after every finished compaction: the base files have the saved edits now. """
+        committed, self.committed = self.committed, False
+        return committed
+
+    def _compactor_thread(self, segments: list):
+        try:
+            # 1. The base files, as they are. Note: No cell types here, the gid of the cells is not needed.
+            # Note: The binary map, without the json import of load_map_grid, which replaces files. The engine
+            # loaded (imported) it before the first edit.
+            grid = load_grid(self.map_file)
+            life_addresses = []
+            if os.path.isfile(self.biolife_file):
+                with open(self.biolife_file, 'r') as file:
+                    life_addresses = json.load(file)
+
+            # 2. The records on top, and the new files next to the old ones:
+            for number in segments:
+                for record, _ in read_segment(self.segment_file(number)):
+                    apply_record(record, grid, life_addresses)
+            save_grid(grid, f"{self.map_file}.compact")
+            write_json(life_addresses, f"{self.biolife_file}.compact")
+            replace = [[f"{self.map_file}.compact", self.map_file], [f"{self.biolife_file}.compact", self.biolife_file]]
+            if self.map_json_file is not None:
+                # The tracked json map goes with the tracked biolife file (the life unit ids of the cells)
+                write_json(grid.to_structure(), f"{self.map_json_file}.compact")
+                replace.append([f"{self.map_json_file}.compact", self.map_json_file])
+
+            # 3. Commit:
+            manifest = {
+                "replace": replace,
+                "segments": [self.segment_file(number) for number in segments],
+                "source": [self.map_file, self.map_json_file] if self.map_json_file is not None else None,
+            }
+            write_json(manifest, self.manifest_file)
+            self.commit(manifest)
+            self.committed = True
+            print(f"Journal compacted into {', '.join(repr(target) for _, target in replace)} "
+                  f"({len(segments)} segments).")
+
+        except Exception as e:
+            print(f"Journal compaction FAILED: {e}")
+
+    def commit(self, manifest: dict):
+        """ Replaces the base files and deletes the compacted segments. Can be repeated (after a crash). """
+        for source, target in manifest["replace"]:
+            if os.path.isfile(source):
+                os.replace(source, target)
+        if manifest.get("source"):
+            # The binary map and the json map have the same cells again (see mapfile.binary_is_stale)
+            write_source(*manifest["source"])
+        for segment_file in manifest["segments"]:
+            if os.path.isfile(segment_file):
+                os.remove(segment_file)
+        os.remove(self.manifest_file)
+
+    def close(self):
+        """ Drops the unsaved edits (as on exit without saving), compacts the saved ones into the base files, and
+            stops the threads.
+        """
+        self.discard()
+        self.settle()
+        if self.segments():
+            self.compact(wait=True)
+        if self.writer is not None and self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join()
+        self.writer = None
@@ -0,0 +1,84 @@
+"""
+Spatial index of the life units: a uniform grid of buckets, over the map pixels.
+
+The life units were found from the population of the map cells (see MapGrid.population): Physics.apply built
+a list of LifeUnits for every cell of its range, on every tick, and tested a unit once per populated cell. Here
+every unit is kept in the buckets under its rect (BioLifeSettings.INDEX_BUCKET_SIZE px), and a rect query
+returns every unit, whose rect meets the rect, only once.
+
+The index keeps the LifeUnit objects, not their ids in the life list, so a deleted unit does not shift the others.
+It is updated by BioLife on load, add and delete of the units.
+
+    index.query(rect)           # the units, whose rect meets the rect (map pixels), in the life list order
+    index.query_point((x, y))   # the units under the point
+"""
+import pygame as pg
+
+from settings import BioLifeSettings
+
+
+class LifeIndex:
+
+    def __init__(self, bucket_size=BioLifeSettings.INDEX_BUCKET_SIZE):
+        self.bucket_size = bucket_size
+        self.buckets = {}  # {(bucket_col, bucket_row): [LifeUnit, ...]}. Only the buckets with units.
+        self.unit_buckets = {}  # {id(LifeUnit): (col_start, row_start, col_end, row_end)}, end indexes included.
+
+    def bucket_range(self, rect: pg.Rect) -> tuple:
+        size = self.bucket_size
+        return (rect.left // size, rect.top // size,
+                (rect.right - 1) // size, (rect.bottom - 1) // size)
+
+    @staticmethod
+    def unit_rect(unit) -> pg.Rect:
+        return pg.Rect(unit.left, unit.top, unit.width, unit.height)
+
+    # --- UPDATE ---
+
+    def clear(self):
+        self.buckets.clear()
+        self.unit_buckets.clear()
+
+    def rebuild(self, units: list):
+        self.clear()
+        for unit in units:
+            self.insert(unit)
+
+    def insert(self, unit):
+        col_start, row_start, col_end, row_end = self.bucket_range(self.unit_rect(unit))
+        for row in range(row_start, row_end + 1):
+            for col in range(col_start, col_end + 1):
+                self.buckets.setdefault((col, row), []).append(unit)
+        self.unit_buckets[id(unit)] = (col_start, row_start, col_end, row_end)
+
+    def remove(self, unit):
+        bucket_range = self.unit_buckets.pop(id(unit), None)
+        if bucket_range is None:
+            return
+        col_start, row_start, col_end, row_end = bucket_range
+        for row in range(row_start, row_end + 1):
+            for col in range(col_start, col_end + 1):
+                bucket = self.buckets[(col, row)]
+                bucket.remove(unit)
+                if not bucket:
+                    del self.buckets[(col, row)]
+
+    # --- QUERY ---
+
+    def query(self, rect) -> list:
+        """ The units, whose rect meets the rect (map pixels). Every unit once, in the life list order. """
+        rect = pg.Rect(rect)
+        if rect.width <= 0 or rect.height <= 0:
+            return []
+        col_start, row_start, col_end, row_end = self.bucket_range(rect)
+
+        found = {}
+        for row in range(row_start, row_end + 1):
+            for col in range(col_start, col_end + 1):
+                for unit in self.buckets.get((col, row), ()):
+                    if id(unit) not in found and rect.colliderect(unit.left, unit.top, unit.width, unit.height):
+                        found[id(unit)] = unit
+        return sorted(found.values(), key=lambda unit: unit.id)
+
+    def query_point(self, point) -> list:
+        return self.query((point[0], point[1], 1, 1))
@@ -1,21 +1,39 @@
 import os
 from sys import exit as sys_exit
 import time
-import psutil
+import random
+import argparse
 
-import pygame as pg
-
-import threading
+imports_start = time.perf_counter()
 
-from settings import ScreenSettings, EnvironmentProps, FileLocations as files, ColorPalette as clr
-from dbase import ImgLibrary
+import pygame as pg
+from settings import ScreenSettings, RenderSettings, EnvironmentProps, ProfilerSettings, TelemetrySettings, FileLocations as files, ColorPalette as clr
+from tools import Tools
+from profiler import FrameProfiler, StartupTimeline
+
+# Import time of every subsystem, shown with '--startup-report' (like 'python -X importtime', but per subsystem).
+import_timeline = StartupTimeline(start=imports_start)
+import_timeline.lap("pygame, settings, profiler")
+from assets import load_image_library
+import_timeline.lap("dbase, assets")
 from controller import JoyStick, HandWatch
+import_timeline.lap("controller")
 from map import Map, MapEditor, BiolifeEditor
+import_timeline.lap("map")
 from interface import InfoService, Gauger, Pointer, Terminal
+from minimap import MiniMap
+import_timeline.lap("interface")
+from replay import InputRecorder
+from telemetry import Telemetry, StaticProvider, create_provider
+from render import DirtyRenderer
+from journal import EditJournal
+import_timeline.lap("replay, telemetry, render")
 
 from submarine import Sub20
+import_timeline.lap("submarine")
 
 from biosphere import Water, Air, BioLife
+import_timeline.lap("biosphere")
 
 # Fix the issue of pygame 'wayland not available'.
 # If this does not fix, logout and login via x11 (Ubuntu on Xorg).
@@ -24,37 +42,102 @@ from biosphere import Water, Air, BioLife
 
 class Engine:
     """Care only for displaying the objects on the screen.
+        - headless=True builds the engine without a real display (SDL dummy driver, no fullscreen,
+          no HandWatch camera, no telemetry thread). Used by the headless runner (see 'headless.py').
+        - seed: seeds the random module, so the randomised environment (water temperature...) can be reproduced.
+          A random seed is picked when None. Reduced to 32 bits (the replay header field) and kept in self.seed
+          for the input recorder (see 'replay.py').
+        - world: already loaded image library, map and biolife (see farm.World). Used instead of loading
+          them from the files, so many engines can share them.
     """
-    def __init__(self):
+    def __init__(self, headless=False, seed=None, world=None):
+        self.headless = headless
+
+        # -- startup timeline --
+        # Every subsystem records its initialisation time. Printed after the first frame with '--startup-report'.
+        self.startup = StartupTimeline()
+        self.show_startup_report = False
+
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seed = seed % 2 ** 32
+        random.seed(self.seed)
+
+        # -- input recorder --
+        # When set (see start_recording()), every input applied to the simulation is written to a log.
+        self.recorder = None
+
+        # -- profiler --
+        # Records the duration of every update / draw stage (see profiler.py). Toggled with the 'f' key.
+        self.profiler = FrameProfiler()
+        self.last_profiler_info = 0
+
+        if self.headless:
+            # Note: The dummy drivers must be set before pg.init(), otherwise SDL opens the real display.
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            os.environ['SDL_AUDIODRIVER'] = 'dummy'
+
         pg.init()
 
         # -- display --
-        monitor_size = (pg.display.Info().current_w, pg.display.Info().current_h)
+        if self.headless:
+            monitor_size = ScreenSettings.MONITOR_DEFAULT
+        else:
+            monitor_size = (pg.display.Info().current_w, pg.display.Info().current_h)
         scale_factor = ScreenSettings.SCALE_FACTOR
         self.width = monitor_size[0] // scale_factor
         self.height = monitor_size[1] // scale_factor
 
-        self.display = pg.display.set_mode((self.width, self.height), pg.FULLSCREEN)
+        if self.headless:
+            self.display = pg.display.set_mode((self.width, self.height))
+        else:
+            self.display = pg.display.set_mode((self.width, self.height), pg.FULLSCREEN)
         pg.display.set_caption(f"subColony v.0.7")
 
+        # "full" or "dirty" (only the damaged regions are redrawn, see render.py). Toggled with the 'd' key.
+        self.render_mode = RenderSettings.MODE
+        self.renderer = DirtyRenderer(self)
+        self.last_render_info = 0
+        self.startup.lap("pygame, display")
+
         self.scroll_x = 0
         self.scroll_y = 0
         self.scroll_speed = ScreenSettings.SCROLL_SPEED
 
+        # Scroll before the last simulation tick. Used to interpolate the drawn view between ticks.
+        self.prev_scroll = (0, 0)
+
+        # -- simulation time --
+        # The simulation runs on a fixed timestep (see run()), so its time is counted in ticks.
+        # Every timer in the simulation (animations, intervals...) must use self.sim_time instead of the wall-clock.
+        self.sim_tick = 0
+        self.tick_duration = 1 / ScreenSettings.SIM_RATE  # in seconds
+
         # -- image library --
         # It contains all the visual elements (pygame images)
-        self.image_library = ImgLibrary()
+        if world is not None:
+            self.image_library = world.image_library
+        else:
+            self.image_library = load_image_library()
+        self.startup.lap("image library")
 
         # -- controls --
         self.joystick = JoyStick()
         # self.mouse = Mouse(self)
-
+        self.startup.lap("controls")
 
         # -- map --
         self.map = Map(self)
         # self.mapeditor = MapEditor(self)
         self.mapeditor = MapEditor(self)
         self.biolife_editor = BiolifeEditor(self)
+        # Note: The editors build their tool palettes on the first open_panel() only.
+
+        # Every edit is recorded in the journal. Saving writes and compacts it into the files (see journal.py)
+        self.journal = EditJournal(MapEditor.FILE_TO_SAVE, MapEditor.JSON_FILE, BiolifeEditor.FILE_TO_SAVE)
+        self.saved_pages = None  # The edited pages of the paged map at the last compaction (see check_journal_commit)
+        self.reload_pending = False  # 'o' while compacting: the saved world is loaded after it (see discard_edits)
+        self.startup.lap("map, editors")
 
         # -- Ecosystem --
         self.seawater_deep = Water(self, EnvironmentProps.SEAWATER_DEEP, f"{files.WATER_IMAGES}water_deep.png", 1)
@@ -66,6 +149,7 @@ class Engine:
         # TODO: 3. Collision of the submerged object is check with every water in the list
         # Note: shallow_water neet to be init before air, in order to use shallow-water mask.
         self.air = Air(self)
+        self.startup.lap("ecosystem")
 
         # -- Biosphere --
         self.biolife = BioLife(self)
@@ -73,6 +157,7 @@ class Engine:
 
         # -- submarine --
         self.sub = Sub20(self)
+        self.startup.lap("submarine")
 
         # -- interface --
         self.info_service = InfoService(self)
@@ -85,20 +170,112 @@ class Engine:
 
         self.terminal = Terminal(self)
 
+        # Overview of the whole map, from the map pyramid ('n' key, see minimap.py)
+        self.minimap = MiniMap(self)
+        self.startup.lap("interface")
+
         # -- system --
-        self.system_info = ""
-        self.system_temp = 0
+        # Headless, the telemetry is static (deterministic) and sampled once. Otherwise, sampled in its own thread.
+        if self.headless:
+            self.telemetry = Telemetry(StaticProvider())
+            self.telemetry.sample()
+        else:
+            self.telemetry = Telemetry(create_provider())
+            self.telemetry.start()
+        self.last_system_info = 0
+
+        self.sim_system_temp = 0  # Latched once per tick from the telemetry. The simulation uses this one only.
+        self.startup.lap("telemetry")
 
         self.clock = pg.time.Clock()
         self.is_running = True
 
-        self.thread = threading.Thread(target=self.get_system_info_thread)
-        self.thread.start()
+        if world is not None:
+            # Note: The map grid and the structures built from it are shared, not copied. Read-only (no editors).
+            self.map.set_grid(world.map.grid, shared=world.map)
+            self.biolife.load_from_data(world.biolife_data)
+        else:
+            self.load_saved_world()
+        self.startup.lap("map, biolife data")
+
+        # The HandWatch (camera and vision stack) is created on the first 'h' key press (see handle_key_up()).
+        # Note: No camera in headless mode. Every use of handwatch checks for None.
+        self.handwatch = None
+
+    def load_saved_world(self):
+        """ Loads the map and the biolife files, with the edits of the journal on them (see journal.py).
+            Note: The edits are applied on the grid before the map is built from it, so it is built once.
+        """
+        start = time.perf_counter()
+        try:
+            grid, life_addresses, edits = self.journal.load(load_grid=self.map.read_grid)
+        except Exception as e:
+            self.print_to_editors(f"Loading Map from file FAILED: {e}")
+            return
+
+        self.map.set_grid(grid)
+        self.print_to_editors(f"Map structure Loaded successfully ({(time.perf_counter() - start) * 1000:.1f} ms).")
+        self.print_to_editors(self.biolife.load_from_data(life_addresses))
+        if edits:
+            self.print_to_editors(f"{edits} edits applied from the journal.")
+        if self.journal.unsaved:
+            self.print_to_editors(f"{self.journal.unsaved} unsaved edits recovered from the journal. "
+                                  f"Saved with 's', dropped with 'o'.")
+        # Note: The files have all the compacted edits now, the new grid has no edited pages.
+        self.journal.take_commit()
+        self.saved_pages = None
+
+    def save_edits(self):
+        # The commit of the last compaction first, so its pages are not mixed up with the pages of a new one.
+        self.check_journal_commit()
+        compactions = self.journal.compactions
+        result = self.journal.save()
+        if self.journal.compactions != compactions and self.map.grid.paged:
+            # The pages edited until now are in the map file after the compaction (see check_journal_commit)
+            self.saved_pages = self.map.grid.snapshot_edited()
+        self.print_to_editors(result)
+
+    def check_journal_commit(self):
+        """ After a compaction, the edited pages of the paged map are in the map file. They can be dropped again.
+            Note: Polled every tick. The compactor is never waited for here.
+        """
+        if self.journal.take_commit() and self.map.grid.paged and self.saved_pages is not None:
+            self.map.grid.saved(MapEditor.FILE_TO_SAVE, self.saved_pages)
+            self.saved_pages = None
+        if self.reload_pending and not self.journal.compacting():
+            self.reload_pending = False
+            self.load_saved_world()
+
+    def discard_edits(self):
+        """ Drops the unsaved edits, and loads the saved world again.
+            Note: While compacting, the base files are being replaced. The world is loaded after it.
+        """
+        edits = self.journal.discard()
+        self.print_to_editors(f"{edits} unsaved edits dropped." if edits else "No unsaved edits.")
+        if self.journal.compacting():
+            self.reload_pending = True
+            self.print_to_editors("The saved world is loaded after the compaction...")
+        else:
+            self.load_saved_world()
+
+    def print_to_editors(self, result):
+        print(result)
+        for editor in (self.mapeditor, self.biolife_editor):
+            if editor.active:
+                editor.print_to_terminal(result)
+
+    def start_recording(self, filename: str):
+        self.recorder = InputRecorder(filename, self.seed, self.joystick.success)
 
-        self.mapeditor.load_map()
-        self.biolife_editor.load_biolife()
+    def stop_recording(self):
+        if self.recorder is not None:
+            print(self.recorder.close(self.sim_tick, self.sub.state_hash()))
+            self.recorder = None
 
-        self.handwatch = HandWatch(self)
+    @property
+    def sim_time(self):
+        """ Simulation time in milliseconds. Same unit as pg.time.get_ticks(). """
+        return int(self.sim_tick * self.tick_duration * 1000)
 
     def scroll(self, direction: tuple):
         """ Scroll the screen to a direction:
@@ -127,8 +304,13 @@ class Engine:
             if event.type == pg.QUIT or (event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE):
                 self.is_running = False
 
+            if event.type in (pg.VIDEOEXPOSE, pg.WINDOWEXPOSED):
+                self.renderer.invalidate()
+
             if event.type in self.joystick.valid_events and self.joystick.success:
                 self.joystick.event_decode(event)
+                if self.recorder is not None:
+                    self.recorder.record_joystick(self.sim_tick, event)
 
             # -- mouse click --
             if event.type == pg.MOUSEBUTTONDOWN:
@@ -168,55 +350,76 @@ class Engine:
                     # self.mouse.right_up(mouse_pos)
                     ...
 
-            # -show/hide mapeditor tool pallette when pressing "m" button:
             if event.type == pg.KEYUP:
-                if event.key == pg.K_m:
-                    if self.mapeditor.active:
-                        self.mapeditor.close_panel()
-                    else:
-                        self.mapeditor.open_panel()
-
-                elif event.key == pg.K_b:
-                    # Show / Hide BioLife Editor:
-                    # TODO do this with props in biolife editor.
-                    if self.biolife_editor.active:
-                        self.biolife_editor.close_panel()
-                    else:
-                        self.biolife_editor.open_panel()
-
-                elif event.key == pg.K_s:
-                    # Note: save both files together. Important to keep life_unit indexes on track
-                    if self.mapeditor.active or self.biolife_editor.active:
-                        self.mapeditor.save_map()
-                        self.biolife_editor.save_biolife()
-
-                elif event.key == pg.K_o:
-                    if self.mapeditor.active or self.biolife_editor.active:
-                        self.mapeditor.load_map()
-                        self.biolife_editor.load_biolife()
-
-                elif event.key == pg.K_p:
-                    self.pointer.active = not self.pointer.active
-
-                elif event.key == pg.K_r:
-                    self.sub.reset_position()
-
-                elif event.key == pg.K_h:
-                    self.handwatch.active = not self.handwatch.active
-
-                # elif event.key == pg.K_z:
-                #     self.biolife.map_correct()
-
-    def get_system_info_thread(self):
-        while self.is_running:
-            self.system_temp = psutil.sensors_temperatures()['center_thermal'][0].current
-            self.system_info = f"[{self.clock.get_fps():.1f} fps.] | CPU: {psutil.cpu_percent(interval=1):.1f} % | {self.system_temp:.2f} °C | MEMORY: {psutil.virtual_memory().percent:.1f} %"
-            # print(self.system_info)
-            self.info_service.update_item(0, self.system_info)
+                if self.recorder is not None:
+                    self.recorder.record_key_up(self.sim_tick, event.key)
+                self.handle_key_up(event.key)
+
+    def handle_key_up(self, key):
+        """ Keyboard controls. Note: Called by the input replay too (see 'replay.py'). """
+        # -show/hide mapeditor tool pallette when pressing "m" button:
+        if key == pg.K_m:
+            if self.mapeditor.active:
+                self.mapeditor.close_panel()
+            else:
+                self.mapeditor.open_panel()
+
+        elif key == pg.K_b:
+            # Show / Hide BioLife Editor:
+            # TODO do this with props in biolife editor.
+            if self.biolife_editor.active:
+                self.biolife_editor.close_panel()
+            else:
+                self.biolife_editor.open_panel()
+
+        elif key == pg.K_s:
+            # Note: The edits of both editors are in one journal, so the life_unit indexes stay on track.
+            if self.mapeditor.active or self.biolife_editor.active:
+                self.save_edits()
+
+        elif key == pg.K_o:
+            if self.mapeditor.active or self.biolife_editor.active:
+                self.discard_edits()
 
-            time.sleep(1)
+        elif key == pg.K_a:
+            if self.mapeditor.active:
+                self.mapeditor.toggle_autotile()
 
-        print("System Info Thread stopped successfully.")
+        elif key == pg.K_n:
+            self.minimap.toggle()
+
+        elif key == pg.K_p:
+            self.pointer.active = not self.pointer.active
+
+        elif key == pg.K_r:
+            self.sub.reset_position()
+
+        elif key == pg.K_h:
+            if self.handwatch is None and not self.headless:
+                self.handwatch = HandWatch(self)
+            if self.handwatch is not None:
+                self.handwatch.active = not self.handwatch.active
+
+        elif key == pg.K_f:
+            self.profiler.enabled = not self.profiler.enabled
+            if not self.profiler.enabled:
+                self.info_service.update_item(ProfilerSettings.INFO_ITEM, "")
+
+        elif key == pg.K_d:
+            self.render_mode = "full" if self.render_mode == "dirty" else "dirty"
+            self.renderer.invalidate()
+            if self.render_mode == "full":
+                self.info_service.update_item(RenderSettings.INFO_ITEM, "")
+
+        # elif key == pg.K_z:
+        #     self.biolife.map_correct()
+
+    def update_system_info(self):
+        """ Shows the latest telemetry on the InfoService line, every TelemetrySettings.INFO_INTERVAL ms. """
+        time_now = pg.time.get_ticks()
+        if time_now - self.last_system_info > TelemetrySettings.INFO_INTERVAL:
+            self.info_service.update_item(TelemetrySettings.INFO_ITEM, self.telemetry.info_line(self.clock.get_fps()))
+            self.last_system_info = time_now
 
     # def update_sub_info_data(self):
     #     time_now = pg.time.get_ticks()
@@ -233,11 +436,19 @@ class Engine:
     #         self.last_info_update = time_now
 
     def update(self):
-        pg.display.flip()
-        # dt = self.clock.tick() / 1000
-        self.clock.tick(ScreenSettings.FPS)
+        """ Advance the simulation by one tick.
+            Note: Flipping the display and the FPS limit are done in run(), so the headless runner
+            can step the simulation without drawing and without the 60 ticks/s cap.
+        """
+        self.prev_scroll = (self.scroll_x, self.scroll_y)
+
+        # The system temperature comes from the telemetry thread. It is latched here, so it changes between ticks only.
+        self.sim_system_temp = self.telemetry.latest("cpu-temp", default=TelemetrySettings.DEFAULT_TEMP)
+        if self.recorder is not None:
+            self.recorder.record_system_temp(self.sim_tick, self.sim_system_temp)
 
-        # pg.display.set_caption(f"subColony v.0.7")
+        lap = self.profiler.lap
+        self.profiler.start_frame()
 
         if self.joystick.success:
             if not self.joystick.autoscroll_on:
@@ -253,42 +464,82 @@ class Engine:
         self.mapeditor.drag_drop()
 
         self.biolife_editor.update()
+        self.check_journal_commit()
+        lap("editors.update")
 
         self.seawater_deep.update()
         self.seawater_shallow.update()
         self.air.update()
+        lap("water.update")
 
         self.biolife.update()
+        lap("biolife.update")
 
         self.sub.update()
+        lap("sub.update")
+
+        self.map.update()
+        lap("map.update")
+        # Note: Physics.apply is recorded separately, from inside the sub update (see Sub20.move).
 
         # self.update_sub_info_data()
         self.gauger.update()
+        lap("gauger.update")
 
         self.pointer.update()
+        lap("pointer.update")
+
+        self.minimap.update()
+        lap("minimap.update")
 
-        if self.handwatch.success and self.handwatch.active:
+        if self.handwatch is not None and self.handwatch.success and self.handwatch.active:
             self.handwatch.update()
+        lap("handwatch.update")
 
         self.terminal.update()
+        lap("terminal.update")
+
+        self.profiler.end_frame("update.total")
+
+        self.sim_tick += 1
+
+    def draw(self, alpha=1.0):
+        """ alpha: fraction of the next simulation tick already elapsed (0 to 1).
+            The view (scroll) and the sub are drawn interpolated between the last two simulation ticks.
+        """
+        # The interpolated scroll is used for drawing only. The simulated scroll is restored at the end.
+        sim_scroll = (self.scroll_x, self.scroll_y)
+        self.scroll_x, self.scroll_y = self.draw_scroll(alpha)
+
+        lap = self.profiler.lap
+        self.profiler.start_frame()
 
-    def draw(self):
         self.display.fill(clr.BLACK)
 
         self.seawater_shallow.draw()
         self.seawater_deep.draw()
         # self.air.debug_draw()
+        lap("water.draw")
 
         self.map.draw()
+        lap("map.draw")
 
         self.biolife.draw()
+        lap("biolife.draw")
 
-        self.sub.draw()
+        self.sub.draw(alpha)
         # self.sub.visualize_interaction()
+        lap("sub.draw")
 
         self.info_service.draw()
         # self.info_service.draw_system_only()
+        lap("info.draw")
+
         self.gauger.draw()
+        lap("gauger.draw")
+
+        self.minimap.draw()
+        lap("minimap.draw")
 
         mouse_pos = pg.mouse.get_pos()
         self.mapeditor.draw(mouse_pos)
@@ -296,27 +547,117 @@ class Engine:
 
         # self.mapeditor.mouse_draw(mouse_pos)
         # self.biolife_editor.mouse_draw(mouse_pos)
+        lap("editors.draw")
 
         self.pointer.draw()
+        lap("pointer.draw")
 
-        self.handwatch.draw(self.display)
+        if self.handwatch is not None:
+            self.handwatch.draw(self.display)
+        lap("handwatch.draw")
 
         self.terminal.draw()
+        lap("terminal.draw")
+
+        self.profiler.end_frame("draw.total")
+
+        self.scroll_x, self.scroll_y = sim_scroll
+
+    def draw_scroll(self, alpha):
+        """ The view scroll to draw, between the last two simulation ticks.
+            Note: On whole pixels in the dirty render mode, so the same scroll always draws the same pixels.
+        """
+        scroll_x, scroll_y = Tools.interpolate(self.prev_scroll, (self.scroll_x, self.scroll_y), alpha)
+        if self.render_mode == "dirty":
+            return round(scroll_x), round(scroll_y)
+        return scroll_x, scroll_y
+
+    def update_render_info(self):
+        """ Shows the updated screen area on the InfoService line, every RenderSettings.INFO_INTERVAL ms (dirty mode). """
+        if self.render_mode == "dirty":
+            time_now = pg.time.get_ticks()
+            if time_now - self.last_render_info > RenderSettings.INFO_INTERVAL:
+                self.info_service.update_item(RenderSettings.INFO_ITEM, self.renderer.info_line())
+                self.last_render_info = time_now
+
+    def update_profiler_info(self):
+        """ Shows the slowest stages on the InfoService line, every ProfilerSettings.INFO_INTERVAL ms. """
+        if self.profiler.enabled:
+            time_now = pg.time.get_ticks()
+            if time_now - self.last_profiler_info > ProfilerSettings.INFO_INTERVAL:
+                self.info_service.update_item(ProfilerSettings.INFO_ITEM, self.profiler.info_line())
+                self.last_profiler_info = time_now
 
     def run(self):
+        """ Fixed-timestep loop: the simulation runs ScreenSettings.SIM_RATE ticks per second,
+            independent of the render rate (ScreenSettings.FPS). The time left in the accumulator
+            is used to draw between the last two ticks.
+        """
+        max_frame_time = self.tick_duration * ScreenSettings.MAX_TICKS_PER_FRAME
+        accumulator = 0
+        last_time = time.perf_counter()
+
         while self.is_running:
+            time_now = time.perf_counter()
+            accumulator += min(time_now - last_time, max_frame_time)
+            last_time = time_now
+
             self.check_for_events()
-            self.update()
-            self.draw()
 
-        if self.thread.is_alive():
-            self.thread.join()
+            while accumulator >= self.tick_duration:
+                self.update()
+                accumulator -= self.tick_duration
 
-        self.handwatch.terminate()
-        pg.quit()
+            # Note: The info lines are updated before drawing, so the dirty renderer sees their new texts.
+            self.update_system_info()
+            self.update_profiler_info()
+            self.update_render_info()
+
+            if self.render_mode == "dirty":
+                self.renderer.render(alpha=accumulator / self.tick_duration)
+            else:
+                self.draw(alpha=accumulator / self.tick_duration)
+                pg.display.flip()
+            if self.show_startup_report:
+                self.startup.lap("first frame")
+                print(self.startup_report())
+                self.show_startup_report = False
+
+            self.clock.tick(ScreenSettings.FPS)
+
+        self.quit()
         sys_exit()
 
+    def startup_report(self) -> str:
+        time_to_first_frame = import_timeline.total + self.startup.total
+        return (f"{import_timeline.format_report('imports')}\n"
+                f"{self.startup.format_report('engine')}\n"
+                f"Time to first frame: {time_to_first_frame * 1000:.1f} ms")
+
+    def quit(self):
+        """ Stops the background threads and closes pygame. Note: self.is_running should be False already. """
+        if self.profiler.enabled and self.profiler.stages:
+            print(self.profiler.dump(ProfilerSettings.DUMP_FILE))
+
+        self.stop_recording()
+
+        self.telemetry.stop()
+        self.journal.close()
+
+        if self.handwatch is not None:
+            self.handwatch.terminate()
+        pg.quit()
+
 
 if __name__ == '__main__':
-    engine = Engine()
+    parser = argparse.ArgumentParser(description="subColony simulator.")
+    parser.add_argument("--record", metavar="FILE", help="record the session inputs, for 'replay.py'")
+    parser.add_argument("--seed", type=int, help="random seed of the simulated environment")
+    parser.add_argument("--startup-report", action="store_true", help="print the startup timeline after the first frame")
+    args = parser.parse_args()
+
+    engine = Engine(seed=args.seed)
+    engine.show_startup_report = args.startup_report
+    if args.record:
+        engine.start_recording(args.record)
     engine.run()
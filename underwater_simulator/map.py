@@ -1,6 +1,8 @@
+import os
 import random
 import textwrap
 import json
+import time
 
 from math import ceil
 
@@ -9,6 +11,15 @@ import pygame as pg
 
 from settings import MapSettings, ColorPalette as clr
 from dbase import ImgLibrary
+from grid import MapGrid, CellTypes
+from mapfile import load_grid, load_map_grid, save_map_grid, is_json, binary_is_stale
+from paging import open_paged_grid
+from chunks import MapChunks
+from rasters import EnvironmentRasters
+from collision import CollisionBitmap
+from autotile import AutoTiler
+from minimap import MapPyramid
+from cspace import ConfigurationSpace
 
 from typing import List
 
@@ -31,53 +42,118 @@ class Map:
         self.width = self.cells_x * self.cell_size
         self.height = self.cells_y * self.cell_size
 
-        self.map_structure = self.new_map(MapSettings.CELLS_X, MapSettings.CELLS_Y)
+        # Global ids of the library cells. The grid keeps the gid of every map cell (see grid.py)
+        self.cell_types = CellTypes(self.engine.image_library)
+
+        # The library cell tables, by property name. Indexed by the gid (see ImgLibrary.index_cells)
+        image_library = self.engine.image_library
+        self.cell_tables = {
+            "image": image_library.cell_images,
+            "base-img": image_library.cell_base_images,
+            "mask": image_library.cell_masks,
+            "mask-kind": image_library.cell_mask_kinds,
+            "props": image_library.cell_props,
+            "description": image_library.cell_descriptions,
+        }
+        self.grid = self.new_map(MapSettings.CELLS_X, MapSettings.CELLS_Y, self.cell_types)
+
+        # The map is drawn from pre-composited chunks of cells. Invalidated on every write on the map.
+        self.chunks = MapChunks(self)
+
+        # The cell props of the whole map, as arrays. For the region statistics (see rasters.py)
+        self.rasters = EnvironmentRasters(self)
+
+        # The cell masks of the whole map, in one bitmap. For the collision test of the sub (see collision.py)
+        self.collision = CollisionBitmap(self)
+
+        # The whole map in downsampled levels, for the minimap. Built when the minimap is shown (see minimap.py)
+        self.pyramid = MapPyramid(self)
+
+        # The colliding poses of the sub, for the pose queries. Built on demand (see cspace.py)
+        self.cspace = ConfigurationSpace(self)
 
     @staticmethod
-    def new_map(cells_x, cells_y):
-        line_len = 0
-        map_structure = []
-        for _ in range(cells_y):
-            # line = [(None, 0, 0) for _ in range(cells_x)]
-            line = [(None, 0, 0, []) for _ in range(cells_x)]
-            line_len = len(line)
-            # format: (key_feature, library_unit_index, unit_cell_index). key_feature='None' will put clear cell
-            map_structure.append(line)
-
-        print(f"New EMPTY MAP generated, {cells_x} x {cells_y} ({line_len} x {len(map_structure)}) -> last_element = {map_structure[-1][-1]} cells.")
-        return map_structure
+    def new_map(cells_x, cells_y, cell_types=None):
+        # Every cell is (key_feature, library_unit_index, unit_cell_index). key_feature='None' will put clear cell
+        grid = MapGrid(cells_x, cells_y, cell_types)
+
+        print(f"New EMPTY MAP generated, {cells_x} x {cells_y} ({grid.cells_x} x {grid.cells_y}) -> last_element = {grid.get_entry(cells_x - 1, cells_y - 1)} cells.")
+        return grid
 
     def save_to_file(self, file_to_save):
+        # Note: '.json' files are saved in the map_structure format, all others in the binary format (see mapfile.py)
         try:
-            with open(file_to_save, 'w') as file:
-                json.dump(self.map_structure, file)
-                return f"Map Saved successfully in {file_to_save}"
+            start = time.perf_counter()
+            save_map_grid(self.grid, file_to_save)
+            if self.grid.paged:
+                self.grid.saved(file_to_save)
+            return f"Map Saved successfully in {file_to_save} ({(time.perf_counter() - start) * 1000:.1f} ms)"
 
         except Exception as e:
             return f"Map save FAILED: {e}"
 
-    def load_from_file(self, file_to_load):
+    def read_grid(self, file_to_load, json_file=None) -> MapGrid:
+        """ Loads a grid from the file, paged when the binary map is large (see paging.py). The map is not changed.
+            Note: json_file is imported, when file_to_load does not exist yet or the json changed
+            (see mapfile.binary_is_stale)
+        """
+        if is_json(file_to_load) or binary_is_stale(file_to_load, json_file):
+            return load_map_grid(file_to_load, self.cell_types, json_file)
+        # Note: None when the map is small enough to be loaded whole (see MapSettings.PAGED_MAP_CELLS)
+        grid = open_paged_grid(file_to_load, self.cell_types) if os.path.isfile(file_to_load) else None
+        if grid is None:
+            grid = load_grid(file_to_load, self.cell_types)
+        return grid
+
+    def load_from_file(self, file_to_load, json_file=None):
         try:
-            with open(file_to_load, 'r') as file:
-                self.engine.map.map_structure = json.load(file)
+            start = time.perf_counter()
+            self.set_grid(self.read_grid(file_to_load, json_file))
 
-                # For testing purpouses only:
-                # found_lifes = []
-                # for row in range(self.cells_y):
-                #     for col in range(self.cells_x):
-                #         if self.engine.map.map_structure[row][col][3]:
-                #             found_lifes.append(self.engine.map.map_structure[row][col][3])
-                # print(found_lifes)
+            # For testing purpouses only:
+            # print(self.grid.population)
 
-                return "Map structure Loaded successfully."
+            return f"Map structure Loaded successfully ({(time.perf_counter() - start) * 1000:.1f} ms)."
 
         except Exception as e:
             return f"Loading Map from file FAILED: {e}"
 
+    def set_grid(self, grid: MapGrid, shared: "Map" = None):
+        """ Replaces the whole map. Everything derived from the old grid is dropped or rebuilt.
+            Note: shared is a map of the same grid (see farm.World). Its rasters and collision bitmap are used,
+            instead of building new ones. They must be used read-only then (no editors).
+        """
+        if self.grid.paged and self.grid is not grid:
+            self.grid.close()
+        self.grid = grid
+
+        self.cells_x, self.cells_y = grid.cells_x, grid.cells_y
+        self.width = self.cells_x * self.cell_size
+        self.height = self.cells_y * self.cell_size
+
+        self.chunks.clear()
+        if shared is not None:
+            self.rasters, self.collision = shared.rasters, shared.collision
+        else:
+            self.rasters.rebuild()
+            self.collision.rebuild()
+        self.pyramid.clear()
+        self.cspace.clear()
+
+    def cells_changed(self, col_start, row_start, col_end, row_end):
+        """ Called after the cells in the range (end indexes included) were written on the grid. """
+        # Only the chunks with the written cells are baked again:
+        self.chunks.invalidate(col_start, row_start, col_end, row_end)
+        self.rasters.update(col_start, row_start, col_end, row_end)
+        self.collision.update(col_start, row_start, col_end, row_end)
+        self.pyramid.update(col_start, row_start, col_end, row_end)
+        self.cspace.update(col_start, row_start, col_end, row_end)
+
     def get_cell_property(self, map_coords: tuple, property_name: str):
         """ Returns a specific attribute from the units stored in the ImgLibrary.celular_images
             In the map_coords (x, y of the map matrix) we get the "address" of the object,
             written as tuple (key_feature, unit_id, cell_id), and finds what we are looking for...
+            Note: The grid keeps the global id of the cell. Every property is one index in the library cell tables.
         """
         # finds the element from the map_elements, with index (i, j) and return its property
 
@@ -90,62 +166,29 @@ class Map:
                 # creates a list of life_unit references if any life unit populates the cell:
 
                 if property_name == "population":
-                    return [self.engine.biolife.life_list[life_index] for life_index in self.map_structure[row_index][cell_index][3]]
-
-                # 1. get the element:
-                # cell_index format: ("map-rock", 18, 9)
-                library_coords = self.map_structure[row_index][cell_index]
-                # print(f"Getting property for {library_coords}")
-                if library_coords[0] is not None:
-                    palette_key = library_coords[0]
-                    unit_id = library_coords[1]
-                    cell_id = library_coords[2]
-                    cell_object = self.engine.image_library.cellular_images[palette_key][unit_id].structure[cell_id]
-                else:
-                    cell_object = self.engine.image_library.clear_cell.structure[0]
+                    return [self.engine.biolife.life_list[life_index] for life_index in self.grid.get_population(cell_index, row_index)]
 
-                # 2. return the desired property:
-                valid_props = {
-                    "image": cell_object.image,
-                    "base-img": cell_object.base_image,
-                    "mask": cell_object.mask,
-                    "props": cell_object.props,
-                    "description": cell_object.description,
-                }
+                # 1. get the table of the property:
+                cell_table = self.cell_tables.get(property_name)
 
-
-                if property_name in valid_props.keys():
-                    return valid_props[property_name]
+                # 2. return the property of the cell:
+                if cell_table is not None:
+                    return cell_table[self.grid.gid.item(row_index, cell_index)]
 
         return None
 
     def draw(self):
-        # Note: Drawing only the cells, located in the screen area. This should optimize the code...
-
-        # 1. get the cells range only covered the screen:
-        start_row_index = int(self.engine.scroll_y // self.cell_size)
-        start_cell_index = int(self.engine.scroll_x // self.cell_size)
-        end_row_index = int((self.engine.scroll_y + self.engine.height) // self.cell_size)
-        end_cell_index = int((self.engine.scroll_x + self.engine.width) // self.cell_size)
-
-        if end_row_index >= self.cells_y - 1:
-            end_row_index = self.cells_y - 1
-
-        if end_cell_index >= self.cells_x - 1:
-            end_cell_index = self.cells_x - 1
-
-        for row_index in range(start_row_index, end_row_index + 1):
-            for cell_index in range(start_cell_index, end_cell_index + 1):
-                # img_library_coordinates = self.map_structure[row_index][cell_index]  # ("map-rock", 18, 0)
-                # cell_index is on 'x-axis', row_index is on 'y-axis'
-                cell_img = self.get_cell_property((cell_index, row_index), "image")
-                if cell_img is not None:
-                    cell_pos_x = (cell_index * self.cell_size) - self.engine.scroll_x
-                    cell_pos_y = (row_index * self.cell_size) - self.engine.scroll_y
-                    self.engine.display.blit(cell_img, (cell_pos_x, cell_pos_y))
-
-    def update(self, display_parameters):
-        ...
+        # Note: Drawing only the chunks, located in the screen area (see chunks.py).
+        # Note: the display clip area is the whole screen, unless the dirty renderer draws a part of it (see render.py)
+        self.chunks.draw(self.engine.display, self.engine.scroll_x, self.engine.scroll_y)
+
+    def update(self):
+        """ Called every tick. A paged map keeps the regions around the view and the sub in memory (see paging.py) """
+        if self.grid.paged:
+            sub = self.engine.sub
+            velocity = (sub.pos_x - sub.prev_pos[0], sub.pos_y - sub.prev_pos[1])
+            self.grid.update_focus((self.engine.scroll_x, self.engine.scroll_y, self.engine.width, self.engine.height),
+                                   (sub.pos_x, sub.pos_y), velocity)
 
 
 class EditorPanel:
@@ -533,7 +576,8 @@ class MapEditor(EditorPanel):
 
     TOOLPANEL_TOP_CORRECTION = -10
 
-    FILE_TO_SAVE = 'save/map-data.json'
+    FILE_TO_SAVE = MapSettings.MAP_FILE
+    JSON_FILE = MapSettings.MAP_JSON_FILE  # Imported, when the binary map is missing or the json changed
 
     def __init__(self, engine):
         self.engine = engine
@@ -549,18 +593,18 @@ class MapEditor(EditorPanel):
             main_menu_labels=main_menu_labels
         )
 
-        # 3. Create a library of all tool_buttons, sorted by 'key_feature':
-        self.tools_library = self.create_tools_library()
+        # 3. The library of all tool_buttons (sorted by 'key_feature') and the panel are created on the first
+        #    open_panel(). Most of the sessions never open the editor, so they are not built on startup.
+        self.tools_library = None
 
         # 4. Select the first library by default:
         self.selected_key:str = main_menu_labels[0]
 
-        self.loaded_palette:List[MapEditorButton] = self.tools_library[self.selected_key]
+        self.loaded_palette:List[MapEditorButton] = None
         # Note: every time a palette is selected, the list is filled with buttons
 
-        # 5. Create the panel, with size depending the tools count:
-        tools_count = len(self.loaded_palette)
-        self.reload_panel(tools_count, self.selected_key)
+        self.autotile = MapSettings.AUTOTILE
+        self._autotiler = None
 
         # self.selected_tool = None
         # Note: self.selected_tool is moved to the parent class, so to become None when panel closes.
@@ -599,6 +643,10 @@ class MapEditor(EditorPanel):
         return tool_library
 
     def open_panel(self):
+        if self.tools_library is None:
+            self.tools_library = self.create_tools_library()
+            self.loaded_palette = self.tools_library[self.selected_key]
+
         tools_count = len(self.loaded_palette)
         self.reload_panel(tools_count, self.selected_key)
         self.active = True
@@ -654,30 +702,44 @@ class MapEditor(EditorPanel):
             delta_col = 0
             for row in structure_map:
                 for unit_address in row:
-                    self.engine.map.map_structure[int(cell_row + delta_row)][int(cell_col + delta_col)] = unit_address
+                    self.engine.map.grid.set_entry(int(cell_col + delta_col), int(cell_row + delta_row), unit_address)
                     # unit_address structure: ("map-rock", 18,0)
                     delta_col += 1
                 delta_col = 0
                 delta_row += 1
 
+            changed = (int(cell_col), int(cell_row),
+                       int(cell_col) + len(structure_map[0]) - 1, int(cell_row) + len(structure_map) - 1)
+            cells = structure_map
+
+            # A single rock cell (or a clear cell) gets the tile of its neighbours, and so do the cells around it:
+            if self.autotile and len(structure_map) == 1 and len(structure_map[0]) == 1 \
+                    and structure_map[0][0][0] in (self.autotiler.palette, None):
+                grid = self.engine.map.grid
+                changed = self.autotiler.retile(grid, *changed)
+                # Note: With the population, as the written structure_map cells replaced it (see MapGrid.set_entry)
+                cells = [[grid.get_entry(col, row) for col in range(changed[0], changed[2] + 1)]
+                         for row in range(changed[1], changed[3] + 1)]
+
+            self.engine.map.cells_changed(*changed)
+            self.engine.journal.record({"op": "cells", "col": changed[0], "row": changed[1], "cells": cells})
+
+    @property
+    def autotiler(self) -> AutoTiler:
+        # Note: Created on the first autotiled edit. Most of the sessions never edit the map.
+        if self._autotiler is None:
+            self._autotiler = AutoTiler(MapSettings.AUTOTILE_PALETTE)
+        return self._autotiler
+
+    def toggle_autotile(self):
+        self.autotile = not self.autotile
+        self.print_to_terminal(f"Autotile {'ON' if self.autotile else 'OFF'}: the '{MapSettings.AUTOTILE_PALETTE}' "
+                               f"edges are {'picked by the neighbours' if self.autotile else 'placed as selected'}.")
+
     def selected_button_up(self):
         if self.active and self.selected_tool is not None:
             self.selected_tool.btn_down = False
 
-    def save_map(self):
-        # when the key 's' pressed, and any editor_panel open, it saves all the map in file
-        result = self.engine.map.save_to_file(self.FILE_TO_SAVE)
-        print(result)
-        if self.active:
-            self.print_to_terminal(result)
-
-    def load_map(self):
-        # when the key 'o' is pressed and this or biolife panel is opened
-        result = self.engine.map.load_from_file(self.FILE_TO_SAVE)
-        print(result)
-        if self.active:
-            self.print_to_terminal(result)
-
 
     def mouse_draw(self, mouse):
         offset = (15, 15)
@@ -830,7 +892,7 @@ class BiolifeEditor(EditorPanel):
     TOOLPANEL_TOP_CORRECTION = -10
     TOOLPANEL_LEFT_CORRECTION = 3
 
-    FILE_TO_SAVE = 'save/biolife-data.json'
+    FILE_TO_SAVE = MapSettings.BIOLIFE_FILE
 
     def __init__(self, engine):
         self.engine = engine
@@ -853,17 +915,14 @@ class BiolifeEditor(EditorPanel):
             main_menu_labels=main_menu_labels
         )
 
-        # 3. Create a library of all tool_buttons, sorted by 'key_feature':
-        self.tools_library = self.create_tools_library()
+        # 3. The library of all tool_buttons (sorted by 'key_feature') and the panel are created on the first
+        #    open_panel(), like in the MapEditor.
+        self.tools_library = None
 
         # 4. Select the first library by default:
         self.selected_key: str = main_menu_labels[0]
 
-        self.loaded_palette: List[BiolifeEditorButton] = self.tools_library[self.selected_key]
-
-        # 5. Create the panel, with size depending the tools count:
-        tools_count = len(self.loaded_palette)
-        self.reload_panel(tools_count, self.selected_key)
+        self.loaded_palette: List[BiolifeEditorButton] = None
 
         self.selected_tool = None
         # it is a list of {"tool-image", "ref-id"}, stated under "bush"...
@@ -914,6 +973,10 @@ class BiolifeEditor(EditorPanel):
         return tool_library
 
     def open_panel(self):
+        if self.tools_library is None:
+            self.tools_library = self.create_tools_library()
+            self.loaded_palette = self.tools_library[self.selected_key]
+
         tools_count = len(self.loaded_palette)
         self.reload_panel(tools_count, self.selected_key)
         self.active = True
@@ -988,20 +1051,6 @@ class BiolifeEditor(EditorPanel):
         if self.active and self.selected_tool is not None:
             self.selected_tool.btn_down = False
 
-    def save_biolife(self):
-        # when the key 's' is pressed
-        result = self.engine.biolife.save_to_file(self.FILE_TO_SAVE)
-        print(result)
-        if self.active:
-            self.print_to_terminal(result)
-
-    def load_biolife(self):
-        # when the key 'o' is pressed:
-        result = self.engine.biolife.load_from_file(self.FILE_TO_SAVE)
-        print(result)
-        if self.active:
-            self.print_to_terminal(result)
-
     def update(self):
         self.drag_drop()
 
@@ -0,0 +1,306 @@
+"""
+Binary, versioned map file.
+
+The json map (a list of [key_feature, unit_id, cell_id, [life ids]] per cell) is 1.9 MB of text for 300 x 350 cells,
+and parsing it takes hundreds of ms. The binary file keeps the MapGrid arrays as they are in memory (see grid.py):
+
+    header:      magic, version, cells_x, cells_y, size of the palette table, number of population records
+    palettes:    json list of the key_features. A palette index in the file points to this list, so the map
+                 still loads when files.CELLULAR_TYPES changes its order.
+    palette:     uint8  array (cells_y x cells_x)
+    unit:        uint16 array
+    cell:        uint16 array
+    population:  int32 records (col, row, life_unit_id)
+
+Every block starts on an 8 bytes boundary. On load the file is memory-mapped (copy-on-write), and the arrays are
+created on the mapped memory, with no parsing and no copy. Only the gid array is calculated (see MapGrid.update_gid).
+The maps larger than MapSettings.PAGED_MAP_CELLS are not loaded whole: their regions are read on demand,
+by the MapFileReader (see paging.py).
+
+The json files are still read and written (lossless), by their extension. See Map.load_from_file / save_to_file.
+
+Usage (from the 'underwater_simulator' folder):
+    python mapfile.py --import save/map-data.json      # json -> MapSettings.MAP_FILE
+    python mapfile.py --export save/map-data.json      # MapSettings.MAP_FILE -> json
+    python mapfile.py                                  # info about MapSettings.MAP_FILE
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+from settings import MapSettings
+from grid import MapGrid, CellTypes
+
+
+MAGIC = b"SUBMAP"
+VERSION = 1
+HEADER = struct.Struct("<6sHIIII")  # magic, version, cells_x, cells_y, palette table size, population records
+ALIGN = 8
+
+POPULATION_DTYPE = np.dtype("<i4")  # (col, row, life_unit_id) records
+
+
+def aligned(offset: int) -> int:
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def is_json(filename) -> bool:
+    return filename.lower().endswith('.json')
+
+
+def save_grid(grid: MapGrid, filename):
+    """ Writes the grid in the binary format. Written to a temporary file first, then replaced. """
+    palette_table = json.dumps(grid.palettes).encode()
+
+    population = [(col, row, life_unit_id) for (col, row), ids in grid.population.items() for life_unit_id in ids]
+    population_array = np.array(population, dtype=POPULATION_DTYPE).reshape(-1, 3)
+
+    # Note: The arrays are written from their own memory (no copy), when they are already in the file types.
+    blocks = [palette_table,
+              np.ascontiguousarray(grid.palette, dtype=np.uint8),
+              np.ascontiguousarray(grid.unit, dtype="<u2"),
+              np.ascontiguousarray(grid.cell, dtype="<u2"),
+              population_array]
+
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, grid.cells_x, grid.cells_y, len(palette_table), len(population)))
+        for block in blocks:
+            file.write(b"\0" * (aligned(file.tell()) - file.tell()))
+            file.write(block)
+    os.replace(temp_filename, filename)
+
+
+def read_blocks(file_map):
+    """ Reads the header of a mapped map file. Returns (cells_x, cells_y, palettes, [palette, unit, cell], population).
+        The arrays are created on the mapped memory (no copy). Raises ValueError when the file is not a valid map.
+    """
+    if len(file_map) < HEADER.size:
+        raise ValueError("the map file is damaged")
+    magic, version, cells_x, cells_y, palette_table_size, population_count = HEADER.unpack_from(file_map, 0)
+    if magic != MAGIC:
+        raise ValueError("not a map file")
+    if version != VERSION:
+        raise ValueError(f"map file version {version} is not supported (expected {VERSION})")
+
+    cells_count = cells_x * cells_y
+    offset = aligned(HEADER.size)
+    palettes = json.loads(file_map[offset:offset + palette_table_size])
+    offset = aligned(offset + palette_table_size)
+
+    arrays = []
+    for dtype in (np.uint8, np.dtype("<u2"), np.dtype("<u2")):
+        size = cells_count * np.dtype(dtype).itemsize
+        if len(file_map) < offset + size:
+            raise ValueError("the map file is damaged")
+        arrays.append(np.frombuffer(file_map, dtype=dtype, count=cells_count, offset=offset).reshape(cells_y, cells_x))
+        offset = aligned(offset + size)
+
+    if len(file_map) < offset + population_count * 3 * POPULATION_DTYPE.itemsize:
+        raise ValueError("the map file is damaged")
+    population = np.frombuffer(file_map, dtype=POPULATION_DTYPE, count=population_count * 3, offset=offset)
+
+    return cells_x, cells_y, palettes, arrays, population.reshape(-1, 3)
+
+
+def palette_remap(palettes, grid: MapGrid):
+    """ Lookup table: palette index in the file -> palette index in the grid. None, when they are the same. """
+    if palettes == grid.palettes:
+        return None
+    try:
+        return np.array([grid.palette_index[key] for key in palettes], dtype=np.uint8)
+    except KeyError as e:
+        raise ValueError(f"unknown palette {e} in the map file")
+
+
+def load_grid(filename, cell_types: CellTypes = None) -> MapGrid:
+    """ Maps the binary file into a new MapGrid. Raises ValueError when the file is not a valid map. """
+    with open(filename, 'rb') as file:
+        file_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        # Note: ACCESS_COPY - the arrays can be edited (in memory only), and the file can be replaced on save.
+
+    cells_x, cells_y, palettes, arrays, population = read_blocks(file_map)
+
+    grid = MapGrid(cells_x, cells_y, cell_types, palettes=palettes[1:] if cell_types is None else None)
+    grid.palette, grid.unit, grid.cell = arrays
+
+    # The palettes of the file are re-indexed, when they are not in the same order as the grid palettes:
+    remap = palette_remap(palettes, grid)
+    if remap is not None:
+        grid.palette = remap[grid.palette]
+
+    grid.update_gid()
+
+    for col, row, life_unit_id in population.tolist():
+        grid.population.setdefault((col, row), []).append(life_unit_id)
+
+    return grid
+
+
+class MapFileReader:
+    """ Random access to the regions of a binary map file, for the paged map (see paging.py).
+        The file is memory-mapped read-only, so a region read touches only the file pages of its rows.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as file:
+            self.file_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.cells_x, self.cells_y, self.palettes, self.arrays, self.population = read_blocks(self.file_map)
+
+    @property
+    def cells_count(self) -> int:
+        return self.cells_x * self.cells_y
+
+    def read_region(self, rows: slice, cols: slice) -> list:
+        """ Copies of the [palette, unit, cell] arrays of the region, as they are in the file. """
+        return [array[rows, cols].copy() for array in self.arrays]
+
+    def read_population(self) -> dict:
+        population = {}
+        for col, row, life_unit_id in self.population.tolist():
+            population.setdefault((col, row), []).append(life_unit_id)
+        return population
+
+
+def import_json(filename, cell_types: CellTypes = None) -> MapGrid:
+    with open(filename, 'r') as file:
+        return MapGrid.from_structure(json.load(file), cell_types)
+
+
+def export_json(grid: MapGrid, filename):
+    with open(filename, 'w') as file:
+        json.dump(grid.to_structure(), file)
+
+
+def file_hash(filename) -> str:
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_file(filename) -> str:
+    """ The record of the json map, which the binary map was made from (see write_source). """
+    return f"{filename}.source"
+
+
+def write_source(filename, json_filename):
+    """ Records that the binary map and the json map have the same cells now (after an import, an export or
+        a journal compaction): the hash of the json, and the size and the mtime of the binary map, as they are.
+    """
+    stat = os.stat(filename)
+    with open(source_file(filename), 'w') as file:
+        json.dump({"json": json_filename, "json-sha256": file_hash(json_filename),
+                   "map-size": stat.st_size, "map-mtime-ns": stat.st_mtime_ns}, file)
+
+
+def binary_is_stale(filename, json_filename) -> bool:
+    """ True when the json map should be imported into the binary map: there is no binary map yet, or the json
+        changed (e.g. by a pull), and the binary map is as the last import or compaction left it (see write_source).
+        Note: A binary map, which changed too, is never replaced here. It is loaded, with a WARNING, until the json
+        is imported ('mapfile.py --import') or exported ('mapfile.py --export', or the next journal compaction).
+    """
+    if json_filename is None or not os.path.isfile(json_filename):
+        return False
+    if not os.path.isfile(filename):
+        return True
+
+    try:
+        with open(source_file(filename), 'r') as file:
+            source = json.load(file)
+    except (OSError, ValueError):
+        # A binary map from before the records. Its json is taken as the one it was made from, from now on.
+        print(f"WARNING: No record of the json map, which '{filename}' was made from. '{filename}' is loaded. "
+              f"To load '{json_filename}' instead: python mapfile.py --import {json_filename}")
+        write_source(filename, json_filename)
+        return False
+
+    if file_hash(json_filename) == source["json-sha256"]:
+        return False
+    stat = os.stat(filename)
+    if (stat.st_size, stat.st_mtime_ns) == (source["map-size"], source["map-mtime-ns"]):
+        return True
+    print(f"WARNING: Both '{json_filename}' and '{filename}' changed since '{filename}' was made. '{filename}' is "
+          f"loaded. To take '{json_filename}': python mapfile.py --import {json_filename}. To keep '{filename}': "
+          f"python mapfile.py --export {json_filename}")
+    return False
+
+
+def load_map_grid(filename, cell_types: CellTypes = None, json_filename=None) -> MapGrid:
+    """ Loads a json or a binary map, by the file extension.
+        json_filename: imported when the binary map does not exist yet, or the json changed (see binary_is_stale).
+        The imported map is saved as filename.
+    """
+    if is_json(filename):
+        return import_json(filename, cell_types)
+
+    if binary_is_stale(filename, json_filename):
+        grid = import_json(json_filename, cell_types)
+        save_grid(grid, filename)
+        write_source(filename, json_filename)
+        print(f"Map '{json_filename}' imported into '{filename}'.")
+        return grid
+
+    return load_grid(filename, cell_types)
+
+
+def save_map_grid(grid: MapGrid, filename):
+    """ Saves a json or a binary map, by the file extension. """
+    if is_json(filename):
+        export_json(grid, filename)
+    else:
+        save_grid(grid, filename)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert the map between the json and the binary format.")
+    parser.add_argument("--map", default=MapSettings.MAP_FILE, help="binary map file")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--import", dest="import_file", metavar="JSON", help="json map to convert into the binary map")
+    group.add_argument("--export", dest="export_file", metavar="JSON", help="json file to write the binary map into")
+    args = parser.parse_args()
+
+    # Note: No image library here. The palette, unit and cell arrays are converted as they are.
+    start = time.perf_counter()
+    # The json of the saved map, imported into it on load (see binary_is_stale)
+    saved_map = os.path.abspath(args.map) == os.path.abspath(MapSettings.MAP_FILE)
+    json_file = args.import_file or args.export_file
+    saved_json = saved_map and json_file and os.path.abspath(json_file) == os.path.abspath(MapSettings.MAP_JSON_FILE)
+    if args.import_file:
+        map_grid = import_json(args.import_file)
+        save_grid(map_grid, args.map)
+        if saved_json:
+            write_source(args.map, args.import_file)
+        print(f"'{args.import_file}' imported into '{args.map}'.")
+    elif args.export_file:
+        edits = 0
+        if saved_map:
+            # The saved map is the binary map, with the edits of the journal on it (see journal.py)
+            from journal import EditJournal  # Note: imported here, journal.py imports this module
+            map_grid, _, edits = EditJournal(args.map, None, MapSettings.BIOLIFE_FILE).load()
+            print(f"{edits} edits applied from the journal.")
+        else:
+            map_grid = load_grid(args.map)
+        if saved_json and edits:
+            # Note: The json would have edits, which the binary map has not. They go into both with the compaction.
+            parser.error(f"the journal has {edits} edits, not compacted into '{args.map}' yet. The compaction exports "
+                         f"them into '{args.export_file}' (save and exit the simulator).")
+        export_json(map_grid, args.export_file)
+        if saved_json:
+            write_source(args.map, args.export_file)
+        print(f"'{args.map}' exported into '{args.export_file}'.")
+    else:
+        map_grid = load_grid(args.map)
+
+    print(f"{map_grid.cells_x} x {map_grid.cells_y} cells, {len(map_grid.population)} populated cells, "
+          f"palettes: {map_grid.palettes[1:]}. Done in {(time.perf_counter() - start) * 1000:.1f} ms.")
@@ -0,0 +1,272 @@
+"""
+Mipmapped overview of the whole map, and the minimap layer drawn from it ('n' key).
+
+Only one screen of the map was seen. Scaling the 9600 x 11200 px map down every frame is far too slow, so the map
+is kept in a pyramid of small images (MapPyramid): the finest level has one pixel per 2^base x 2^base cells
+(1 px per cell on the default map, see MinimapSettings.BASE_PIXELS), and every next level is half of the previous.
+A pixel is the average color of its cells. The cell colors are the average colors of the library cell images,
+so the levels are calculated from the gid array only, with no image drawn.
+
+The colors are kept premultiplied by their coverage (the part of the cell image, which is not transparent),
+so a 2 x 2 block of pixels is averaged as it is, and the water under the map is added only when it is drawn.
+
+The pyramid is built the first time the minimap is shown. After an edit, only the pixels over the written cells
+are calculated again, on every level (see Map.cells_changed).
+
+The MiniMap shows the largest level, that fits in its box, as it is (no scaling): the minimap in the top-right
+corner, or the overview in the middle of the screen. The level surface is cached, with the life units drawn on it,
+so a frame is one blit, plus the view rect and the sub on top of it.
+"""
+import numpy as np
+import pygame as pg
+
+from settings import MinimapSettings, ColorPalette as clr
+
+
+def cell_colors(cell_images: list) -> np.ndarray:
+    """ The average color of every library cell image, premultiplied by its coverage (RGBA, uint8).
+        Indexed by the gid. The clear cell and the cells with no image are transparent.
+    """
+    colors = np.zeros((len(cell_images), 4), dtype=np.uint8)
+    for gid, image in enumerate(cell_images):
+        if gid == 0 or image is None:
+            continue
+        pixels = pg.surfarray.array3d(image).reshape(-1, 3).astype(np.float32)
+        colorkey = image.get_colorkey()
+        opaque = np.ones(len(pixels), dtype=bool) if colorkey is None else (pixels != colorkey[:3]).any(axis=1)
+        if opaque.any():
+            coverage = opaque.mean()
+            colors[gid, :3] = np.round(pixels[opaque].mean(axis=0) * coverage)
+            colors[gid, 3] = round(coverage * 255)
+    return colors
+
+
+def reduce(array: np.ndarray, factor: int) -> np.ndarray:
+    """ Averages the factor x factor blocks of pixels. The missing pixels on the edges are transparent. """
+    rows, cols = array.shape[:2]
+    padded_rows, padded_cols = -(-rows // factor) * factor, -(-cols // factor) * factor
+    if (padded_rows, padded_cols) != (rows, cols):
+        array = np.pad(array, ((0, padded_rows - rows), (0, padded_cols - cols), (0, 0)))
+
+    # Note: Summed as whole rows, then as whole columns of the blocks (a sum over the block axes is many times slower)
+    dtype = np.uint16 if factor * factor * 255 <= np.iinfo(np.uint16).max else np.uint32
+    lines = np.zeros((padded_rows // factor, padded_cols, 4), dtype=dtype)
+    for row in range(factor):
+        lines += array[row::factor]
+    blocks = np.zeros((padded_rows // factor, padded_cols // factor, 4), dtype=dtype)
+    for col in range(factor):
+        blocks += lines[:, col::factor]
+    return (blocks // (factor * factor)).astype(np.uint8)
+
+
+def cell_pixels(colors: np.ndarray, gid: np.ndarray) -> np.ndarray:
+    """ The colors of the cells (RGBA, uint8). Note: Looked up as one uint32 per cell. """
+    return colors.view(np.uint32)[:, 0][gid].view(np.uint8).reshape(gid.shape + (4,))
+
+
+class MapPyramid:
+
+    def __init__(self, game_map):
+        self.map = game_map
+        self.colors = None  # cell_colors(), calculated with the first level
+
+        self.base = 0  # the finest level has a pixel per 2^base x 2^base cells
+        self.levels = None  # [array (rows, cols, 4) uint8], from the finest. None until the minimap is shown.
+
+        self.version = 0  # incremented when the levels are built again (a new map)
+        self.dirty = []  # cell ranges (col_start, row_start, col_end, row_end) updated since the last draw
+
+    def cells_per_pixel(self, level) -> int:
+        return 2 ** (self.base + level)
+
+    def build(self):
+        """ Calculates all the levels from the map grid. """
+        if self.colors is None:
+            self.colors = cell_colors(self.map.cell_tables["image"])
+        grid = self.map.grid
+
+        self.base = 0
+        while -(-grid.cells_x // 2 ** self.base) * -(-grid.cells_y // 2 ** self.base) > MinimapSettings.BASE_PIXELS:
+            self.base += 1
+
+        # 1. The finest level, in stripes of rows (a paged map is read from its file, see paging.py):
+        factor = 2 ** self.base
+        stripe_rows = factor * max(1, MinimapSettings.BUILD_CELLS // (grid.cells_x * factor))
+        stripes = []
+        for row_start in range(0, grid.cells_y, stripe_rows):
+            gid = grid.gid[row_start:min(grid.cells_y, row_start + stripe_rows), :]
+            stripes.append(reduce(cell_pixels(self.colors, gid), factor))
+        self.levels = [np.concatenate(stripes)]
+
+        # 2. The next levels, down to the smallest minimap:
+        while max(self.levels[-1].shape[:2]) > MinimapSettings.MIN_LEVEL_SIZE:
+            self.levels.append(reduce(self.levels[-1], 2))
+
+        self.version += 1
+        self.dirty.clear()
+
+    def clear(self):
+        """ Drops the levels. Called when a new map is loaded. They are built again when the minimap is shown. """
+        self.levels = None
+        self.version += 1
+        self.dirty.clear()
+
+    def update(self, col_start, row_start, col_end, row_end):
+        """ Calculates again the pixels over the cells in the range (end indexes included), on every level. """
+        if self.levels is None:
+            return
+        grid = self.map.grid
+        col_start, row_start = max(0, col_start), max(0, row_start)
+        col_end, row_end = min(col_end, grid.cells_x - 1), min(row_end, grid.cells_y - 1)
+        if col_end < col_start or row_end < row_start:
+            return
+
+        for level, pixels in enumerate(self.levels):
+            block = self.cells_per_pixel(level)
+            rows = slice(row_start // block, row_end // block + 1)
+            cols = slice(col_start // block, col_end // block + 1)
+            if level == 0:
+                gid = grid.gid[rows.start * block:min(grid.cells_y, rows.stop * block),
+                               cols.start * block:min(grid.cells_x, cols.stop * block)]
+                pixels[rows, cols] = reduce(cell_pixels(self.colors, gid), block)
+            else:
+                below = self.levels[level - 1]
+                pixels[rows, cols] = reduce(below[rows.start * 2:rows.stop * 2, cols.start * 2:cols.stop * 2], 2)
+
+        self.dirty.append((col_start, row_start, col_end, row_end))
+
+
+class MiniMap:
+    OFF, MINIMAP, OVERVIEW = range(3)
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.pyramid = engine.map.pyramid
+
+        self.mode = self.OFF
+
+        # The level surface, with the water and the life units: (level, pyramid version, biolife changes)
+        self.surface = None
+        self.surface_key = None
+        self.level = 0
+        self.rect = pg.Rect(0, 0, 0, 0)  # the surface on the screen
+
+        self.redraws = 0  # incremented on every change of the surface (for the dirty rendering signature)
+
+    def toggle(self):
+        """ Off -> minimap -> overview -> off. """
+        self.mode = (self.mode + 1) % 3
+        self.surface = None
+
+    # --- SURFACE ---
+
+    def box(self) -> tuple:
+        width, height = self.engine.display.get_size()
+        if self.mode == self.MINIMAP:
+            return MinimapSettings.SIZE, MinimapSettings.SIZE
+        return width - 2 * MinimapSettings.OVERVIEW_MARGIN, height - 2 * MinimapSettings.OVERVIEW_MARGIN
+
+    def choose_level(self) -> int:
+        """ The largest level, that fits in the box. """
+        box_width, box_height = self.box()
+        for level, pixels in enumerate(self.pyramid.levels):
+            if pixels.shape[1] <= box_width and pixels.shape[0] <= box_height:
+                return level
+        return len(self.pyramid.levels) - 1
+
+    def water(self, level, rows: slice) -> np.ndarray:
+        """ The water color of every pixel row of the level (RGB): as the water layers are drawn, by the depth. """
+        engine = self.engine
+        depth = np.arange(rows.start, rows.stop) * (self.pyramid.cells_per_pixel(level) * engine.map.cell_size)
+        colors = np.empty((len(depth), 3), dtype=np.uint16)
+        colors[:] = clr.BLACK
+        colors[depth >= engine.seawater_shallow.props["deep"]] = clr.SHALLOW
+        colors[depth >= engine.seawater_deep.props["deep"]] = clr.DEEP
+        return colors
+
+    def compose(self, rows: slice, cols: slice) -> pg.Surface:
+        """ The pixels of the level in the range, drawn over the water. """
+        pixels = self.pyramid.levels[self.level][rows, cols]
+        water = self.water(self.level, rows)[:, None, :]
+        rgb = pixels[..., :3] + water * (255 - pixels[..., 3:].astype(np.uint16)) // 255
+        # Note: surfarray is indexed [x, y]
+        return pg.surfarray.make_surface(rgb.astype(np.uint8).transpose(1, 0, 2))
+
+    def draw_life(self, area: pg.Rect):
+        """ The life units inside the area (level pixels), on the surface. """
+        scale = self.pyramid.cells_per_pixel(self.level) * self.engine.map.cell_size
+        for unit in self.engine.biolife.life_list:
+            rect = pg.Rect(unit.left // scale, unit.top // scale,
+                           max(1, unit.width // scale), max(1, unit.height // scale))
+            if rect.colliderect(area):
+                self.surface.fill(MinimapSettings.LIFE_COLOR, rect.clip(area))
+
+    def update_surface(self):
+        """ Builds the surface of the level, or draws again its pixels over the edited cells. """
+        if self.pyramid.levels is None:
+            self.pyramid.build()
+        biolife_changes = self.engine.biolife.changes
+
+        key = (self.pyramid.version, biolife_changes, self.mode)
+        if self.surface is None or key != self.surface_key:
+            self.level = self.choose_level()
+            height, width = self.pyramid.levels[self.level].shape[:2]
+            self.surface = self.compose(slice(0, height), slice(0, width))
+            self.draw_life(self.surface.get_rect())
+            self.surface_key = key
+            self.redraws += 1
+
+        elif self.pyramid.dirty:
+            block = self.pyramid.cells_per_pixel(self.level)
+            for col_start, row_start, col_end, row_end in self.pyramid.dirty:
+                area = pg.Rect(col_start // block, row_start // block,
+                               col_end // block - col_start // block + 1, row_end // block - row_start // block + 1)
+                self.surface.blit(self.compose(slice(area.top, area.bottom), slice(area.left, area.right)), area)
+                self.draw_life(area)
+            self.redraws += 1
+
+        self.pyramid.dirty.clear()
+
+        width, height = self.engine.display.get_size()
+        self.rect = self.surface.get_rect()
+        if self.mode == self.MINIMAP:
+            self.rect.topright = (width - MinimapSettings.MARGIN, MinimapSettings.MARGIN)
+        else:
+            self.rect.center = (width // 2, height // 2)
+
+    # --- FRAME ---
+
+    def update(self):
+        if self.mode != self.OFF:
+            self.update_surface()
+        else:
+            # Nothing shows the edited cells. The surface is built again, when the minimap is shown (see toggle).
+            self.pyramid.dirty.clear()
+
+    def markers(self) -> tuple:
+        """ The view rect and the sub position, on the screen. """
+        engine = self.engine
+        scale = self.pyramid.cells_per_pixel(self.level) * engine.map.cell_size
+        width, height = engine.display.get_size()
+        view = pg.Rect(self.rect.left + int(engine.scroll_x // scale), self.rect.top + int(engine.scroll_y // scale),
+                       max(2, width // scale), max(2, height // scale))
+        sub = (self.rect.left + int(engine.sub.pos_x // scale), self.rect.top + int(engine.sub.pos_y // scale))
+        return view, sub
+
+    def signature(self):
+        """ The minimap looks the same, while this is the same (see DirtyRenderer). """
+        if self.mode == self.OFF or self.surface is None:
+            return self.mode
+        view, sub = self.markers()
+        return self.mode, self.redraws, tuple(view), sub
+
+    def draw(self):
+        if self.mode == self.OFF or self.surface is None:
+            return
+        display = self.engine.display
+        view, sub = self.markers()
+
+        display.blit(self.surface, self.rect)
+        pg.draw.rect(display, MinimapSettings.BORDER_COLOR, self.rect.inflate(2, 2), 1)
+        pg.draw.rect(display, MinimapSettings.VIEW_COLOR, view.clip(self.rect), 1)
+        pg.draw.circle(display, MinimapSettings.SUB_COLOR, sub, MinimapSettings.SUB_RADIUS)
@@ -0,0 +1,368 @@
+"""
+Paged map grid, for the maps too large to be kept in memory whole.
+
+A PagedMapGrid is a MapGrid (see grid.py) that keeps only some regions of the binary map file in memory.
+The map is split into pages of MapSettings.PAGE_CELLS x PAGE_CELLS cells. A page keeps the palette, unit,
+cell and gid arrays of its region, and the pages are loaded from the file (see mapfile.MapFileReader):
+
+    - in the background: every tick Map.update() gives the view and the sub (position and velocity) to
+      update_focus(). The pages under the view, around the sub and ahead of it on its velocity vector
+      (MapSettings.PAGE_LOOKAHEAD ticks) are queued, and a loader thread reads them from the file.
+    - on demand: a cell of a page that is not loaded yet is read at once (a page fault, counted in stats).
+
+The pages are kept in an LRU, under the memory cap MapSettings.PAGE_MEMORY_MB. The least used pages are
+dropped first, except the pages in focus and the edited pages (the file does not have their edits yet).
+
+The grid arrays (grid.palette, grid.unit, grid.cell, grid.gid) are PagedArrays. They are read and written
+like the NumPy arrays of the MapGrid, so the Map query API (get_cell_property, the chunks, the rasters, the
+editors) works the same on both grids. The population index is sparse, and is kept in memory whole.
+
+Note: Only the main thread uses and drops the pages. The loader thread only adds new pages.
+"""
+import os
+import queue
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from settings import MapSettings
+from grid import MapGrid, CellTypes
+from mapfile import MapFileReader, palette_remap
+
+PALETTE, UNIT, CELL, GID = range(4)  # the arrays of a page: [palette, unit, cell, gid]
+
+
+class PagedArray:
+    """ One array of a PagedMapGrid. Supports the uses of the MapGrid arrays:
+            array.item(row, col), array[row, col], array[row_slice, col_slice], array[...] = value
+        A region is assembled from its pages, so it is a copy, not a view. np.asarray(array) is the whole map.
+    """
+
+    def __init__(self, grid, field, dtype):
+        self.grid = grid
+        self.field = field
+        self.dtype = np.dtype(dtype)
+        self.shape = (grid.cells_y, grid.cells_x)
+        self.ndim = 2
+
+    def item(self, row, col):
+        page_cells = self.grid.page_cells
+        page = self.grid.get_page(col // page_cells, row // page_cells)
+        return page[self.field].item(row % page_cells, col % page_cells)
+
+    def index(self, key) -> tuple:
+        """ The (rows, cols) slices of the key, and if the result is a single cell / row / column. """
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        if len(key) != 2:
+            raise IndexError("a paged map array is indexed [row, col]")
+
+        slices = []
+        for index, size in zip(key, self.shape):
+            if isinstance(index, slice):
+                start, stop, step = index.indices(size)
+                if step != 1:
+                    raise IndexError("a paged map array is sliced with step 1 only")
+                slices.append(slice(start, max(start, stop)))
+            else:
+                index = int(index)
+                if index < 0:
+                    index += size
+                if not 0 <= index < size:
+                    raise IndexError(f"index {index} is out of the map (size {size})")
+                slices.append(slice(index, index + 1))
+        return slices[0], slices[1], [not isinstance(index, slice) for index in key]
+
+    def __getitem__(self, key):
+        rows, cols, single = self.index(key)
+        if single[0] and single[1]:
+            return self.dtype.type(self.item(rows.start, cols.start))
+
+        region = self.grid.read_region(self.field, rows, cols)
+        return region[0 if single[0] else slice(None), 0 if single[1] else slice(None)]
+
+    def __setitem__(self, key, value):
+        rows, cols, single = self.index(key)
+        self.grid.write_region(self.field, rows, cols, value)
+
+    def __array__(self, dtype=None, copy=None):
+        region = self[:, :]
+        return region if dtype is None else region.astype(dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def tolist(self) -> list:
+        return self[:, :].tolist()
+
+    def nonzero(self) -> tuple:
+        return np.nonzero(self[:, :])
+
+
+class PagedMapGrid(MapGrid):
+    paged = True
+
+    def __init__(self, reader: MapFileReader, cell_types: CellTypes = None, page_cells=MapSettings.PAGE_CELLS,
+                 memory_mb=MapSettings.PAGE_MEMORY_MB, lookahead=MapSettings.PAGE_LOOKAHEAD):
+        # Note: MapGrid.__init__ is not called, as it allocates the arrays of the whole map.
+        self.cells_x = reader.cells_x
+        self.cells_y = reader.cells_y
+        self.cell_types = cell_types
+
+        if cell_types is not None:
+            self.palettes = cell_types.palettes
+        else:
+            self.palettes = list(reader.palettes)
+        self.palette_index = {key: i for i, key in enumerate(self.palettes)}
+
+        # (reader, palette remap). One attribute, so the loader thread never gets a reader with the remap of another.
+        self.source = (reader, palette_remap(reader.palettes, self))
+
+        self.palette = PagedArray(self, PALETTE, np.uint8)
+        self.unit = PagedArray(self, UNIT, np.uint16)
+        self.cell = PagedArray(self, CELL, np.uint16)
+        self.gid = PagedArray(self, GID, np.uint16)
+
+        self.population = reader.read_population()
+
+        self.page_cells = page_cells
+        self.pages_x = (self.cells_x + page_cells - 1) // page_cells
+        self.pages_y = (self.cells_y + page_cells - 1) // page_cells
+        self.page_bytes = page_cells * page_cells * 7  # uint8 palette, uint16 unit, cell and gid
+        self.capacity = max(1, memory_mb * 1024 * 1024 // self.page_bytes)
+        self.lookahead = lookahead
+
+        self.pages = OrderedDict()  # {(page_col, page_row): [palette, unit, cell, gid]}. The last used at the end.
+        self.lock = threading.Lock()  # Guards the changes of self.pages (the loader thread adds pages)
+        self.last_key = None  # The page of the last item() read, to skip the LRU update on the next reads
+        self.last_page = None
+
+        self.focus = set()  # The pages around the view and the sub. Not dropped.
+        self.edited = set()  # The pages with edits, not in the file yet. Not dropped.
+        self.edited_since = set()  # The pages edited since the last snapshot_edited()
+
+        self.requested = set()  # The pages queued for the loader thread
+        self.requests = queue.Queue()
+
+        # Statistics: pages loaded in the background, loaded on demand (faults), dropped from the LRU
+        self.stats = {"prefetched": 0, "faults": 0, "evicted": 0}
+
+        self.thread = threading.Thread(target=self._loader_thread, daemon=True)
+        self.thread.start()
+
+    # --- PAGES ---
+
+    def page_bounds(self, page_col, page_row) -> tuple:
+        """ The (rows, cols) slices of the page cells. The pages on the right and the bottom edge may be smaller. """
+        row_start, col_start = page_row * self.page_cells, page_col * self.page_cells
+        return (slice(row_start, min(row_start + self.page_cells, self.cells_y)),
+                slice(col_start, min(col_start + self.page_cells, self.cells_x)))
+
+    def load_region(self, rows: slice, cols: slice) -> list:
+        """ Reads the region from the file: [palette, unit, cell, gid] """
+        reader, remap = self.source
+        palette, unit, cell = reader.read_region(rows, cols)
+        if remap is not None:
+            palette = remap[palette]
+        return [palette, unit, cell, self.calculate_gid(palette, unit, cell)]
+
+    def calculate_gid(self, palette, unit, cell) -> np.ndarray:
+        """ Like MapGrid.update_gid, on the arrays of a region. """
+        gid = np.zeros(palette.shape, dtype=np.uint16)
+        if self.cell_types is not None:
+            rows, cols = np.nonzero(palette)
+            gid[rows, cols] = self.cell_types.gid_table[palette[rows, cols], unit[rows, cols], cell[rows, cols]]
+        return gid
+
+    def get_page(self, page_col, page_row) -> list:
+        key = (page_col, page_row)
+        if key == self.last_key:
+            return self.last_page
+
+        page = self.pages.get(key)
+        if page is None:
+            if not (0 <= page_col < self.pages_x and 0 <= page_row < self.pages_y):
+                raise IndexError(f"page {key} is out of the map")
+            page = self.add_page(key, self.load_region(*self.page_bounds(page_col, page_row)))
+            self.stats["faults"] += 1
+            self.evict()
+        else:
+            with self.lock:
+                self.pages.move_to_end(key)
+
+        self.last_key, self.last_page = key, page
+        return page
+
+    def add_page(self, key, page) -> list:
+        """ Adds a loaded page. When the page was already added (by the other thread), the added one is kept. """
+        with self.lock:
+            page = self.pages.setdefault(key, page)
+            self.pages.move_to_end(key)
+        return page
+
+    def evict(self):
+        """ Drops the least used pages, over the memory cap. The pages in focus and the edited pages are kept. """
+        if len(self.pages) <= self.capacity:
+            return
+        with self.lock:
+            for key in list(self.pages):
+                if len(self.pages) <= self.capacity:
+                    break
+                if key not in self.focus and key not in self.edited:
+                    del self.pages[key]
+                    self.stats["evicted"] += 1
+                    if key == self.last_key:
+                        self.last_key = self.last_page = None
+
+    def page_keys(self, rows: slice, cols: slice) -> list:
+        return [(page_col, page_row)
+                for page_row in range(rows.start // self.page_cells, (rows.stop - 1) // self.page_cells + 1)
+                for page_col in range(cols.start // self.page_cells, (cols.stop - 1) // self.page_cells + 1)]
+
+    # --- REGIONS ---
+
+    def read_region(self, field, rows: slice, cols: slice) -> np.ndarray:
+        """ The array of the region, assembled from its pages. """
+        region = np.empty((rows.stop - rows.start, cols.stop - cols.start),
+                          dtype=np.uint8 if field == PALETTE else np.uint16)
+        if region.size == 0:
+            return region
+
+        keys = self.page_keys(rows, cols)
+        if len(keys) > self.capacity // 4:
+            # A large region (e.g. the whole map on save) is read from the file, not through the LRU.
+            # Only the edited pages are copied over it.
+            region[:] = self.load_region(rows, cols)[field]
+            keys = [key for key in keys if key in self.edited]
+
+        for page_col, page_row in keys:
+            page = self.get_page(page_col, page_row)
+            page_rows, page_cols = self.page_bounds(page_col, page_row)
+            row_start, row_stop = max(rows.start, page_rows.start), min(rows.stop, page_rows.stop)
+            col_start, col_stop = max(cols.start, page_cols.start), min(cols.stop, page_cols.stop)
+            region[row_start - rows.start:row_stop - rows.start, col_start - cols.start:col_stop - cols.start] = \
+                page[field][row_start - page_rows.start:row_stop - page_rows.start,
+                            col_start - page_cols.start:col_stop - page_cols.start]
+        return region
+
+    def write_region(self, field, rows: slice, cols: slice, value):
+        """ Writes the region on its pages. The pages are marked as edited. """
+        value = np.broadcast_to(np.asarray(value), (rows.stop - rows.start, cols.stop - cols.start))
+        for page_col, page_row in self.page_keys(rows, cols):
+            # Note: marked before the page is used, so it is not dropped when it is loaded now.
+            self.edited.add((page_col, page_row))
+            self.edited_since.add((page_col, page_row))
+            page = self.get_page(page_col, page_row)
+            page_rows, page_cols = self.page_bounds(page_col, page_row)
+            row_start, row_stop = max(rows.start, page_rows.start), min(rows.stop, page_rows.stop)
+            col_start, col_stop = max(cols.start, page_cols.start), min(cols.stop, page_cols.stop)
+            page[field][row_start - page_rows.start:row_stop - page_rows.start,
+                        col_start - page_cols.start:col_stop - page_cols.start] = \
+                value[row_start - rows.start:row_stop - rows.start, col_start - cols.start:col_stop - cols.start]
+
+    # --- FOCUS ---
+
+    def rect_pages(self, left, top, right, bottom) -> set:
+        """ The pages under the rect (map pixels), clipped to the map. """
+        page_size = self.page_cells * MapSettings.CELL_SIZE
+        start_col, start_row = max(0, int(left // page_size)), max(0, int(top // page_size))
+        end_col, end_row = min(self.pages_x - 1, int(right // page_size)), min(self.pages_y - 1, int(bottom // page_size))
+        return {(page_col, page_row) for page_row in range(start_row, end_row + 1)
+                for page_col in range(start_col, end_col + 1)}
+
+    def update_focus(self, view_rect, position, velocity):
+        """ Sets the pages to keep in memory, and queues the missing ones for the loader thread.
+            view_rect: the view (x, y, width, height in map pixels), position: the sub center (map pixels),
+            velocity: the sub (px/tick)
+        """
+        x, y, width, height = view_rect
+        margin = self.page_cells * MapSettings.CELL_SIZE // 2
+        ahead_x, ahead_y = velocity[0] * self.lookahead, velocity[1] * self.lookahead
+
+        # The view first (drawn now), then the sub, then the view and the sub moved ahead on the velocity vector.
+        needed = [self.rect_pages(x - margin, y - margin, x + width + margin, y + height + margin),
+                  self.rect_pages(position[0] - margin, position[1] - margin,
+                                  position[0] + margin, position[1] + margin),
+                  self.rect_pages(min(x, x + ahead_x) - margin, min(y, y + ahead_y) - margin,
+                                  max(x, x + ahead_x) + width + margin, max(y, y + ahead_y) + height + margin),
+                  self.rect_pages(min(position[0], position[0] + ahead_x) - margin,
+                                  min(position[1], position[1] + ahead_y) - margin,
+                                  max(position[0], position[0] + ahead_x) + margin,
+                                  max(position[1], position[1] + ahead_y) + margin)]
+
+        self.focus = set().union(*needed)
+        page_size = self.page_cells * MapSettings.CELL_SIZE
+        sub_page = (position[0] // page_size, position[1] // page_size)
+        for keys in needed:
+            for key in sorted(keys, key=lambda page: abs(page[0] - sub_page[0]) + abs(page[1] - sub_page[1])):
+                if key not in self.pages and key not in self.requested:
+                    self.requested.add(key)
+                    self.requests.put(key)
+
+        self.evict()
+
+    def _loader_thread(self):
+        while True:
+            key = self.requests.get()
+            if key is None:
+                break
+            try:
+                if key not in self.pages:
+                    self.add_page(key, self.load_region(*self.page_bounds(*key)))
+                    self.stats["prefetched"] += 1
+            except Exception as e:
+                print(f"Map page {key} load FAILED: {e}")
+            finally:
+                self.requested.discard(key)
+
+    def snapshot_edited(self) -> set:
+        """ The edited pages now. Taken when the edits are saved, for saved() after the file is written. """
+        self.edited_since.clear()
+        return set(self.edited)
+
+    def saved(self, filename, pages=None):
+        """ Called after the grid was saved. Saved into its own file, the edited pages are in the file now.
+            pages: only these pages are in the file (see snapshot_edited), the pages edited since are kept.
+        """
+        reader = self.source[0]
+        if os.path.abspath(filename) == os.path.abspath(reader.filename):
+            reader = MapFileReader(filename)
+            self.source = (reader, palette_remap(reader.palettes, self))
+            if pages is None:
+                self.edited.clear()
+            else:
+                self.edited -= pages - self.edited_since
+            self.edited_since.clear()
+
+    def close(self):
+        """ Stops the loader thread. Called when the grid is replaced by another map. """
+        if self.thread is not None and self.thread.is_alive():
+            self.requests.put(None)
+            self.thread.join()
+        self.thread = None
+
+    # --- GRID ---
+
+    def update_gid(self):
+        """ Recalculates the gid arrays of the loaded pages. The other pages get their gid on load. """
+        for page in list(self.pages.values()):
+            page[GID][:] = self.calculate_gid(page[PALETTE], page[UNIT], page[CELL])
+
+    @property
+    def nbytes(self) -> int:
+        """ Memory used by the loaded pages (the population index is not included). """
+        return len(self.pages) * self.page_bytes
+
+    def info_line(self) -> str:
+        return (f"Pages: {len(self.pages)}/{self.capacity} ({self.nbytes / 1024 / 1024:.1f} MB), "
+                f"prefetched {self.stats['prefetched']}, faults {self.stats['faults']}, "
+                f"evicted {self.stats['evicted']}, edited {len(self.edited)}")
+
+
+def open_paged_grid(filename, cell_types: CellTypes = None, paged_cells=MapSettings.PAGED_MAP_CELLS):
+    """ Opens a binary map file as a PagedMapGrid, when it has more than paged_cells cells. None otherwise. """
+    reader = MapFileReader(filename)
+    if reader.cells_count <= paged_cells:
+        return None
+    return PagedMapGrid(reader, cell_types)
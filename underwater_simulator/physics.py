@@ -1,9 +1,11 @@
 import pygame as pg
 import math
+from collections import OrderedDict
 from statistics import mean
 
 from typing import List
 from tools import Tools
+from dbase import Cell
 
 from settings import MapSettings, ColorPalette as clr
 
@@ -33,6 +35,115 @@ class ImpactCell:
         return left, top
 
 
+class RotatedMaskCache:
+    """ The collision masks of the unit contour, rotated to the headings, quantised to 'step' degrees.
+        Physics.apply rotated the contour image and scanned a new mask on every tick. Here each quantised heading
+        is rotated once and kept in an LRU of 'capacity' headings (all of them with the default settings).
+
+        The quantised masks are not the exact ones: Physics.apply tests a hull first, the union of the two quantised
+        masks around the heading, grown by 'margin' pixels (the way of the contour between them, and a pixel more).
+        Only when the hull touches something, the contour is rotated to the exact heading (see Physics.apply).
+    """
+
+    def __init__(self, image: pg.Surface, step=1.0, capacity=360, preload=False):
+        self.image = image
+        self.step = step
+        self.headings = max(1, round(360 / step))  # number of quantised headings
+        self.capacity = capacity
+
+        # The farthest contour pixel moves up to (radius * step) between two quantised headings:
+        self.margin = math.ceil(math.hypot(*image.get_size()) / 2 * math.radians(step) / 2) + 1
+
+        # {heading index: (mask, (width, height), bounds)}. The last used at the end.
+        self.entries = OrderedDict()
+        # {heading index: (mask, (width, height), bounds)} of the hull from the heading to the next one.
+        self.hulls = OrderedDict()
+        self.last_exact = (None, None)  # (heading, entry). The exact heading repeats while the unit is stuck.
+
+        # Statistics: masks rotated since the start (quantised and exact)
+        self.rotated = 0
+        self.rotated_exact = 0
+
+        if preload:
+            self.capacity = max(capacity, self.headings)
+            for index in range(self.headings):
+                self.entries[index] = self.rotate(index)
+
+    @staticmethod
+    def bounds(mask: pg.mask.Mask) -> pg.Rect:
+        """ The rect of the mask bits (the corners of a rotated image are empty). """
+        rects = mask.get_bounding_rects()
+        return rects[0].unionall(rects[1:]) if rects else pg.Rect(0, 0, 0, 0)
+
+    def rotate(self, index) -> tuple:
+        image = self.image if index == 0 else pg.transform.rotate(self.image, index * self.step)
+        mask = pg.mask.from_surface(image)
+        self.rotated += 1
+        return mask, image.get_size(), self.bounds(mask)
+
+    def get(self, heading) -> tuple:
+        """ (mask, (width, height), bounds) of the contour, rotated to the quantised heading.
+            bounds is the rect of the mask bits.
+        """
+        index = round(heading / self.step) % self.headings
+        entry = self.entries.get(index)
+        if entry is not None:
+            self.entries.move_to_end(index)
+            return entry
+
+        entry = self.rotate(index)
+        self.entries[index] = entry
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        return entry
+
+    def hull(self, heading) -> tuple:
+        """ (mask, (width, height), bounds) covering the contour rotated to any heading of the step around heading.
+            Centered as the rotated images: the contour on (left, top) is inside the hull on
+            (left - (width - contour width) // 2, top - (height - contour height) // 2), for whole left and top.
+        """
+        index = math.floor(heading / self.step) % self.headings
+        entry = self.hulls.get(index)
+        if entry is not None:
+            self.hulls.move_to_end(index)
+            return entry
+
+        masks = [self.get(index * self.step)[0], self.get((index + 1) * self.step)[0]]
+        width = max(mask.get_size()[0] for mask in masks) + 2 * self.margin
+        height = max(mask.get_size()[1] for mask in masks) + 2 * self.margin
+        union = pg.mask.Mask((width, height))
+        for mask in masks:
+            mask_width, mask_height = mask.get_size()
+            union.draw(mask, ((width - mask_width) // 2, (height - mask_height) // 2))
+        # Grown by margin pixels: first along the rows, then along the columns
+        row_grown = pg.mask.Mask((width, height))
+        hull = pg.mask.Mask((width, height))
+        for offset in range(-self.margin, self.margin + 1):
+            row_grown.draw(union, (offset, 0))
+        for offset in range(-self.margin, self.margin + 1):
+            hull.draw(row_grown, (0, offset))
+
+        entry = hull, (width, height), self.bounds(hull)
+        self.hulls[index] = entry
+        if len(self.hulls) > self.capacity:
+            self.hulls.popitem(last=False)
+        return entry
+
+    def exact(self, heading) -> tuple:
+        """ (mask, (width, height)) of the contour, rotated to the exact heading. Only the last one is kept. """
+        if self.last_exact[0] == heading:
+            return self.last_exact[1]
+        if 0 <= heading < 360 and heading / self.step == round(heading / self.step):
+            # A quantised heading: its cached mask is the exact one.
+            return self.get(heading)[:2]
+        image = self.image if heading == 0 else pg.transform.rotate(self.image, heading)
+        mask = pg.mask.from_surface(image)
+        self.rotated_exact += 1
+        entry = mask, image.get_size()
+        self.last_exact = (heading, entry)
+        return entry
+
+
 class Physics:
 
     def __init__(self, unit):
@@ -40,9 +151,17 @@ class Physics:
         # NOTE: unit can be submarine, fish, monster, etc...
         # so make sure that the callings are to a shared methods only
         self.unit = unit
+        # Note: The mask of the contour, rotated to the exact next heading. The hull of the heading on the ticks,
+        # where it touched nothing (see RotatedMaskCache.hull).
         self.next_rotated_mask = None
         self.next_rotated_rect = None
 
+        # Note: The contour masks of the headings are rotated once (see RotatedMaskCache)
+        self.rotated_masks = RotatedMaskCache(unit.contour_image_original,
+                                              step=unit.settings.MASK_HEADING_STEP,
+                                              capacity=unit.settings.MASK_CACHE_SIZE,
+                                              preload=unit.settings.MASK_CACHE_PRELOAD)
+
         # Used: engine,  center_cell_coords, pos_x, pos_y, center_mask, settings, image
 
         self.engine = self.unit.engine
@@ -75,12 +194,13 @@ class Physics:
 
         self.air_overlap_point = None
 
-    @property
-    def impact_matrix(self) -> List[List[ImpactCell]]:
-        """ Generates cells matrix with all cell data needed, in the given 'surrounding_range' """
-        impact_matrix = []
+        # Statistics of apply(), since the start: the cells visited and the mask overlaps tested (cells and life)
+        self.stats = {"cells-visited": 0, "mask-tests": 0}
 
-        # 1. Get the start cell (top-left) index and end cell (bottom-right) index of the range:
+    def impact_range(self):
+        """ Returns the (cell_start, cell_end, row_start, row_end) indexes of the physics range, around the unit.
+            The end indexes are included.
+        """
         center_cell_index_x, center_cell_index_y = self.unit.center_cell_coords
 
         cell_start_index = center_cell_index_x - (self.range[0] // 2)
@@ -98,6 +218,16 @@ class Physics:
         if row_end_index >= self.engine.map.cells_y - 1:
             row_end_index = self.engine.map.cells_y - 1
 
+        return cell_start_index, cell_end_index, row_start_index, row_end_index
+
+    @property
+    def impact_matrix(self) -> List[List[ImpactCell]]:
+        """ Generates cells matrix with all cell data needed, in the given 'surrounding_range' """
+        impact_matrix = []
+
+        # 1. Get the start cell (top-left) index and end cell (bottom-right) index of the range:
+        cell_start_index, cell_end_index, row_start_index, row_end_index = self.impact_range()
+
         # 2. Get all the cell's data and populate cells_list[] with CellImpact units:
         for row_index in range(row_start_index, row_end_index + 1):
             impact_row = []
@@ -388,12 +518,27 @@ class Physics:
         off_map = self.check_off_map(next_pos_x, next_pos_y, self.engine.map.width, self.engine.map.height)
 
         # --> 2. Prepare the unit mask and rect for check, using the next_pos coordinates and heading
-        next_rotated_img = self.unit.contour_image_original.copy()
-        if not next_heading == 0:
-            next_rotated_img = pg.transform.rotate(next_rotated_img, next_heading)
-        next_rotated_rect = next_rotated_img.get_rect()
-        self.next_rotated_mask = pg.mask.from_surface(next_rotated_img)
-        self.next_rotated_rect = next_rotated_img.get_rect()
+        # Note: The hull of the heading is tested first. When it touches no cell mask, no life unit and no air, the
+        # exact contour does not either, and it is not rotated. Near the surface, the exact mask is used for the air.
+        # The bits of the exact mask are inside the bits of the hull, so the hull bounds narrow the tests below too.
+        hull_mask, hull_size, bounds = self.rotated_masks.hull(next_heading)
+        mask_left = math.floor(next_pos_x - hull_size[0] // 2)
+        mask_top = math.floor(next_pos_y - hull_size[1] // 2)
+        bits_rect = pg.Rect(mask_left + bounds.left, mask_top + bounds.top, bounds.width + 1, bounds.height + 1)
+        life_units = self.engine.biolife.index.query(bits_rect)
+        touches_cells = self.engine.map.collision.touches(hull_mask, mask_left, mask_top)
+
+        self.next_rotated_mask, rotated_size = hull_mask, hull_size
+        contact_cells = set()
+        # Note: The sub mask is tested against the whole map first (one overlap with the world collision bitmap).
+        # Only the cells under its overlap are tested one by one. None: no bitmap, all the cells are tested.
+        if self.unit.pos_y < self.engine.air.floating_check_start_from or touches_cells or life_units:
+            self.next_rotated_mask, rotated_size = self.rotated_masks.exact(next_heading)
+            contact_cells = self.engine.map.collision.contact_cells(self.next_rotated_mask,
+                                                                    next_pos_x - rotated_size[0] // 2,
+                                                                    next_pos_y - rotated_size[1] // 2)
+        next_rotated_rect = pg.Rect((0, 0), rotated_size)
+        self.next_rotated_rect = next_rotated_rect.copy()
         self.next_rotated_rect.center = next_pos_x, next_pos_y
 
         self.cell_overlap = []
@@ -408,56 +553,73 @@ class Physics:
         # We collect list of passable and non-passable cells using this rule.
         # Then physics display only non-passable masks
 
+        # Note: Only the cells under the bits of the hull can be hit. The mask offsets are truncated, so the mask
+        # is on the floor of its left / top, or a pixel further.
         cell_start_index, row_start_index, cell_end_index, row_end_index = self.get_matrix_coords()
+        size = self.engine.map.cell_size
+        cell_start_index = max(cell_start_index, (mask_left + bounds.left) // size)
+        cell_end_index = min(cell_end_index, (mask_left + bounds.right) // size)
+        row_start_index = max(row_start_index, (mask_top + bounds.top) // size)
+        row_end_index = min(row_end_index, (mask_top + bounds.bottom) // size)
+
+        cell_tables = self.engine.map.cell_tables
+        mask_kinds, cell_masks, cell_props = cell_tables["mask-kind"], cell_tables["mask"], cell_tables["props"]
+        gid = self.engine.map.grid.gid
         for row in range(row_start_index, row_end_index + 1):
             for col in range(cell_start_index, cell_end_index + 1):
-
-                impact_cell = self.get_impact_cell(col, row)
+                self.stats["cells-visited"] += 1
+
+                # Note: The cells with an empty mask are never hit.
+                if contact_cells is not None and (col, row) not in contact_cells:
+                    continue
+                cell_gid = gid.item(row, col)
+                mask_kind = mask_kinds[cell_gid]
+                if mask_kind == Cell.MASK_EMPTY:
+                    continue
+
+                # Note: A solid cell is hit when the bits of the sub meet its rect. The rect of the hull bits is
+                # tested first, the mask overlap gives the hit point.
+                cell_coord_x, cell_coord_y = col * size, row * size
+                if mask_kind == Cell.MASK_SOLID and not bits_rect.colliderect((cell_coord_x, cell_coord_y, size, size)):
+                    continue
 
                 # -overlap with cell's mask:
-                cell_mask = impact_cell.mask
-                if cell_mask is not None:
-                    cell_coord_x, cell_coord_y = impact_cell.cell_topleft
-                    overlap = cell_mask.overlap(
-                        self.next_rotated_mask,
-                        ((next_pos_x - next_rotated_rect.width // 2) - cell_coord_x,
-                         (next_pos_y - next_rotated_rect.height // 2) - cell_coord_y)
-                    )
-                    if overlap:
-                        overlap_point = (overlap[0] + cell_coord_x, overlap[1] + cell_coord_y)
-                        cell_overlap_data = {
-                            "point": overlap_point,
-                            "props": impact_cell.props
-                        }
-
-
-
-                        # collect all cell overlaps for visualization purpouses:
-                        self.cell_overlap.append(cell_overlap_data)
-
-                # -overlap with the life units
-                if impact_cell.population:
-                    for life in impact_cell.population:
-                        overlap = life.mask.overlap(
-                            self.next_rotated_mask,
-                            ((next_pos_x - next_rotated_rect.width // 2) - life.left,
-                             (next_pos_y - next_rotated_rect.height // 2) - life.top)
-                        )
-                        if overlap:
-                            overlap_point = (overlap[0] + life.left, overlap[1] + life.top)
-                            life_overlap_data = {
-                                "id": life.id,
-                                "point": overlap_point,
-                                "props": life.props
-                                # "mask": life.mask
-                            }
-                            # collect the life data only once. This is done by saving their id's as keys in dict:
-                            # -Used because the life_unit usually covers several cells.
-                            if life.id not in self.life_overlap.keys():
-                                self.life_overlap[life.id] = life_overlap_data
-
-                # NOTE: Loop will affect all life units, both for static and for moving units.
-                # Later There will be checking the props and the impact will be applied to all units.
+                self.stats["mask-tests"] += 1
+                overlap = cell_masks[cell_gid].overlap(
+                    self.next_rotated_mask,
+                    ((next_pos_x - next_rotated_rect.width // 2) - cell_coord_x,
+                     (next_pos_y - next_rotated_rect.height // 2) - cell_coord_y)
+                )
+                if overlap:
+                    overlap_point = (overlap[0] + cell_coord_x, overlap[1] + cell_coord_y)
+                    cell_overlap_data = {
+                        "point": overlap_point,
+                        "props": cell_props[cell_gid]
+                    }
+
+                    # collect all cell overlaps for visualization purpouses:
+                    self.cell_overlap.append(cell_overlap_data)
+
+        # -overlap with the life units, whose rect meets the bits of the hull (see lifeindex.py).
+        # Every unit is tested once, in the life list order.
+        for life in life_units:
+            self.stats["mask-tests"] += 1
+            overlap = life.mask.overlap(
+                self.next_rotated_mask,
+                ((next_pos_x - next_rotated_rect.width // 2) - life.left,
+                 (next_pos_y - next_rotated_rect.height // 2) - life.top)
+            )
+            if overlap:
+                overlap_point = (overlap[0] + life.left, overlap[1] + life.top)
+                self.life_overlap[life.id] = {
+                    "id": life.id,
+                    "point": overlap_point,
+                    "props": life.props
+                    # "mask": life.mask
+                }
+
+        # NOTE: Loop will affect all life units, both for static and for moving units.
+        # Later There will be checking the props and the impact will be applied to all units.
 
         # --> 3. Calculate the TOTAL RESISTANCE from all overlap cells...
         resistance_list = [cell_data["props"]["resistance"] for cell_data in self.cell_overlap if not cell_data["props"]["passable"]]
@@ -678,7 +840,7 @@ class UnitHealth:
         self._spray_force = 0
 
         self.healing_by = "air"  # Note: this is different by different unit types.
-        self.last_hit_register = pg.time.get_ticks()
+        self.last_hit_register = self.engine.sim_time
 
 
     @property
@@ -701,10 +863,10 @@ class UnitHealth:
 
     @property
     def internal_temp(self):
-        if self._outer_temperature > self.engine.system_temp:
-            result = (self.engine.system_temp + self._outer_temperature * 1.5)/2
+        if self._outer_temperature > self.engine.sim_system_temp:
+            result = (self.engine.sim_system_temp + self._outer_temperature * 1.5)/2
         else:
-            result = (self.engine.system_temp + self._outer_temperature)/2
+            result = (self.engine.sim_system_temp + self._outer_temperature)/2
         return result
 
     @property
@@ -791,7 +953,7 @@ class UnitHealth:
     def register_hit(self, energy_added):
         """ Affects integrity. This method is called from physics, when the unit collides.
         """
-        time_now = pg.time.get_ticks()
+        time_now = self.engine.sim_time
         hit_register_interval = 1000
         # register the hit if the last register was 100 frames ago.
         # This prevents hitting on every frame, when unit is right to the wall
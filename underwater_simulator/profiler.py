@@ -0,0 +1,167 @@
+"""
+Per-stage frame-time profiler.
+
+Every stage of Engine.update() and Engine.draw() records its duration into a fixed-size ring buffer,
+so the p50 / p95 / p99 of the last ProfilerSettings.HISTORY frames can be shown at any time.
+The stages are measured as 'laps': each lap() records the time since the previous lap (or since start_frame()),
+which keeps the overhead to one perf_counter() call per stage.
+"""
+import time
+import json
+import csv
+from array import array
+
+from settings import ProfilerSettings
+from tools import Tools
+
+
+class RingBuffer:
+    """ Fixed-size buffer of floats. When full, the oldest value is overwritten. """
+    def __init__(self, size: int):
+        self.size = size
+        self._data = array('d', [0.0] * size)
+        self._index = 0
+        self.count = 0
+
+    def append(self, value: float):
+        self._data[self._index] = value
+        self._index = (self._index + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+    def values(self) -> list:
+        """ Returns the stored values, from the oldest to the newest. """
+        if self.count < self.size:
+            return self._data[:self.count].tolist()
+        return (self._data[self._index:] + self._data[:self._index]).tolist()
+
+    def last(self):
+        if self.count == 0:
+            return None
+        return self._data[self._index - 1]
+
+    def __len__(self):
+        return self.count
+
+
+class FrameProfiler:
+
+    def __init__(self, enabled=ProfilerSettings.ENABLED, history=ProfilerSettings.HISTORY):
+        self.enabled = enabled
+        self.history = history
+
+        # format: {"stage-name": RingBuffer, ...}. Stages are added on their first record.
+        self.stages = {}
+
+        self._last_lap = time.perf_counter()
+        self._frame_start = self._last_lap
+
+    def start_frame(self):
+        """ Called at the beginning of Engine.update() / Engine.draw(). The first lap is measured from here. """
+        if self.enabled:
+            self._last_lap = time.perf_counter()
+            self._frame_start = self._last_lap
+
+    def end_frame(self, stage_name: str):
+        """ Records the total time since start_frame() under 'stage_name'. """
+        if self.enabled:
+            self.record(stage_name, time.perf_counter() - self._frame_start)
+
+    def lap(self, stage_name: str):
+        """ Records the time passed since the previous lap (or start_frame) under 'stage_name'. """
+        if self.enabled:
+            time_now = time.perf_counter()
+            self.record(stage_name, time_now - self._last_lap)
+            self._last_lap = time_now
+
+    def record(self, stage_name: str, duration: float):
+        """ Records a duration (in seconds) measured outside the lap chain, e.g. nested stages like Physics.apply. """
+        if self.enabled:
+            buffer = self.stages.get(stage_name)
+            if buffer is None:
+                buffer = RingBuffer(self.history)
+                self.stages[stage_name] = buffer
+            buffer.append(duration)
+
+    def reset(self):
+        self.stages = {}
+
+    def stage_stats(self, stage_name: str) -> dict:
+        """ Returns the p50, p95, p99 and max duration of a stage, in milliseconds. """
+        sorted_values = sorted(self.stages[stage_name].values())
+        return {
+            "stage": stage_name,
+            "frames": len(sorted_values),
+            "p50-ms": Tools.percentile(sorted_values, 50) * 1000,
+            "p95-ms": Tools.percentile(sorted_values, 95) * 1000,
+            "p99-ms": Tools.percentile(sorted_values, 99) * 1000,
+            "max-ms": sorted_values[-1] * 1000 if sorted_values else 0,
+        }
+
+    def stats(self) -> list:
+        """ Returns the stats of all stages, sorted by p95 (the slowest first). """
+        all_stats = [self.stage_stats(stage_name) for stage_name in self.stages]
+        return sorted(all_stats, key=lambda x: x["p95-ms"], reverse=True)
+
+    def info_line(self, stages_count=ProfilerSettings.INFO_STAGES) -> str:
+        """ One line summary for the InfoService: the slowest stages by p95. """
+        parts = [f"{s['stage']} {s['p95-ms']:.2f}" for s in self.stats()[:stages_count]]
+        return f"p95 ms | " + " | ".join(parts)
+
+    def dump(self, filename: str):
+        """ Saves the stats of all stages in a .json or .csv file (chosen by the file extension). """
+        all_stats = self.stats()
+        try:
+            if filename.endswith(".csv"):
+                with open(filename, 'w', newline='') as file:
+                    writer = csv.DictWriter(file, fieldnames=["stage", "frames", "p50-ms", "p95-ms", "p99-ms", "max-ms"])
+                    writer.writeheader()
+                    writer.writerows(all_stats)
+            else:
+                with open(filename, 'w') as file:
+                    json.dump(all_stats, file, indent=2)
+
+            return f"Profiler stats saved in '{filename}'."
+
+        except Exception as e:
+            return f"Saving profiler stats FAILED: {e}"
+
+    def format_table(self) -> str:
+        lines = [f"{'stage':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        for s in self.stats():
+            lines.append(f"{s['stage']:<22}{s['p50-ms']:>10.3f}{s['p95-ms']:>10.3f}{s['p99-ms']:>10.3f}{s['max-ms']:>10.3f}")
+        return "\n".join(lines)
+
+
+class StartupTimeline:
+    """ Duration of every startup stage (imports, subsystems...), in the order they happened.
+        Same 'lap' idea as the FrameProfiler: every lap() records the time since the previous lap.
+    """
+    def __init__(self, start: float = None):
+        # start: perf_counter() value the timeline starts from. Default: now.
+        self.start = start if start is not None else time.perf_counter()
+        self._last_lap = self.start
+
+        # format: [("stage-name", duration), ...]
+        self.stages = []
+
+    def lap(self, stage_name: str):
+        time_now = time.perf_counter()
+        self.stages.append((stage_name, time_now - self._last_lap))
+        self._last_lap = time_now
+
+    @property
+    def total(self):
+        """ Seconds from the start of the timeline to the last lap. """
+        return self._last_lap - self.start
+
+    def format_report(self, title: str) -> str:
+        lines = [f"{title:<28}{'ms':>10}{'%':>7}{'at ms':>10}"]
+        total = self.total
+        elapsed = 0
+        for stage_name, duration in self.stages:
+            elapsed += duration
+            share = 100 * duration / total if total > 0 else 0
+            lines.append(f"  {stage_name:<26}{duration * 1000:>10.1f}{share:>7.1f}{elapsed * 1000:>10.1f}")
+        lines.append(f"  {'total':<26}{total * 1000:>10.1f}")
+        return "\n".join(lines)
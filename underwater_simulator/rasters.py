@@ -0,0 +1,119 @@
+"""
+Environment rasters: the cell props of the whole map, one NumPy array per property.
+
+The props ("passable", "resistance", "temp", "risk") are in the Cell.props dicts of the image library, so they
+were read one cell at a time. Here they are derived from the map grid (one value per cell, indexed [row, col]):
+
+    passable:    uint8
+    resistance:  float32
+    temp:        float32
+    risk:        float32
+
+The rasters are built on map load, with one index of the library props tables by the gid array, and updated
+only on the written cells after an edit (see Map.cells_changed).
+
+Region statistics are slice reductions:
+    rasters.mean("temp", rect)            # mean temperature under a footprint (rect in map pixels)
+    rasters.max("risk", rect)             # max risk in a window
+    rasters.region("temp", rect)          # the raster slice itself, for any other reduction
+A rect can be given in map pixels (pg.Rect or (x, y, w, h)). Only its cells inside the map are used.
+
+A paged map (see paging.py) has no whole rasters: its regions are looked up from the gid of their cells, on
+every call (one index of the props tables, on the region only).
+
+Optionally, a raster is downsampled into blocks of cells (see block_raster), for coarse maps of the environment.
+"""
+import numpy as np
+import pygame as pg
+
+
+class EnvironmentRasters:
+    PROPERTIES = {
+        "passable": np.uint8,
+        "resistance": np.float32,
+        "temp": np.float32,
+        "risk": np.float32,
+    }
+
+    def __init__(self, game_map):
+        self.map = game_map
+        self.cell_size = game_map.cell_size
+
+        # The props of every library cell, by property name. Indexed by the gid (see ImgLibrary.index_cells)
+        cell_props = game_map.engine.image_library.cell_props
+        self.prop_tables = {name: np.array([props.get(name, 0) for props in cell_props], dtype=dtype)
+                            for name, dtype in self.PROPERTIES.items()}
+
+        self.rasters = {}  # {property name: array (cells_y, cells_x)}. Empty for a paged map.
+        self.rebuild()
+
+    def rebuild(self):
+        """ Builds all the rasters from the map grid. Called when a new map is loaded. """
+        if self.map.grid.paged:
+            self.rasters = {}
+            return
+        gid = self.map.grid.gid
+        self.rasters = {name: table[gid] for name, table in self.prop_tables.items()}
+
+    def update(self, col_start, row_start, col_end, row_end):
+        """ Updates the rasters on the cells in the range (end indexes included), after they were written. """
+        if not self.rasters:
+            return
+        grid = self.map.grid
+        col_start, row_start = max(0, col_start), max(0, row_start)
+        rows = slice(row_start, min(row_end, grid.cells_y - 1) + 1)
+        cols = slice(col_start, min(col_end, grid.cells_x - 1) + 1)
+        gid = grid.gid[rows, cols]
+        for name, table in self.prop_tables.items():
+            self.rasters[name][rows, cols] = table[gid]
+
+    # --- REGIONS ---
+
+    def cell_slices(self, rect) -> tuple:
+        """ The (rows, cols) slices of the cells under the rect (map pixels), clipped to the map. """
+        rect = pg.Rect(rect)
+        grid = self.map.grid
+        col_start = max(0, rect.left // self.cell_size)
+        row_start = max(0, rect.top // self.cell_size)
+        col_end = min(grid.cells_x, (rect.right - 1) // self.cell_size + 1)
+        row_end = min(grid.cells_y, (rect.bottom - 1) // self.cell_size + 1)
+        return slice(row_start, max(row_start, row_end)), slice(col_start, max(col_start, col_end))
+
+    def region(self, name, rect) -> np.ndarray:
+        """ The raster slice under the rect (map pixels). A view, not a copy (a copy on a paged map). """
+        rows, cols = self.cell_slices(rect)
+        if not self.rasters:
+            return self.prop_tables[name][self.map.grid.gid[rows, cols]]
+        return self.rasters[name][rows, cols]
+
+    def mean(self, name, rect, default=0.0) -> float:
+        region = self.region(name, rect)
+        return float(region.mean()) if region.size else default
+
+    def max(self, name, rect, default=0.0) -> float:
+        region = self.region(name, rect)
+        return float(region.max()) if region.size else default
+
+    def min(self, name, rect, default=0.0) -> float:
+        region = self.region(name, rect)
+        return float(region.min()) if region.size else default
+
+    def stats(self, rect) -> dict:
+        """ Mean and max of every property under the rect (map pixels). """
+        rows, cols = self.cell_slices(rect)
+        gid = self.map.grid.gid[rows, cols] if not self.rasters else None
+        result = {}
+        for name, table in self.prop_tables.items():
+            region = self.rasters[name][rows, cols] if gid is None else table[gid]
+            result[name] = (float(region.mean()), float(region.max())) if region.size else (0.0, 0.0)
+        return result
+
+    def block_raster(self, name, block_cells, reduction=np.mean) -> np.ndarray:
+        """ The raster, downsampled into blocks of block_cells x block_cells cells (the reduction of every block).
+            Note: The cells of the last, incomplete blocks on the right and bottom edge are not included.
+            Note: On a paged map the raster is read from the whole map file.
+        """
+        raster = self.rasters[name] if self.rasters else self.prop_tables[name][np.asarray(self.map.grid.gid)]
+        rows, cols = raster.shape[0] // block_cells, raster.shape[1] // block_cells
+        blocks = raster[:rows * block_cells, :cols * block_cells].reshape(rows, block_cells, cols, block_cells)
+        return reduction(blocks, axis=(1, 3))
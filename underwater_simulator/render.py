@@ -0,0 +1,364 @@
+"""
+Dirty-rectangle rendering (RenderSettings.MODE = "dirty", toggled in-game with the 'd' key).
+
+The full mode redraws every layer and flips the whole display every frame, even when nothing moves.
+The dirty mode collects the damaged regions of the frame first:
+    - the whole screen on a scroll change (the world moves under everything), or while an editor,
+      the pointer or the HandWatch is shown (they follow the mouse / the camera),
+    - the sub sprite, when the sub moved or changed its image,
+    - the cells of the impact overlay and the collision points, which appeared or disappeared,
+    - the animated life units, when their frame changed,
+    - the columns of the flowing water surface, which show another image column after the flow,
+    - every gauge, when the values it shows changed, the info lines and the terminal, when their texts changed,
+    - the minimap, when the sub or the view moved on it, or it was drawn again.
+Then the layers are drawn clipped to every damaged rect (the overlapping ones are merged first), and only
+those rects are sent to the screen with pg.display.update(rects). A frame without damage is not drawn at all.
+
+Note: In the dirty mode the view scroll is drawn on whole pixels (see Engine.draw_scroll), so an
+unchanged scroll draws the world on exactly the same pixels.
+"""
+import numpy as np
+import pygame as pg
+
+from settings import RenderSettings, MapSettings
+from dbase import Cell
+
+
+class DirtyRenderer:
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.screen_rect = engine.display.get_rect()
+
+        # Transparent surface, used to measure what an overlay draws (see measure()).
+        self.scratch = pg.Surface(self.screen_rect.size, pg.SRCALPHA)
+        self.scratch_used = self.screen_rect.copy()
+
+        self.full_redraw = True
+
+        # State drawn on the previous frame:
+        self.last_scroll = None
+        self.last_sprite = None  # (signature, rect)
+        self.last_impact_cells = set()  # {(col, row, gid)}: the cells of the impact overlay
+        self.last_points = set()  # {(x, y, radius)}: the collision points
+        self.life_frames = {}  # {unit-id: frame-id}
+        self.water_origin = {}  # {water-id: screen x of the first water image}
+        self.water_columns = {}  # {water-id: (column ids, first rows, last rows)}, see column_ids()
+        self.overlays = {}  # {name: (signature, region)}
+
+        # Statistics for the info line: frames, updated pixels since the last info_line()
+        self.frames = 0
+        self.idle_frames = 0
+        self.updated_area = 0
+
+    def invalidate(self):
+        """ The next frame is redrawn and flipped whole. """
+        self.full_redraw = True
+
+    # --- DAMAGE ---
+
+    def measure(self, draw_function) -> pg.Rect:
+        """ Bounding rect of everything draw_function draws on the engine display.
+            It draws on a transparent scratch surface instead, so the display is not touched.
+        """
+        self.scratch.fill((0, 0, 0, 0), self.scratch_used)
+
+        display = self.engine.display
+        self.engine.display = self.scratch
+        try:
+            draw_function()
+        finally:
+            self.engine.display = display
+
+        self.scratch_used = self.scratch.get_bounding_rect()
+        return self.scratch_used.copy()
+
+    def overlay_damage(self, name, draw_function, signature=None):
+        """ The previous and the new region of an overlay, when it changed. Else None.
+            signature: the values shown by the overlay (it looks the same while they are the same).
+            When None, the overlay is drawn on the scratch surface every frame, and its pixels are compared.
+        """
+        last = self.overlays.get(name)
+        if signature is not None and last is not None and last[0] == signature:
+            return None
+
+        region = self.measure(draw_function)
+        if signature is None:
+            signature = (tuple(region), pg.image.tobytes(self.scratch.subsurface(region), "RGBA"))
+            if last is not None and last[0] == signature:
+                return None
+
+        self.overlays[name] = (signature, region)
+        if last is None:
+            return region
+        return region.union(last[1])
+
+    def sub_damage(self, alpha) -> list:
+        engine = self.engine
+        sub = engine.sub
+        rects = []
+
+        # Note: The image itself is compared, not its id(): a new rotated frame could get the id of the freed one.
+        sprite_rect = sub.image.get_rect()
+        sprite_rect.center = sub.draw_position(alpha)
+        signature = (tuple(sprite_rect), sub.image)
+        last = self.last_sprite
+        self.last_sprite = (signature, sprite_rect)
+        if last is None or last[0] != signature:
+            rects.append(sprite_rect)
+            if last is not None:
+                rects.append(last[1])
+
+        # The impact overlay (see Physics.draw_impact) draws the masks of the non-passable cells of the physics range.
+        # Only the cells, which appeared or disappeared, are damaged.
+        # Note: Inflated by a pixel, so the neighbour cells are merged into one rect (see merge()).
+        cell_size = MapSettings.CELL_SIZE
+        cell_tables = engine.map.cell_tables
+        mask_kinds, cell_masks, cell_props = cell_tables["mask-kind"], cell_tables["mask"], cell_tables["props"]
+        gid = engine.map.grid.gid
+        cell_start, cell_end, row_start, row_end = sub.physics.impact_range()
+        impact_cells = set()
+        for row in range(row_start, row_end + 1):
+            for col in range(cell_start, cell_end + 1):
+                cell_gid = gid.item(row, col)
+                if (cell_masks[cell_gid] is not None and mask_kinds[cell_gid] != Cell.MASK_EMPTY
+                        and not cell_props[cell_gid]["passable"]):
+                    impact_cells.add((col, row, cell_gid))
+        for col, row, _ in impact_cells ^ self.last_impact_cells:
+            rects.append(pg.Rect(col * cell_size - engine.scroll_x - 1, row * cell_size - engine.scroll_y - 1,
+                                 cell_size + 2, cell_size + 2))
+        self.last_impact_cells = impact_cells
+
+        # The collision points are drawn as circles around the overlap points:
+        points = {(*cell_data["point"], 5 if cell_data["props"]["passable"] else 7)
+                  for cell_data in sub.physics.cell_overlap}
+        points.update((*life_data["point"], 5) for life_data in sub.physics.life_overlap.values())
+        for x, y, radius in points ^ self.last_points:
+            rects.append(pg.Rect(int(x - engine.scroll_x) - radius - 2, int(y - engine.scroll_y) - radius - 2,
+                                 2 * radius + 5, 2 * radius + 5))
+        self.last_points = points
+
+        return rects
+
+    def life_damage(self):
+        engine = self.engine
+        rects = []
+        for unit in engine.biolife.life_list:
+            if unit.animation is None or self.life_frames.get(unit.id) == unit.frame_id:
+                continue
+            self.life_frames[unit.id] = unit.frame_id
+            rect = pg.Rect(unit.left - engine.scroll_x, unit.top - engine.scroll_y, unit.width, unit.height)
+            if rect.colliderect(self.screen_rect):
+                rects.append(rect)
+        return rects
+
+    @staticmethod
+    def column_ids(image: pg.Surface) -> tuple:
+        """ (ids, first rows, last rows) of the columns of the water image. The same columns have the same id, so a
+            screen column is drawn again only when it shows a column with another id. A column differs from the most
+            common one only between its first and last row (first > last: it is the same).
+        """
+        pixels = pg.surfarray.array2d(image)  # [x, y]
+
+        # Note: The columns are grouped by a hash, then checked. Any hash collision makes every column unique.
+        weights = np.random.default_rng(0).integers(1, 2 ** 63, pixels.shape[1], dtype=np.uint64)
+        hashes = (pixels.astype(np.uint64) * weights).sum(axis=1)
+        _, first, ids = np.unique(hashes, return_index=True, return_inverse=True)
+        ids = ids.ravel()
+        if not (pixels == pixels[first[ids]]).all():
+            ids = np.arange(len(pixels))
+
+        differs = pixels != pixels[np.bincount(ids).argmax() == ids][:1]
+        height = pixels.shape[1]
+        first_rows = np.where(differs.any(axis=1), differs.argmax(axis=1), height)
+        last_rows = np.where(differs.any(axis=1), height - 1 - differs[:, ::-1].argmax(axis=1), -1)
+        return ids, first_rows, last_rows
+
+    def water_damage(self):
+        engine = self.engine
+        rects = []
+        screen_columns = np.arange(self.screen_rect.width)
+        for water in (engine.seawater_shallow, engine.seawater_deep):
+            water_id = water.props["id"]
+            origin = water.scroll_x - engine.scroll_x
+            last_origin = self.water_origin.get(water_id)
+            self.water_origin[water_id] = origin
+            if water.image is None or last_origin is None or last_origin == origin:
+                continue
+            if water_id not in self.water_columns:
+                self.water_columns[water_id] = self.column_ids(water.image)
+            ids, first_rows, last_rows = self.water_columns[water_id]
+
+            # The image column drawn on every screen column (-1: none, see Water.draw)
+            shown = []
+            for screen_origin in (last_origin, origin):
+                source = screen_columns - int(screen_origin)
+                shown.append(np.where((source >= 0) & (source < water.num_images * len(ids)), source % len(ids), -1))
+            shown_ids = [np.where(columns >= 0, ids[columns], -1) for columns in shown]
+            changed = np.flatnonzero(shown_ids[0] != shown_ids[1])
+            if not len(changed):
+                continue
+
+            # The runs of changed columns, closer than WATER_DAMAGE_GAP px, are one rect, over the rows which differ
+            # in any of its old and new columns.
+            breaks = np.flatnonzero(np.diff(changed) > RenderSettings.WATER_DAMAGE_GAP)
+            top = water.rect.y - engine.scroll_y
+            for start, end in zip(np.concatenate(([0], breaks + 1)), np.concatenate((breaks, [len(changed) - 1]))):
+                left, right = int(changed[start]), int(changed[end])
+                columns = np.concatenate((shown[0][left:right + 1], shown[1][left:right + 1]))
+                columns = columns[columns >= 0]
+                if len(columns) < 2 * (right - left + 1):
+                    first_row, last_row = 0, water.rect.height - 1  # the image edge
+                else:
+                    first_row, last_row = int(first_rows[columns].min()), int(last_rows[columns].max())
+                rect = pg.Rect(left, top + first_row, right - left + 1, last_row - first_row + 1)
+                if rect.colliderect(self.screen_rect):
+                    rects.append(rect)
+        return rects
+
+    def needs_full_redraw(self):
+        engine = self.engine
+        scroll = (engine.scroll_x, engine.scroll_y)
+        scrolled = scroll != self.last_scroll
+        self.last_scroll = scroll
+
+        handwatch_active = engine.handwatch is not None and engine.handwatch.active
+        return (self.full_redraw or scrolled or handwatch_active or engine.pointer.active
+                or engine.mapeditor.active or engine.biolife_editor.active)
+
+    def collect(self, alpha):
+        """ Returns the damaged rects of the next frame, clipped to the screen.
+            Note: Called with the engine scroll already set for drawing.
+        """
+        engine = self.engine
+        full_redraw = self.needs_full_redraw()
+
+        # Every tracker runs on every frame, so its state is always the drawn one:
+        rects = self.sub_damage(alpha)
+        rects.extend(self.life_damage())
+        rects.extend(self.water_damage())
+        for name, draw_function, signature in engine.gauger.gauges():
+            rects.append(self.overlay_damage(f"gauge-{name}", self.keep_blink(draw_function), signature=signature))
+        rects.append(self.overlay_damage("info", engine.info_service.draw,
+                                         signature=tuple(item["text"] for item in engine.info_service.items)))
+        rects.append(self.overlay_damage("terminal", engine.terminal.draw, signature=tuple(engine.terminal.lines)))
+        rects.append(self.overlay_damage("minimap", engine.minimap.draw, signature=engine.minimap.signature()))
+
+        if full_redraw:
+            self.full_redraw = False
+            return [self.screen_rect.copy()]
+
+        rects = self.merge([rect for rect in rects if rect is not None and rect.width and rect.height])
+
+        # Note: pygame clips a thick line before it widens it, so a gauge cut by a damaged rect is drawn other than
+        # whole. The gauges, met by a damaged rect, are damaged whole, and cut out of the other rects.
+        gauge_regions = self.merge([region for name, (_, region) in self.overlays.items() if name.startswith("gauge-")],
+                                   grow=True)
+        for region in gauge_regions:
+            if region.width and region.height and region.collidelist(rects) != -1:
+                rects = [part for rect in rects for part in self.subtract(rect, region)] + [region]
+
+        return [rect.clip(self.screen_rect) for rect in rects]
+
+    def keep_blink(self, draw_function):
+        """ draw_function, which keeps the blink timers of the warning signs.
+            Note: The warning signs reset their blink timers when drawn. Measuring must not change the blinking.
+        """
+        gauger = self.engine.gauger
+
+        def draw():
+            last_warning_blink = list(gauger.last_warning_blink)
+            draw_function()
+            gauger.last_warning_blink = last_warning_blink
+        return draw
+
+    # --- FRAME ---
+
+    def render(self, alpha=1.0):
+        """ Draws the damaged part of the frame and updates it on the screen. Replaces draw() + flip(). """
+        engine = self.engine
+        self.frames += 1
+
+        sim_scroll = (engine.scroll_x, engine.scroll_y)
+        engine.scroll_x, engine.scroll_y = engine.draw_scroll(alpha)
+        rects = self.collect(alpha)
+        engine.scroll_x, engine.scroll_y = sim_scroll
+
+        if not rects:
+            self.idle_frames += 1
+            return
+
+        rects = self.merge(rects)
+        damaged_area = sum(rect.width * rect.height for rect in rects)
+        screen_area = self.screen_rect.width * self.screen_rect.height
+        if damaged_area > screen_area * RenderSettings.FULL_UPDATE_RATIO:
+            engine.draw(alpha)
+            pg.display.flip()
+            self.updated_area += screen_area
+            return
+
+        # One pass over the layers per rect, clipped to it. The blits outside are skipped by SDL,
+        # and the map draws only the cells inside (see Map.draw).
+        # Note: Every pass starts from the same warning sign timers, so a sign blinks the same in all of them.
+        gauger = self.engine.gauger
+        last_warning_blink = list(gauger.last_warning_blink)
+        try:
+            for rect in rects:
+                gauger.last_warning_blink = list(last_warning_blink)
+                engine.display.set_clip(rect)
+                engine.draw(alpha)
+        finally:
+            engine.display.set_clip(None)
+
+        pg.display.update(rects)
+        self.updated_area += damaged_area
+
+    @staticmethod
+    def subtract(rect: pg.Rect, hole: pg.Rect) -> list:
+        """ The parts of the rect outside the hole: up to 4 rects, above, below, left and right of it. """
+        clip = rect.clip(hole)
+        if not clip.width or not clip.height:
+            return [rect]
+        parts = [
+            pg.Rect(rect.left, rect.top, rect.width, clip.top - rect.top),
+            pg.Rect(rect.left, clip.bottom, rect.width, rect.bottom - clip.bottom),
+            pg.Rect(rect.left, clip.top, clip.left - rect.left, clip.height),
+            pg.Rect(clip.right, clip.top, rect.right - clip.right, clip.height),
+        ]
+        return [part for part in parts if part.width > 0 and part.height > 0]
+
+    @staticmethod
+    def merge(rects: list, grow=False) -> list:
+        """ Merges the overlapping rects, until none overlap, when their union is not larger than both together.
+            Note: The other overlapping rects are kept, their common part is drawn twice (every pass draws the whole
+            frame inside its rect). Their union would draw e.g. the screen wide water surface, with the sub sprite
+            under it, as a screen wide band, as tall as the sprite.
+            grow: every overlapping rects are merged, however large their union is.
+        """
+        merged = []
+        for rect in rects:
+            rect = rect.copy()
+            index = 0
+            while index != -1:
+                index = -1
+                for other_index in rect.collidelistall(merged):
+                    other = merged[other_index]
+                    union = rect.union(other)
+                    if grow or union.width * union.height <= rect.width * rect.height + other.width * other.height:
+                        index = other_index
+                        break
+                if index != -1:
+                    rect = rect.union(merged.pop(index))
+            merged.append(rect)
+        return merged
+
+    def info_line(self) -> str:
+        """ Average updated part of the screen since the last call. """
+        screen_area = self.screen_rect.width * self.screen_rect.height
+        updated = 100 * self.updated_area / (screen_area * self.frames) if self.frames else 0
+        line = f"Render: dirty | updated {updated:.1f} % of the screen | idle frames: {self.idle_frames}/{self.frames}"
+
+        self.frames = 0
+        self.idle_frames = 0
+        self.updated_area = 0
+        return line
@@ -0,0 +1,198 @@
+"""
+Deterministic input recording and max-speed replay.
+
+Recording: every decoded joystick event, every key-up handled by Engine.handle_key_up() and every change
+of the system temperature (it affects the sub's health) is written to a compact binary log,
+keyed by the simulation tick it was applied on. The header keeps the RNG seed of the session,
+and the footer keeps the final Sub20.state_hash().
+
+Replay: the log is fed back into a headless Engine, at maximum speed, and the final state hash is
+compared with the recorded one. Used to reproduce sessions, and to benchmark the physics path
+against identical workloads before/after changes.
+
+Note: the editors' mouse actions are not recorded. A session where the map or the biolife was edited
+replays against the saved files, so it will not reproduce.
+
+Usage (from the 'underwater_simulator' folder):
+    python main.py --record save/session.rec
+    python replay.py save/session.rec
+"""
+import argparse
+import struct
+import time
+
+import pygame as pg
+
+from settings import JoystickSettings as js, ReplaySettings
+from tools import Tools
+
+
+class InputLog:
+    MAGIC = b"SUBREC"
+    VERSION = 1
+
+    # header: magic, version, rng-seed, joystick-connected flag
+    HEADER = struct.Struct("<6sBIB")
+    # record: tick, kind, a, b, value
+    # Note: value is a double. A float32 axis value is not the same value, and the replay drifts.
+    RECORD = struct.Struct("<IBiid")
+    HASH_SIZE = 32  # sha256 digest, after the END record
+
+    # Record kinds:
+    JOY_AXIS = 1  # a=axis, value
+    JOY_BUTTON_DOWN = 2  # a=button
+    JOY_BUTTON_UP = 3  # a=button
+    JOY_HAT = 4  # a=x, b=y
+    KEY_UP = 5  # a=key
+    SYSTEM_TEMP = 6  # value
+    END = 7  # followed by the final state hash
+
+
+class InputRecorder:
+    """ Writes the session inputs to a binary log (see InputLog). """
+
+    def __init__(self, filename: str, seed: int, joystick_connected: bool):
+        self.filename = filename
+        self.file = open(filename, 'wb')
+        self.file.write(InputLog.HEADER.pack(InputLog.MAGIC, InputLog.VERSION, seed, int(joystick_connected)))
+
+        self.records_count = 0
+        self.last_system_temp = None
+
+    def _write(self, tick, kind, a=0, b=0, value=0.0):
+        self.file.write(InputLog.RECORD.pack(tick, kind, a, b, value))
+        self.records_count += 1
+
+    def record_joystick(self, tick: int, event):
+        """ Records a joystick event, already decoded by JoyStick.event_decode(). """
+        if event.type == js.AXIS_CHANGE_EVENT:
+            self._write(tick, InputLog.JOY_AXIS, a=event.axis, value=event.value)
+        elif event.type == js.BTN_DOWN_EVENT:
+            self._write(tick, InputLog.JOY_BUTTON_DOWN, a=event.button)
+        elif event.type == js.BTN_UP_EVENT:
+            self._write(tick, InputLog.JOY_BUTTON_UP, a=event.button)
+        elif event.type == js.MAP_SCROLL_SWITCH:
+            self._write(tick, InputLog.JOY_HAT, a=event.value[0], b=event.value[1])
+
+    def record_key_up(self, tick: int, key: int):
+        self._write(tick, InputLog.KEY_UP, a=key)
+
+    def record_system_temp(self, tick: int, system_temp: float):
+        # Only the changes are written. The thread updating the temperature is much slower than the ticks.
+        if system_temp != self.last_system_temp:
+            self._write(tick, InputLog.SYSTEM_TEMP, value=system_temp)
+            self.last_system_temp = system_temp
+
+    def close(self, tick: int, state_hash: bytes):
+        self._write(tick, InputLog.END)
+        self.file.write(state_hash)
+        self.file.close()
+        return f"Session recorded in '{self.filename}': {self.records_count} records, {tick} ticks."
+
+
+class Replayer:
+    """ Feeds a recorded input log into a headless Engine and verifies the final state. """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+
+        with open(filename, 'rb') as file:
+            data = file.read()
+
+        magic, version, self.seed, joystick_connected = InputLog.HEADER.unpack_from(data, 0)
+        if magic != InputLog.MAGIC or version != InputLog.VERSION:
+            raise ValueError(f"'{filename}' is not a valid input log (version {InputLog.VERSION}).")
+        self.joystick_connected = bool(joystick_connected)
+
+        # format: {tick: [(kind, a, b, value), ...]}
+        self.records = {}
+        self.end_tick = None
+        self.expected_hash = None
+
+        offset = InputLog.HEADER.size
+        while offset + InputLog.RECORD.size <= len(data):
+            tick, kind, a, b, value = InputLog.RECORD.unpack_from(data, offset)
+            offset += InputLog.RECORD.size
+
+            if kind == InputLog.END:
+                self.end_tick = tick
+                self.expected_hash = data[offset:offset + InputLog.HASH_SIZE]
+                break
+
+            self.records.setdefault(tick, []).append((kind, a, b, value))
+
+        if self.end_tick is None:
+            raise ValueError(f"Input log '{filename}' has no END record. The recording was not closed properly.")
+
+        self.engine = None
+        self.tick_times = []
+        self.total_time = 0
+
+    def apply_records(self, tick: int):
+        engine = self.engine
+        for kind, a, b, value in self.records.get(tick, ()):
+            if kind == InputLog.JOY_AXIS:
+                engine.joystick.event_decode(pg.event.Event(js.AXIS_CHANGE_EVENT, axis=a, value=value))
+            elif kind == InputLog.JOY_BUTTON_DOWN:
+                engine.joystick.event_decode(pg.event.Event(js.BTN_DOWN_EVENT, button=a))
+            elif kind == InputLog.JOY_BUTTON_UP:
+                engine.joystick.event_decode(pg.event.Event(js.BTN_UP_EVENT, button=a))
+            elif kind == InputLog.JOY_HAT:
+                engine.joystick.event_decode(pg.event.Event(js.MAP_SCROLL_SWITCH, value=(a, b)))
+            elif kind == InputLog.KEY_UP:
+                if a not in ReplaySettings.SKIPPED_KEYS:
+                    engine.handle_key_up(a)
+            elif kind == InputLog.SYSTEM_TEMP:
+                engine.telemetry.record({"cpu-temp": value})
+
+    def run(self):
+        """ Replays the whole log, at maximum speed. Returns a report dict. """
+        from main import Engine  # Note: imported here, so reading a log does not need the whole engine.
+
+        self.engine = Engine(headless=True, seed=self.seed)
+        # The recorded joystick events are decoded by the engine's JoyStick, even if there is no joystick here.
+        self.engine.joystick.success = self.joystick_connected
+
+        clock = time.perf_counter
+        tick_times = [0.0] * self.end_tick
+        start_time = clock()
+        for tick in range(self.end_tick):
+            tick_start = clock()
+            self.apply_records(tick)
+            self.engine.update()
+            tick_times[tick] = clock() - tick_start
+
+        self.total_time = clock() - start_time
+        self.tick_times = tick_times
+
+        final_hash = self.engine.sub.state_hash()
+        sorted_times = sorted(tick_times)
+
+        return {
+            "ticks": self.end_tick,
+            "ticks-per-sec": self.end_tick / self.total_time if self.total_time > 0 else 0,
+            "p50-ms": Tools.percentile(sorted_times, 50) * 1000,
+            "p99-ms": Tools.percentile(sorted_times, 99) * 1000,
+            "match": final_hash == self.expected_hash,
+            "expected-hash": self.expected_hash.hex(),
+            "final-hash": final_hash.hex(),
+        }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay a recorded session headless and verify its final state.")
+    parser.add_argument("filename", help="input log recorded with 'main.py --record'")
+    args = parser.parse_args()
+
+    replayer = Replayer(args.filename)
+    report = replayer.run()
+
+    print(f"{report['ticks']} ticks replayed | {report['ticks-per-sec']:.1f} ticks/sec | "
+          f"p50: {report['p50-ms']:.3f} ms | p99: {report['p99-ms']:.3f} ms")
+    if report["match"]:
+        print(f"Final state MATCH: {report['final-hash']}")
+    else:
+        print(f"Final state MISMATCH: expected {report['expected-hash']}, got {report['final-hash']}")
+
+    replayer.engine.is_running = False
+    replayer.engine.quit()
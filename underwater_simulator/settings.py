@@ -38,7 +38,123 @@ class ScreenSettings:
     MONITOR_DEFAULT = (1920, 1080)
     SCALE_FACTOR = 1.5  # The monitor resolution is scaled-down to 1.5
     SCROLL_SPEED = 10  # Scroll at speed 10 px/frame
-    FPS = 60
+    FPS = 60  # Render rate. May be lowered (thermal load) without changing the simulated behaviour.
+
+    SIM_RATE = 60  # Simulation ticks per second. Every per-frame value in the simulation is per tick.
+    MAX_TICKS_PER_FRAME = 5  # When rendering falls behind, the simulation is slowed instead of spiralling.
+
+
+# --- RENDERING ---
+class RenderSettings:
+    # "full": the whole display is redrawn and flipped every frame.
+    # "dirty": only the damaged regions are redrawn and updated (see render.py). Toggled in-game with the 'd' key.
+    MODE = "full"
+    FULL_UPDATE_RATIO = 0.5  # Dirty mode: a frame damaged over this part of the screen is redrawn and flipped whole.
+    WATER_DAMAGE_GAP = 64  # px. Dirty mode: the changed water columns closer than this are updated as one rect.
+
+    INFO_ITEM = 2  # InfoService line used to show the updated screen area (dirty mode only).
+    INFO_INTERVAL = 1000  # ms between the InfoService line updates.
+
+
+# --- MINIMAP ---
+class MinimapSettings:
+    # Toggled in-game with the 'n' key: off -> minimap -> overview (see minimap.py)
+    SIZE = 220  # px. The minimap (top-right corner) shows the largest map level, that fits in this box.
+    MARGIN = 10  # px from the screen edges.
+    OVERVIEW_MARGIN = 40  # px. The overview shows the largest level, that fits in the screen without this margin.
+
+    BASE_PIXELS = 1_000_000  # The finest level has up to this many pixels (a pixel per cell on the default map).
+    MIN_LEVEL_SIZE = 64  # px. The levels are halved down to this size.
+    BUILD_CELLS = 1_000_000  # The finest level is calculated in stripes of this many cells.
+
+    BORDER_COLOR = ColorPalette.WHITE
+    VIEW_COLOR = ColorPalette.YELLOW
+    LIFE_COLOR = ColorPalette.GREEN
+    SUB_COLOR = ColorPalette.RED
+    SUB_RADIUS = 3
+
+
+# --- CONFIGURATION SPACE ---
+class CSpaceSettings:
+    # The poses of the sub, colliding with the non-passable cells, precalculated per heading (see cspace.py)
+    PIXELS = 8  # px. A bit of a layer per 8 x 8 px of the sub center. Must divide MapSettings.CELL_SIZE.
+    HEADING_STEP = 5  # degrees. A layer per 5 degrees (72 layers, ~15 MB for 300 x 350 cells).
+    WORKERS = 0  # Threads dilating the layers. 0: one per core.
+    CACHE_DIR = "save/cspace"  # The layers of the built maps, by the hash of their obstacles and footprints.
+    CACHE_FILES = 3  # The last used files kept in CACHE_DIR (~15 MB each). The older ones are deleted.
+
+
+# --- PROFILER ---
+class ProfilerSettings:
+    ENABLED = False  # Toggled in-game with the 'f' key.
+    HISTORY = 600  # Number of frames kept per stage (10 sec at 60 fps).
+
+    INFO_ITEM = 3  # InfoService line used to show the slowest stages.
+    INFO_STAGES = 4  # Number of stages shown on that line.
+    INFO_INTERVAL = 500  # ms between the InfoService line updates.
+
+    DUMP_FILE = "save/profiler-stats.json"  # Written on exit when enabled. Use .csv extension for CSV.
+
+
+# --- TELEMETRY ---
+class TelemetrySettings:
+    PROVIDER = "auto"  # "psutil", "proc" (/proc and /sys readers), "static" or "auto" (see telemetry.py)
+    SAMPLE_RATE = 1  # Samples per second.
+    HISTORY = 300  # Number of samples kept per metric (5 min at 1 sample/sec).
+
+    # Thermal sensors, in order of preference. RK3588 (Edge2) first. If none is found, the first sensor is used.
+    THERMAL_SENSORS = ["center_thermal", "soc_thermal", "cpu_thermal", "coretemp", "k10temp"]
+    DEFAULT_TEMP = 0  # °C used by the simulation while no temperature is measured.
+
+    # Values of the static provider, used headless (the benchmarks, the replay and the tests).
+    STATIC_VALUES = {"cpu-percent": 0.0, "cpu-temp": 45.0, "memory-percent": 0.0}
+
+    INFO_ITEM = 0  # InfoService line used to show the telemetry.
+    INFO_INTERVAL = 1000  # ms between the InfoService line updates.
+
+
+# --- BENCHMARK ---
+class BenchmarkSettings:
+    SEED = 1  # The benchmarks always run on the same random environment.
+
+    RESULTS_FILE = "save/benchmark-results.json"
+    BASELINE_FILE = "benchmarks/baseline-edge2.json"  # Tracked: the reference build results, for a fresh checkout.
+    REGRESSION_THRESHOLD = 10  # % of ms/op change reported as SLOWER / faster.
+
+    SCROLL_STEP = 16  # px between two Map.draw calls of the scroll sweep.
+    SWEEP_ROWS = 4  # Number of sweeps from left to right, from the top to the bottom of the map.
+    PHYSICS_CALLS = 10000
+    LIFE_UNITS = 2000
+
+
+# --- FARM ---
+class FarmSettings:
+    DEFAULT_SEED = 1
+    DEFAULT_TICKS = 3000  # 50 sec of simulation.
+    RANDOM_STEP_TICKS = 120  # Ticks between two control changes of the random scenarios.
+    RESULTS_FILE = "save/farm-results.json"
+
+
+# --- ASSET PACK ---
+class AssetSettings:
+    PACK_FILE = "save/assets.pack"  # Pre-baked image library (see assets.py)
+    AUTO_BAKE = True  # Re-bake the pack on start, when it is missing or any source image / json changed.
+    ATLAS_WIDTH = 1024  # px. The images and the masks are packed in rows of this width.
+
+
+# --- INPUT REPLAY ---
+class ReplaySettings:
+    # Keys recorded, but not applied on replay. 's' would save the replayed edits in the edit journal (see journal.py)
+    SKIPPED_KEYS = [pg.K_s]
+
+
+# --- EDIT JOURNAL ---
+class JournalSettings:
+    FILE = "save/edits.journal"  # The segments are 'save/edits.journal.<n>' (see journal.py)
+    # On save ('s'), the journal is compacted into the map and biolife files after this many saved edits,
+    # or when it has this many segments (one per compaction and per session with edits).
+    COMPACT_EDITS = 200
+    COMPACT_SEGMENTS = 8
 
 
 # --- MAP ---
@@ -53,6 +169,57 @@ class MapSettings:
     CELLS_X = 300
     CELLS_Y = 350
 
+    MAP_FILE = "save/map-data.map"  # Binary map, saved and loaded by the MapEditor (see mapfile.py)
+    # The tracked save, with BIOLIFE_FILE. Written by the journal compaction, imported on load when it changed
+    # (after a pull, see mapfile.binary_is_stale).
+    MAP_JSON_FILE = "save/map-data.json"
+    BIOLIFE_FILE = "save/biolife-data.json"  # Saved and loaded by the BiolifeEditor, with the map (see journal.py)
+
+    # The MapEditor picks the edge tiles of the placed single rock cells, and of the cells around them, by their
+    # neighbours (see autotile.py)
+    AUTOTILE = True  # Toggled in the MapEditor with the 'a' key.
+    AUTOTILE_PALETTE = "map-rock"
+
+    CHUNK_CELLS = 16  # The map is drawn in chunks of 16 x 16 cells (see chunks.py)
+    CHUNK_CACHE_SIZE = 40  # Baked chunks kept in memory (1 MB each). 1280 x 720 shows up to 12.
+
+    # Binary maps with more cells are paged from the file: only the regions around the view and the sub are
+    # kept in memory (see paging.py). The default map (105k cells) is loaded whole.
+    PAGED_MAP_CELLS = 1_000_000
+    PAGE_CELLS = 64  # A page is a region of 64 x 64 cells (28 KB)
+    PAGE_MEMORY_MB = 8  # Memory cap of the resident pages. Edited pages are kept over the cap, until the map is saved.
+    PAGE_LOOKAHEAD = 90  # ticks. The pages ahead of the sub, on its velocity vector, are loaded in the background.
+
+
+# --- BIOLIFE ---
+class BioLifeSettings:
+    INDEX_BUCKET_SIZE = 256  # px. The life units are indexed in buckets of 256 x 256 px (see lifeindex.py)
+
+
+# --- WORLD GENERATOR ---
+class WorldGenSettings:
+    CELLS_X = 3000
+    CELLS_Y = 3500
+    SEED = 1  # The same seed and size generate the same world.
+
+    MAP_FILE = "save/worldgen.map"  # Written by 'python worldgen.py' (see worldgen.py)
+    BIOLIFE_FILE = "save/worldgen-biolife.json"
+
+    OPEN_ROWS = 24  # Rows of free water on the top of the map (the water surface and the start of the sub).
+
+    # Caves: random rock, shaped by noise and smoothed by the cellular automaton.
+    ROCK_FILL = 0.47  # Part of the cells filled with rock, before the smoothing.
+    ROCK_DEPTH_FILL = 0.08  # More rock deeper: the fill grows by this much from the top to the bottom of the map.
+    NOISE_SCALES = (96, 32, 12)  # cells. Octaves of the value noise...
+    NOISE_WEIGHTS = (0.3, 0.15, 0.08)  # ...and their share of the rock fill.
+    CAVE_STEPS = 5  # Smoothing steps.
+
+    LAVA_VENTS = 60  # per 1M cells. Pools of lava water on the cave floors...
+    LAVA_VENT_RADIUS = 2  # ...up to 2 cells to each side of the vent.
+    LAVA_MIN_DEPTH = 0.25  # Part of the map height, with no vents.
+
+    BUSHES = 120  # per 1M cells. Placed on the cave floors, where they fit.
+
 
 class FileLocations:
     CELL_IMAGES = "img/map/"
@@ -140,6 +307,12 @@ class SubSettings:
     SPEED_RESOLUTION = 5
     ROTATION_RESOLUTION = 1
 
+    # The contour masks are rotated once per heading, quantised to this step. Their hulls skip the exact collision
+    # test of the ticks, where the sub touches nothing (see physics.RotatedMaskCache).
+    MASK_HEADING_STEP = 1  # degrees
+    MASK_CACHE_SIZE = 360  # Rotated masks and hulls kept in memory (up to 16 KB each). 360: all headings of 1 degree.
+    MASK_CACHE_PRELOAD = False  # Rotate all the headings on start, instead of on their first use.
+
     INIT_DEPTH = 150
 
     INIT_ENERGY = 0.4
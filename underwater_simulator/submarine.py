@@ -1,6 +1,9 @@
 import pygame as pg
 
 import math
+import time
+import struct
+import hashlib
 
 from settings import ColorPalette as clr
 
@@ -11,6 +14,7 @@ from settings import VisionSettings, SubSettings
 from physics import Physics, UnitHealth
 
 from tools import Tools
+from neural import Senses
 
 # from brain import Vision
 
@@ -73,6 +77,9 @@ class Sub20:
         self.init_position = (self.engine.width // 2, (self.engine.height // 2) + self.settings.INIT_DEPTH)
         self.pos_x, self.pos_y = self.init_position
 
+        # Position before the last simulation tick. Used to interpolate the drawn position between ticks.
+        self.prev_pos = self.init_position
+
         # --- ANIMATION ---
         self.scene = {
             "engine-off": {
@@ -120,12 +127,13 @@ class Sub20:
         # animation-speed:
         # Note: animation speed is changed regarding the movement speed of the sub...
         self.animation_speed = 100
-        self.last_frame_update = pg.time.get_ticks()
+        self.last_frame_update = self.engine.sim_time
 
         # --- controllers get_data interval ---
         self.control_check_interval = 100
-        self.last_control = pg.time.get_ticks()  # last time check for keyboard
-        self.last_joystick = pg.time.get_ticks()  # last time check for joystick event
+        # Note: all intervals are in simulation time (see Engine.sim_time), not in wall-clock time.
+        self.last_control = self.engine.sim_time  # last time check for keyboard
+        self.last_joystick = self.engine.sim_time  # last time check for joystick event
         # -----------------
 
         # --- SUB STATE ---
@@ -238,7 +246,7 @@ class Sub20:
 
 
     def get_joystick(self):
-        time_now = pg.time.get_ticks()
+        time_now = self.engine.sim_time
         if time_now - self.last_joystick > self.control_check_interval:
             self.engine_mode, self.spray_mode, self.thrust_force, self.spray_force, self.ballast_fill = self.engine.joystick.get_joystick_data()
 
@@ -311,17 +319,35 @@ class Sub20:
             next_pos_y -= self.physics.buoyancy_momentum
 
         # Apply the impact from the surrounding medium. This will affect sub's health and will return new positions.
+        profiler = self.engine.profiler
+        apply_start = time.perf_counter() if profiler.enabled else 0
         self.physics.apply(
             next_pos=(next_pos_x, next_pos_y),
             next_heading=next_heading
         )
+        if profiler.enabled:
+            profiler.record("physics.apply", time.perf_counter() - apply_start)
+
+    def state_hash(self):
+        """ sha256 digest of the simulated state (position, motion and health).
+            Used to verify that a replayed session ends exactly where the recorded one did (see 'replay.py').
+        """
+        state = struct.pack(
+            "<9d",
+            self.pos_x, self.pos_y, self.heading,
+            self.physics.velocity, self.physics.rotation_momentum, self.physics.buoyancy_momentum,
+            self.ballast_fill, self.health.integrity, self.health.total_energy
+        )
+        return hashlib.sha256(state).digest()
 
     def reset_position(self):
         self.pos_x, self.pos_y = self.init_position
+        self.prev_pos = self.init_position
         self.heading = 0
 
 
     def update(self):
+        self.prev_pos = (self.pos_x, self.pos_y)
 
         self.check_controllers()
 
@@ -333,7 +359,7 @@ class Sub20:
         self.move()
 
         # --- animation ---
-        time_now = pg.time.get_ticks()
+        time_now = self.engine.sim_time
         if time_now - self.last_frame_update > self.animation_speed:
             # --- get the right frame:
             self.image = self.scene[self.engine_mode][self.spray_mode].frames_list[self.frame_index].copy()
@@ -373,7 +399,18 @@ class Sub20:
 
         )
 
-    def draw(self):
+    def draw_position(self, alpha=1.0):
+        """ Screen position of the sub center, interpolated like in draw(). Used by the dirty renderer too. """
+        pos_x, pos_y = Tools.interpolate(self.prev_pos, (self.pos_x, self.pos_y), alpha)
+        return pos_x - self.engine.scroll_x, pos_y - self.engine.scroll_y
+
+    def draw(self, alpha=1.0):
+        """ alpha: fraction of the next simulation tick already elapsed (0 to 1).
+            The sub is drawn between its previous and its current position.
+            Note: Called while the engine scroll is already interpolated (see Engine.draw).
+        """
+        self.rect.center = self.draw_position(alpha)
+
         self.engine.display.blit(self.image, self.rect)
         self.physics.draw_impact()
 
@@ -0,0 +1,255 @@
+"""
+System telemetry: CPU load, CPU temperature and memory usage of the board running the simulator.
+
+A provider reads the raw values, and the Telemetry sampler calls it from a background thread,
+TelemetrySettings.SAMPLE_RATE times per second. Every metric keeps its last samples in a RingBuffer
+(see profiler.py), and is read through latest() / history(), from any thread.
+
+Providers:
+    - PsutilProvider: psutil, non-blocking cpu_percent (measured since the previous sample).
+    - ProcProvider: reads /proc/stat, /proc/meminfo and /sys/class/thermal directly. No dependencies.
+    - StaticProvider: fixed values. Deterministic - used headless, by the benchmarks and the tests.
+
+Metrics (missing on a board, they are just not recorded):
+    "cpu-percent", "cpu-temp" (°C), "memory-percent"
+"""
+import glob
+import os
+import threading
+import time
+
+from profiler import RingBuffer
+from settings import TelemetrySettings
+
+
+class TelemetryProvider:
+    name = "none"
+
+    def sample(self) -> dict:
+        """ Returns {metric-name: value} with the metrics available on this board. """
+        return {}
+
+
+class PsutilProvider(TelemetryProvider):
+    name = "psutil"
+
+    def __init__(self):
+        import psutil  # Note: imported here, so psutil is only needed when this provider is used.
+        self.psutil = psutil
+
+        # The first cpu_percent(interval=None) call returns 0. It only starts the measurement.
+        self.psutil.cpu_percent(interval=None)
+
+    def cpu_temp(self):
+        sensors_temperatures = getattr(self.psutil, "sensors_temperatures", None)  # Missing on some platforms
+        if sensors_temperatures is None:
+            return None
+
+        sensors = sensors_temperatures()
+        for sensor_name in TelemetrySettings.THERMAL_SENSORS:
+            if sensors.get(sensor_name):
+                return sensors[sensor_name][0].current
+
+        # No known sensor. Use the first one found, if any:
+        for entries in sensors.values():
+            if entries:
+                return entries[0].current
+        return None
+
+    def sample(self) -> dict:
+        result = {
+            "cpu-percent": self.psutil.cpu_percent(interval=None),
+            "memory-percent": self.psutil.virtual_memory().percent,
+        }
+        cpu_temp = self.cpu_temp()
+        if cpu_temp is not None:
+            result["cpu-temp"] = cpu_temp
+        return result
+
+
+class ProcProvider(TelemetryProvider):
+    name = "proc"
+
+    PROC_STAT = "/proc/stat"
+    PROC_MEMINFO = "/proc/meminfo"
+    THERMAL_ZONES = "/sys/class/thermal/thermal_zone*"
+
+    def __init__(self):
+        self.last_cpu_times = self.read_cpu_times()
+        self.thermal_file = self.find_thermal_file()
+
+    def read_cpu_times(self):
+        """ Returns (busy, total) jiffies of all CPUs, from the first line of /proc/stat. """
+        with open(self.PROC_STAT, 'r') as file:
+            values = [int(value) for value in file.readline().split()[1:]]
+        idle = values[3] + (values[4] if len(values) > 4 else 0)  # idle + iowait
+        total = sum(values[:8])  # Note: guest times are already part of user and nice.
+        return total - idle, total
+
+    def find_thermal_file(self):
+        """ The thermal zone of the first known sensor name (see TelemetrySettings.THERMAL_SENSORS). Else the first zone. """
+        zones = {}
+        for zone_dir in sorted(glob.glob(self.THERMAL_ZONES)):
+            try:
+                with open(os.path.join(zone_dir, "type"), 'r') as file:
+                    zones[file.read().strip()] = os.path.join(zone_dir, "temp")
+            except OSError:
+                continue
+
+        for sensor_name in TelemetrySettings.THERMAL_SENSORS:
+            if sensor_name in zones:
+                return zones[sensor_name]
+        return next(iter(zones.values()), None)
+
+    def cpu_percent(self):
+        busy, total = self.read_cpu_times()
+        last_busy, last_total = self.last_cpu_times
+        self.last_cpu_times = (busy, total)
+
+        if total == last_total:
+            return 0.0
+        return 100 * (busy - last_busy) / (total - last_total)
+
+    def memory_percent(self):
+        meminfo = {}
+        with open(self.PROC_MEMINFO, 'r') as file:
+            for line in file:
+                key, value = line.split(":", 1)
+                meminfo[key] = int(value.split()[0])
+
+        available = meminfo.get("MemAvailable", meminfo.get("MemFree", 0))
+        return 100 * (meminfo["MemTotal"] - available) / meminfo["MemTotal"]
+
+    def cpu_temp(self):
+        if self.thermal_file is None:
+            return None
+        try:
+            with open(self.thermal_file, 'r') as file:
+                return int(file.read()) / 1000  # millidegrees
+        except (OSError, ValueError):
+            return None
+
+    def sample(self) -> dict:
+        result = {
+            "cpu-percent": self.cpu_percent(),
+            "memory-percent": self.memory_percent(),
+        }
+        cpu_temp = self.cpu_temp()
+        if cpu_temp is not None:
+            result["cpu-temp"] = cpu_temp
+        return result
+
+
+class StaticProvider(TelemetryProvider):
+    name = "static"
+
+    def __init__(self, values: dict = None):
+        self.values = dict(values if values is not None else TelemetrySettings.STATIC_VALUES)
+
+    def sample(self) -> dict:
+        return dict(self.values)
+
+
+def create_provider(name: str = TelemetrySettings.PROVIDER) -> TelemetryProvider:
+    """ name: "psutil", "proc", "static" or "auto" (psutil if installed, else /proc, else static). """
+    if name == "psutil":
+        return PsutilProvider()
+    if name == "proc":
+        return ProcProvider()
+    if name == "static":
+        return StaticProvider()
+
+    if name == "auto":
+        try:
+            return PsutilProvider()
+        except ImportError:
+            ...
+        if os.path.exists(ProcProvider.PROC_STAT):
+            return ProcProvider()
+        return StaticProvider()
+
+    raise ValueError(f"Unknown telemetry provider: '{name}'")
+
+
+class Telemetry:
+
+    def __init__(self, provider: TelemetryProvider, rate=TelemetrySettings.SAMPLE_RATE, history=TelemetrySettings.HISTORY):
+        self.provider = provider
+        self.interval = 1 / rate  # in seconds
+        self.history_size = history
+
+        # format: {"metric-name": RingBuffer, ...}. Metrics are added on their first sample.
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+        self.is_running = False
+        self.thread = None
+
+    def start(self):
+        self.is_running = True
+        self.thread = threading.Thread(target=self._sampler_thread, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.is_running = False
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join()
+        self.thread = None
+
+    def _sampler_thread(self):
+        next_sample = time.perf_counter()
+        while self.is_running:
+            self.sample()
+
+            # Note: sleeping in short steps, so stop() does not wait for a whole (slow) sample interval.
+            next_sample += self.interval
+            while self.is_running and time.perf_counter() < next_sample:
+                time.sleep(min(0.1, max(0.0, next_sample - time.perf_counter())))
+
+        print("Telemetry sampler stopped successfully.")
+
+    def sample(self):
+        """ Reads the provider once and records the values. Called by the sampler thread, or directly when not started. """
+        try:
+            values = self.provider.sample()
+        except Exception as e:
+            print(f"Telemetry sample FAILED ({self.provider.name}): {e}")
+            return
+        self.record(values)
+
+    def record(self, values: dict):
+        """ Records already measured values. Used by the sampler, and by the input replay (see 'replay.py'). """
+        with self.lock:
+            for metric_name, value in values.items():
+                buffer = self.metrics.get(metric_name)
+                if buffer is None:
+                    buffer = RingBuffer(self.history_size)
+                    self.metrics[metric_name] = buffer
+                buffer.append(value)
+
+    def latest(self, metric_name: str, default=None):
+        with self.lock:
+            buffer = self.metrics.get(metric_name)
+            if buffer is None or buffer.count == 0:
+                return default
+            return buffer.last()
+
+    def history(self, metric_name: str) -> list:
+        """ Values from the oldest to the newest. """
+        with self.lock:
+            buffer = self.metrics.get(metric_name)
+            return buffer.values() if buffer is not None else []
+
+    def info_line(self, fps: float) -> str:
+        cpu_percent = self.latest("cpu-percent")
+        cpu_temp = self.latest("cpu-temp")
+        memory_percent = self.latest("memory-percent")
+
+        items = [f"[{fps:.1f} fps.]"]
+        if cpu_percent is not None:
+            items.append(f"CPU: {cpu_percent:.1f} %")
+        if cpu_temp is not None:
+            items.append(f"{cpu_temp:.2f} °C")
+        if memory_percent is not None:
+            items.append(f"MEMORY: {memory_percent:.1f} %")
+        return " | ".join(items)
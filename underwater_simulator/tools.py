@@ -70,6 +70,27 @@ class Tools:
         total_res = sum_effect if sum_effect < 1 else 1
         return total_res
 
+    @staticmethod
+    def interpolate(previous: tuple, current: tuple, alpha: float):
+        """ Linear interpolation between two (x, y) points. alpha=0 returns 'previous', alpha=1 returns 'current'.
+        """
+        return (previous[0] + (current[0] - previous[0]) * alpha,
+                previous[1] + (current[1] - previous[1]) * alpha)
+
+    @staticmethod
+    def percentile(sorted_values: list, perc: float):
+        """ Returns the 'perc' percentile (0 to 100) of an already sorted list,
+            using linear interpolation between the closest ranks.
+        """
+        if not sorted_values:
+            return 0
+
+        position = (len(sorted_values) - 1) * perc / 100
+        lower = int(position)
+        upper = min(lower + 1, len(sorted_values) - 1)
+        fraction = position - lower
+        return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * fraction
+
     @staticmethod
     def get_image_acrive_pixels_area(image):
         # Create a mask from the surface
@@ -0,0 +1,202 @@
+"""
+Procedural world generator, for the stress tests and the benchmarks at scale.
+
+The only map was painted by hand in the MapEditor (300 x 350 cells). Here whole worlds of any size are generated
+with NumPy, on whole arrays (no loop over the cells), and written in the map and biolife save formats:
+
+    1. Caves:  random rock, with more rock where the value noise is high and deeper in the map. Smoothed by
+               a cellular automaton: a cell is rock, when 5 or more cells of its 3 x 3 block are rock.
+    2. Tiles:  every rock cell gets the 'map-rock' tile of its water neighbours (see autotile.py).
+    3. Lava:   vents of 'lava-water' on the cave floors, below LAVA_MIN_DEPTH.
+    4. Bushes: life units on the cave floors, where their whole image is in the free water.
+
+The same seed and size give the same world. A world of 3000 x 3500 cells is generated in a few seconds.
+The large worlds are paged from the file, when loaded (see paging.py).
+
+Usage (from the 'underwater_simulator' folder):
+    python worldgen.py                                  # WorldGenSettings size and seed -> WorldGenSettings files
+    python worldgen.py --cells 600 700 --seed 7
+    python worldgen.py --map save/map-data.map --biolife save/biolife-data.json     # replaces the game world
+"""
+import argparse
+import json
+import os
+import time
+from math import ceil
+
+import numpy as np
+
+from settings import WorldGenSettings, MapSettings, FileLocations as files
+from grid import MapGrid
+from mapfile import save_grid
+from autotile import AutoTiler, read_units
+
+
+LAVA_TILE = "Lava-Water Single Full"
+BUSH_LIBRARY = "bush"
+
+
+def value_noise(rng, shape, scale) -> np.ndarray:
+    """ Smooth noise in [0, 1): random values on a coarse grid (every 'scale' cells), interpolated between. """
+    rows, cols = shape
+    coarse = rng.random((rows // scale + 2, cols // scale + 2), dtype=np.float32)
+
+    def axis(size):
+        position = np.arange(size, dtype=np.float32) / scale
+        index = position.astype(np.int32)
+        t = position - index
+        return index, t * t * (3 - 2 * t)  # smoothstep
+
+    row_index, row_t = axis(rows)
+    col_index, col_t = axis(cols)
+
+    # Note: Interpolated along the columns on the coarse rows first, so only the last step is on the whole grid.
+    lines = coarse[:, col_index] * (1 - col_t) + coarse[:, col_index + 1] * col_t
+    return lines[row_index] * (1 - row_t)[:, None] + lines[row_index + 1] * row_t[:, None]
+
+
+def block_sum(array: np.ndarray) -> np.ndarray:
+    """ Sum of the 3 x 3 block around every cell. Out of the map counts as 1 (the map border is rock). """
+    padded = np.pad(array, 1, constant_values=1)
+    lines = padded[:-2] + padded[1:-1] + padded[2:]
+    return lines[:, :-2] + lines[:, 1:-1] + lines[:, 2:]
+
+
+def box_sums(array: np.ndarray, height, width) -> np.ndarray:
+    """ Sum of the height x width box of every top-left cell, where the box fits in the array (summed-area table). """
+    table = np.zeros((array.shape[0] + 1, array.shape[1] + 1), dtype=np.int32)
+    np.cumsum(array, axis=0, dtype=np.int32, out=table[1:, 1:])
+    np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+    return table[height:, width:] - table[:-height, width:] - table[height:, :-width] + table[:-height, :-width]
+
+
+def generate_caves(rng, cells_x, cells_y) -> np.ndarray:
+    """ The rock cells (bool array). """
+    shape = (cells_y, cells_x)
+    fill = np.full(shape, WorldGenSettings.ROCK_FILL, dtype=np.float32)
+    fill += (np.arange(cells_y, dtype=np.float32) / cells_y - 0.5)[:, None] * WorldGenSettings.ROCK_DEPTH_FILL
+    for scale, weight in zip(WorldGenSettings.NOISE_SCALES, WorldGenSettings.NOISE_WEIGHTS):
+        fill += (value_noise(rng, shape, scale) - 0.5) * (2 * weight)
+
+    rock = (rng.random(shape, dtype=np.float32) < fill).view(np.uint8)
+    open_rows = WorldGenSettings.OPEN_ROWS
+    for _ in range(WorldGenSettings.CAVE_STEPS):
+        rock[:open_rows] = 0
+        rock = (block_sum(rock) >= 5).view(np.uint8)
+
+    rock[:open_rows] = 0
+    return rock.view(bool)
+
+
+def lava_vents(rng, rock: np.ndarray) -> np.ndarray:
+    """ The lava water cells (bool array): pools on the cave floors, around random vents. """
+    floor = ~rock
+    floor[:-1] &= rock[1:]
+    floor[-1] = False
+    floor[:int(rock.shape[0] * WorldGenSettings.LAVA_MIN_DEPTH)] = False
+
+    sites = np.flatnonzero(floor)
+    count = min(len(sites), round(WorldGenSettings.LAVA_VENTS * rock.size / 1_000_000))
+    vents = rng.choice(sites, size=count, replace=False)
+
+    radius = WorldGenSettings.LAVA_VENT_RADIUS
+    rows = (vents // rock.shape[1])[:, None]
+    cols = np.clip((vents % rock.shape[1])[:, None] + np.arange(-radius, radius + 1), 0, rock.shape[1] - 1)
+    rows = np.broadcast_to(rows, cols.shape)
+    pool = floor[rows, cols]
+
+    lava = np.zeros(rock.shape, dtype=bool)
+    lava[rows[pool], cols[pool]] = True
+    return lava
+
+
+def place_bushes(rng, rock: np.ndarray, lava: np.ndarray) -> tuple:
+    """ Life units on the cave floors. Returns (life unit addresses, the population {(col, row): [life ids]}). """
+    with open(os.path.join(files.BIO_IMAGES, f"{BUSH_LIBRARY}.json"), 'r') as file:
+        bushes = json.load(file)
+
+    cell_size = MapSettings.CELL_SIZE
+    free = (~rock & ~lava).view(np.uint8)
+    count = round(WorldGenSettings.BUSHES * rock.size / 1_000_000)
+    kinds = rng.integers(len(bushes), size=count)
+
+    # 1. Random places, where a bush fits: free water over its image, rock under it.
+    candidates = []
+    for ref_id, bush in enumerate(bushes):
+        width = ceil(bush["frame-width"] / cell_size)
+        height = ceil(bush["frame-height"] / cell_size)
+        fits = box_sums(free[:-1], height, width) == width * height
+        fits &= box_sums(rock[height:].view(np.uint8), 1, width) == width
+        fits[:WorldGenSettings.OPEN_ROWS] = False
+
+        places = np.flatnonzero(fits)
+        size = min(len(places), int(np.count_nonzero(kinds == ref_id)))
+        for place in rng.choice(places, size=size, replace=False).tolist():
+            candidates.append((place // fits.shape[1], place % fits.shape[1], ref_id, width, height))
+
+    # 2. The bushes over the others are left out:
+    occupied = np.zeros(rock.shape, dtype=bool)
+    life_addresses, population = [], {}
+    for index in rng.permutation(len(candidates)).tolist():
+        row, col, ref_id, width, height = candidates[index]
+        if occupied[row:row + height, col:col + width].any():
+            continue
+        occupied[row:row + height, col:col + width] = True
+
+        life_unit_id = len(life_addresses)
+        life_addresses.append({"ref-id": ref_id, "library": BUSH_LIBRARY, "left": col * cell_size,
+                               "top": row * cell_size})
+        # Note: The populated cells, as LifeUnit.map_coverage (see BioLife.add_life_unit)
+        for cell_row in range(row, row + bushes[ref_id]["frame-height"] // cell_size):
+            for cell_col in range(col, col + bushes[ref_id]["frame-width"] // cell_size):
+                population.setdefault((cell_col, cell_row), []).append(life_unit_id)
+
+    return life_addresses, population
+
+
+def generate_world(cells_x=WorldGenSettings.CELLS_X, cells_y=WorldGenSettings.CELLS_Y,
+                   seed=WorldGenSettings.SEED) -> tuple:
+    """ Returns (MapGrid, life unit addresses). The grid has no cell types (no gid), as the grids loaded by mapfile.py
+        with no image library. Save it with save_world, and load it in the game.
+    """
+    rng = np.random.default_rng(seed)
+
+    rock = generate_caves(rng, cells_x, cells_y)
+    lava = lava_vents(rng, rock)
+
+    grid = MapGrid(cells_x, cells_y)
+    grid.palette[rock] = grid.palette_index["map-rock"]
+    grid.palette[lava] = grid.palette_index["lava-water"]
+    grid.unit[:], grid.cell[:] = AutoTiler("map-rock").tile(rock)
+    grid.unit[lava] = read_units("lava-water")[LAVA_TILE]
+
+    life_addresses, grid.population = place_bushes(rng, rock, lava)
+    return grid, life_addresses
+
+
+def save_world(grid: MapGrid, life_addresses: list, map_file=WorldGenSettings.MAP_FILE,
+               biolife_file=WorldGenSettings.BIOLIFE_FILE):
+    save_grid(grid, map_file)
+    with open(biolife_file, 'w') as file:
+        json.dump(life_addresses, file)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a world: caves, lava vents and bushes.")
+    parser.add_argument("--cells", nargs=2, type=int, default=(WorldGenSettings.CELLS_X, WorldGenSettings.CELLS_Y),
+                        metavar=("X", "Y"), help="map size in cells")
+    parser.add_argument("--seed", type=int, default=WorldGenSettings.SEED, help="random seed of the world")
+    parser.add_argument("--map", default=WorldGenSettings.MAP_FILE, help="binary map file to write")
+    parser.add_argument("--biolife", default=WorldGenSettings.BIOLIFE_FILE, help="biolife file to write")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    world_grid, world_life = generate_world(*args.cells, seed=args.seed)
+    generated = time.perf_counter()
+    save_world(world_grid, world_life, args.map, args.biolife)
+
+    print(f"{world_grid.cells_x} x {world_grid.cells_y} cells (seed {args.seed}): "
+          f"{np.count_nonzero(world_grid.palette == world_grid.palette_index['map-rock'])} rock cells, "
+          f"{np.count_nonzero(world_grid.palette == world_grid.palette_index['lava-water'])} lava cells, "
+          f"{len(world_life)} bushes. Generated in {(generated - start) * 1000:.0f} ms, "
+          f"saved in '{args.map}' and '{args.biolife}' in {(time.perf_counter() - generated) * 1000:.0f} ms.")